@@ -12,6 +12,7 @@
 */
 
 
+#include <util/crc16.h>
 #include "DmxSimple.h" //pull from local version, which is differnt from standard library.
 
 #define DMX_PIN 3
@@ -19,19 +20,212 @@
 #define ACTIVITY_LED_PIN 13
 #define MAX_DMX_CH 150
 
-#define START_OF_FRAME 0x10 //whenever this character is rx'ed, it means to reset reading to channel 1. 
-                                //yes, this cuts back on the number of levels we can incode, but it's theater
-                                //30-ft rule applies. If anyone tells you "hey, that light is at 128, not 127",
-                                //they most likely are possessed. Seek the help of the Devine.
+//Which serial protocol to speak. Must match c_serial_protocol in python_lx.py.
+//1 = framed (COBS + crc16, all 256 levels, host can raise the baud rate)
+//0 = original 0x10 start-of-frame protocol
+//Firmware fades (c_firmware_fades in python_lx.py) only exist in the framed protocol.
+#define PROTOCOL_FRAMED 1
+
+#define INITIAL_BAUD 115200 //both ends start here
+
+#if PROTOCOL_FRAMED
+
+//See lx_serial_protocol.py for the full description. Every message is
+//  COBS( <type> <length lo> <length hi> <payload> <crc lo> <crc hi> ) 0x00
+//crc is avr-libc's _crc_ccitt_update over type, length and payload.
+#define PROTOCOL_VERSION 1
+#define FRAME_LEVELS 0x01   //payload: <start ch lo> <start ch hi> <level>...
+#define FRAME_SET_BAUD 0x02 //payload: <baud u32 LE>
+#define FRAME_PING 0x03     //payload: none
+#define FRAME_FADE 0x04     //payload: <delay ms u32> <up ms u32> <down ms u32> <start ch u16> <target>...
+#define FRAME_REPLY_FLAG 0x80
+
+#define FRAME_OVERHEAD 5 //type + length + crc
+#define FADE_HEADER 14
+#define MAX_PAYLOAD (MAX_DMX_CH + FADE_HEADER)
+#define RX_BUF_SIZE (MAX_PAYLOAD + FRAME_OVERHEAD + (MAX_PAYLOAD + FRAME_OVERHEAD)/254 + 2)
+
+static uint8_t rx_buf[RX_BUF_SIZE];
+static uint16_t rx_len = 0;
+static bool rx_overflow = false;
+
+//Fades run here instead of on the PC: the host sends the targets and times once
+//per GO, and update_fade() walks every channel from where it was to its target.
+//Channels going up use the up time, channels going down use the down time.
+//lx_firmware_fade.py has a python copy of this - keep the math identical.
+static uint8_t cur_level[MAX_DMX_CH];   //what was last handed to DmxSimple
+static uint8_t fade_start[MAX_DMX_CH];
+static uint8_t fade_target[MAX_DMX_CH];
+static uint32_t fade_begin_ms;
+static uint32_t fade_up_ms;
+static uint32_t fade_down_ms;
+static bool fade_active = false;
+
+static void set_level(uint16_t channel, uint8_t level) {
+  cur_level[channel - 1] = level;
+  DmxSimple.write(channel, level);
+}
+
+static uint32_t read_u32(const uint8_t *p) {
+  return (uint32_t)p[0] | ((uint32_t)p[1] << 8) | ((uint32_t)p[2] << 16) | ((uint32_t)p[3] << 24);
+}
+
+//fraction of the way through a fade of duration_ms, 0-256
+static uint16_t fade_fraction(uint32_t elapsed_ms, uint32_t duration_ms) {
+  if (elapsed_ms >= duration_ms) return 256;
+  return (uint16_t)((elapsed_ms * 256UL) / duration_ms);
+}
+
+static void update_fade() {
+  if (!fade_active) return;
+  uint32_t now = millis();
+  if ((int32_t)(now - fade_begin_ms) < 0) return; //still in the delay
+  uint32_t elapsed = now - fade_begin_ms;
+  uint16_t up_frac = fade_fraction(elapsed, fade_up_ms);
+  uint16_t down_frac = fade_fraction(elapsed, fade_down_ms);
+  for (uint16_t i = 0; i < MAX_DMX_CH; i++) {
+    int16_t start = fade_start[i];
+    int16_t diff = (int16_t)fade_target[i] - start;
+    uint16_t frac = (diff > 0) ? up_frac : down_frac;
+    uint8_t level = (uint8_t)(start + (int16_t)(((int32_t)diff * frac) >> 8));
+    if (level != cur_level[i]) set_level(i + 1, level);
+  }
+  if (up_frac == 256 && down_frac == 256) fade_active = false;
+}
+
+//undo the byte stuffing in place. Returns decoded length, 0 if the block structure is bad.
+static uint16_t cobs_decode_in_place(uint8_t *buf, uint16_t len) {
+  uint16_t r = 0;
+  uint16_t w = 0;
+  while (r < len) {
+    uint8_t code = buf[r++];
+    if (code == 0 || r + code - 1 > len) return 0;
+    for (uint8_t i = 1; i < code; i++) buf[w++] = buf[r++];
+    if (code != 0xFF && r < len) buf[w++] = 0;
+  }
+  return w;
+}
+
+static uint16_t frame_crc(const uint8_t *buf, uint16_t len) {
+  uint16_t crc = 0xFFFF;
+  for (uint16_t i = 0; i < len; i++) crc = _crc_ccitt_update(crc, buf[i]);
+  return crc;
+}
+
+//stuff and send one reply frame
+static void send_frame(uint8_t type, const uint8_t *payload, uint8_t len) {
+  uint8_t body[16];
+  uint8_t out[20];
+  uint8_t n = 0;
+  body[n++] = type;
+  body[n++] = len;
+  body[n++] = 0;
+  for (uint8_t i = 0; i < len; i++) body[n++] = payload[i];
+  uint16_t crc = frame_crc(body, n);
+  body[n++] = crc & 0xFF;
+  body[n++] = crc >> 8;
+
+  uint8_t code_pos = 0;
+  uint8_t w = 1;
+  uint8_t code = 1;
+  for (uint8_t i = 0; i < n; i++) {
+    if (body[i] == 0) {
+      out[code_pos] = code;
+      code_pos = w++;
+      code = 1;
+    } else {
+      out[w++] = body[i];
+      code++;
+    }
+  }
+  out[code_pos] = code;
+  out[w++] = 0;
+  Serial.write(out, w);
+}
+
+static void handle_frame(uint8_t *buf, uint16_t len) {
+  len = cobs_decode_in_place(buf, len);
+  if (len < FRAME_OVERHEAD) return;
+  uint8_t type = buf[0];
+  uint16_t payload_len = buf[1] | ((uint16_t)buf[2] << 8);
+  if (payload_len + FRAME_OVERHEAD != len) return;
+  uint16_t crc = buf[3 + payload_len] | ((uint16_t)buf[4 + payload_len] << 8);
+  if (crc != frame_crc(buf, 3 + payload_len)) return; //corrupted - drop it, next 0x00 resyncs us
+  uint8_t *payload = buf + 3;
+
+  if (type == FRAME_LEVELS && payload_len >= 2) {
+    uint16_t channel = payload[0] | ((uint16_t)payload[1] << 8);
+    for (uint16_t i = 2; i < payload_len && channel <= MAX_DMX_CH; i++, channel++) {
+      set_level(channel, payload[i]);
+      fade_start[channel - 1] = payload[i]; //a level set wins over any fade on that channel
+      fade_target[channel - 1] = payload[i];
+    }
+    digitalWrite(ACTIVITY_LED_PIN, !digitalRead(ACTIVITY_LED_PIN));
+  }
+  else if (type == FRAME_FADE && payload_len >= FADE_HEADER) {
+    uint16_t first_ch = payload[12] | ((uint16_t)payload[13] << 8);
+    for (uint16_t i = 0; i < MAX_DMX_CH; i++) {
+      fade_start[i] = cur_level[i];
+      uint16_t idx = FADE_HEADER + (i + 1 - first_ch);
+      if (i + 1 >= first_ch && idx < payload_len) fade_target[i] = payload[idx];
+      else fade_target[i] = cur_level[i]; //not in this fade, stay put
+    }
+    fade_begin_ms = millis() + read_u32(payload);
+    fade_up_ms = read_u32(payload + 4);
+    fade_down_ms = read_u32(payload + 8);
+    fade_active = true;
+  }
+  else if (type == FRAME_PING) {
+    uint8_t pong[3] = {PROTOCOL_VERSION, MAX_DMX_CH & 0xFF, MAX_DMX_CH >> 8};
+    send_frame(FRAME_PING | FRAME_REPLY_FLAG, pong, 3);
+  }
+  else if (type == FRAME_SET_BAUD && payload_len == 4) {
+    uint32_t baud = read_u32(payload);
+    send_frame(FRAME_SET_BAUD | FRAME_REPLY_FLAG, payload, 4); //ack at the old rate
+    Serial.flush(); //wait for the ack to actually leave
+    Serial.end();
+    Serial.begin(baud);
+  }
+}
+
+#endif
 
 
 void setup() {
-  Serial.begin(115200);
+  Serial.begin(INITIAL_BAUD);
+  pinMode(ACTIVITY_LED_PIN, OUTPUT);
   DmxSimple.usePins(DMX_PIN, FRAME_PIN); //start dmx output 
   DmxSimple.maxChannel(MAX_DMX_CH);
 }
 
 
+#if PROTOCOL_FRAMED
+
+void loop() {
+//note dmx transmits in the background at all times...
+  while (Serial.available()) {
+    uint8_t in_byte = Serial.read();
+    if (in_byte == 0) { //end of frame
+      if (!rx_overflow && rx_len > 0) handle_frame(rx_buf, rx_len);
+      rx_len = 0;
+      rx_overflow = false;
+    }
+    else if (rx_len < RX_BUF_SIZE) {
+      rx_buf[rx_len++] = in_byte;
+    }
+    else {
+      rx_overflow = true; //too long to be anything we understand, throw it away at the next 0x00
+    }
+  }
+  update_fade();
+}
+
+#else
+
+#define START_OF_FRAME 0x10 //whenever this character is rx'ed, it means to reset reading to channel 1. 
+                                //yes, this cuts back on the number of levels we can incode, but it's theater
+                                //30-ft rule applies. If anyone tells you "hey, that light is at 128, not 127",
+                                //they most likely are possessed. Seek the help of the Devine.
 
 void loop() {
   static uint8_t in_byte;
@@ -53,3 +247,5 @@ void loop() {
   }
   
 }
+
+#endif
@@ -0,0 +1,84 @@
+########################################################################
+########################################################################
+###
+### Python_LX - A simple, Python and Arduino based DMX512 lighting console
+### by Chris Gerth - Summer/Fall 2014
+###
+### File - lx_clock.py - time sources shared by the realtime loop and tools
+### Dependencies - none
+###
+########################################################################
+########################################################################
+
+import sys, time, threading
+
+#time.monotonic() only showed up in python 3.3. On 2.7 we have to find our
+#own clock that will never jump backwards when someone changes the system time
+#(or NTP decides to help us in the middle of a fade).
+
+def _make_linux_monotonic():
+    import ctypes, os
+    class _timespec(ctypes.Structure):
+        _fields_ = [("tv_sec", ctypes.c_long), ("tv_nsec", ctypes.c_long)]
+    librt = ctypes.CDLL("librt.so.1", use_errno=True)
+    clock_gettime = librt.clock_gettime
+    clock_gettime.argtypes = [ctypes.c_int, ctypes.POINTER(_timespec)]
+    CLOCK_MONOTONIC = 1
+    l_ts = _timespec()
+    l_ts_lock = threading.Lock()
+    def monotonic():
+        l_ts_lock.acquire()
+        try:
+            if(clock_gettime(CLOCK_MONOTONIC, ctypes.pointer(l_ts)) != 0):
+                errno = ctypes.get_errno()
+                raise OSError(errno, os.strerror(errno))
+            return l_ts.tv_sec + l_ts.tv_nsec * 1e-9
+        finally:
+            l_ts_lock.release()
+    monotonic() #make sure it actually works before handing it out
+    return monotonic
+
+def _make_guarded_monotonic(i_time_fn):
+    #last resort - wall clock, but clamped so it never runs backwards
+    l_last = [i_time_fn()]
+    l_lock = threading.Lock()
+    def monotonic():
+        l_lock.acquire()
+        try:
+            l_last[0] = max(l_last[0], i_time_fn())
+            return l_last[0]
+        finally:
+            l_lock.release()
+    return monotonic
+
+#c_monotonic_is_system_wide tells you whether two processes reading monotonic()
+#get comparable numbers (time.clock on windows starts at 0 in every process)
+c_monotonic_is_system_wide = True
+if(hasattr(time, "monotonic")):
+    monotonic = time.monotonic
+elif(sys.platform.startswith("linux")):
+    try:
+        monotonic = _make_linux_monotonic()
+    except Exception:
+        monotonic = _make_guarded_monotonic(time.time)
+elif(sys.platform == "win32"):
+    monotonic = _make_guarded_monotonic(time.clock) #performance counter on windows
+    c_monotonic_is_system_wide = False
+else:
+    monotonic = _make_guarded_monotonic(time.time)
+
+#A clock that only moves when told to. Callable like monotonic(), so it can be
+#handed to anything that takes a clock= argument (recorder, scheduler, engine)
+#to run a show faster than real time.
+class Virtual_Clock:
+    def __init__(self, start_time=0.0):
+        self.now = start_time
+
+    def __call__(self):
+        return self.now
+
+    def sleep(self, secs):
+        self.now += max(0.0, secs)
+
+    def advance_to(self, new_time):
+        self.now = max(self.now, new_time)
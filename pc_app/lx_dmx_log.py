@@ -0,0 +1,215 @@
+########################################################################
+########################################################################
+###
+### Python_LX - A simple, Python and Arduino based DMX512 lighting console
+### by Chris Gerth - Summer/Fall 2014
+###
+### File - lx_dmx_log.py - records transmitted DMX frames, plays them back
+### Dependencies - pySerial (only for replaying to hardware)
+###
+########################################################################
+########################################################################
+
+import sys, time, argparse #system dependencies
+import lx_clock, lx_output, lx_serial_protocol
+
+########################################################################
+### LOG FORMAT
+########################################################################
+#A .plxlog file is a header followed by one record per transmitted frame.
+#All integers are unsigned LEB128 varints (7 bits per byte, high bit = more).
+#
+# header: "PLXLOG" <version byte> <varint channel count>
+# record: <varint microseconds since previous record>
+#         <varint number of changed channels, or channel count + 1 for a full frame>
+#         changes - for each changed channel, in ascending order:
+#             <varint channels skipped since the last change> <level byte>
+#         full frame - one level byte per channel
+#
+#The first record is diffed against an all-zero frame and has a time delta of 0.
+#A frame that didn't change costs 2-3 bytes, so a long show that mostly sits in
+#standby stays tiny. A change costs at least 2 bytes, so once half the
+#channels change (mid-fade) the whole frame is stored instead.
+#Version 1 logs are the same without full frames.
+
+c_log_magic = b"PLXLOG"
+c_log_version = 2
+c_log_versions_read = (1, 2)
+c_log_flush_period = 1.0 #seconds between flushes, so a crash loses at most this much
+
+def _append_varint(buf, val):
+    while(val >= 0x80):
+        buf.append((val & 0x7F) | 0x80)
+        val >>= 7
+    buf.append(val)
+
+def _read_varint(buf, pos):
+    l_val = 0
+    l_shift = 0
+    while(True):
+        l_byte = buf[pos]
+        pos += 1
+        l_val |= (l_byte & 0x7F) << l_shift
+        if(l_byte < 0x80):
+            return (l_val, pos)
+        l_shift += 7
+
+########################################################################
+### RECORDER
+########################################################################
+class DMX_Recorder:
+    def __init__(self, fname, num_ch, clock=lx_clock.monotonic):
+        self.num_ch = num_ch
+        self.clock = clock
+        self.out_file = open(fname, "wb")
+        self.prev_frame = bytearray(num_ch)
+        self.frame_count = 0
+        l_header = bytearray(c_log_magic)
+        l_header.append(c_log_version)
+        _append_varint(l_header, num_ch)
+        self.out_file.write(bytes(l_header))
+        self.prev_time_us = None #first record gets a delta of 0
+        self.last_flush_time = self.clock()
+
+    #call once per transmitted frame, right after it went out
+    def record(self, levels, timestamp=None):
+        if(timestamp is None):
+            timestamp = self.clock()
+        l_frame = bytearray(levels)
+        if(len(l_frame) != self.num_ch):
+            raise ValueError("DMX log expects {} channels per frame, got {}".format(self.num_ch, len(l_frame)))
+        l_time_us = int(round(timestamp * 1000000))
+        if(self.prev_time_us is None):
+            self.prev_time_us = l_time_us
+        l_rec = bytearray()
+        _append_varint(l_rec, max(0, l_time_us - self.prev_time_us))
+        l_prev = self.prev_frame
+        l_changed = [i for i in range(0, self.num_ch) if l_frame[i] != l_prev[i]]
+        if(len(l_changed)*2 >= self.num_ch and len(l_changed) > 0):
+            _append_varint(l_rec, self.num_ch + 1)
+            l_rec += l_frame
+        else:
+            _append_varint(l_rec, len(l_changed))
+            l_last_ch = -1
+            for i in l_changed:
+                _append_varint(l_rec, i - l_last_ch - 1)
+                l_rec.append(l_frame[i])
+                l_last_ch = i
+        self.out_file.write(bytes(l_rec))
+        self.prev_frame = l_frame
+        self.prev_time_us = max(self.prev_time_us, l_time_us)
+        self.frame_count += 1
+        if(timestamp - self.last_flush_time >= c_log_flush_period):
+            self.out_file.flush()
+            self.last_flush_time = timestamp
+
+    def close(self):
+        self.out_file.close()
+
+########################################################################
+### REPLAYER
+########################################################################
+class DMX_Log_Replayer:
+    def __init__(self, fname):
+        l_file = open(fname, "rb")
+        try:
+            self.buf = bytearray(l_file.read())
+        finally:
+            l_file.close()
+        if(self.buf[0:len(c_log_magic)] != bytearray(c_log_magic)):
+            raise ValueError("{} is not a python_lx DMX log".format(fname))
+        l_version = self.buf[len(c_log_magic)]
+        if(l_version not in c_log_versions_read):
+            raise ValueError("Unsupported DMX log version {}".format(l_version))
+        (self.num_ch, self.data_start) = _read_varint(self.buf, len(c_log_magic)+1)
+
+    #yields (seconds since first frame, frame) for every recorded frame.
+    #The same bytearray is reused between frames - copy it if you keep it.
+    def frames(self):
+        l_buf = self.buf
+        l_pos = self.data_start
+        l_end = len(l_buf)
+        l_frame = bytearray(self.num_ch)
+        l_time_us = 0
+        while(l_pos < l_end):
+            (l_dt_us, l_pos) = _read_varint(l_buf, l_pos)
+            (l_num_changed, l_pos) = _read_varint(l_buf, l_pos)
+            l_time_us += l_dt_us
+            if(l_num_changed == self.num_ch + 1):
+                l_frame[:] = l_buf[l_pos:l_pos + self.num_ch]
+                l_pos += self.num_ch
+                yield (l_time_us / 1000000.0, l_frame)
+                continue
+            l_ch = -1
+            for i in range(0, l_num_changed):
+                (l_skip, l_pos) = _read_varint(l_buf, l_pos)
+                l_ch += l_skip + 1
+                l_frame[l_ch] = l_buf[l_pos]
+                l_pos += 1
+            yield (l_time_us / 1000000.0, l_frame)
+
+    #stream the log into an output backend. speed 2.0 plays twice as fast,
+    #speed 0 (or less) pushes frames out as fast as the backend will take them
+    def replay(self, output, speed=1.0, clock=lx_clock.monotonic, sleep=time.sleep):
+        l_start = clock()
+        l_count = 0
+        for (l_frame_time, l_frame) in self.frames():
+            if(speed > 0):
+                l_wait = l_start + l_frame_time/speed - clock()
+                if(l_wait > 0):
+                    sleep(l_wait)
+            output.write_frame(l_frame)
+            l_count += 1
+        return l_count
+
+    def summary(self):
+        l_count = 0
+        l_duration = 0.0
+        l_changes = 0
+        l_prev = bytearray(self.num_ch)
+        for (l_frame_time, l_frame) in self.frames():
+            l_count += 1
+            l_duration = l_frame_time
+            if(l_frame != l_prev):
+                l_changes += 1
+                l_prev = bytearray(l_frame)
+        return {"channels": self.num_ch, "frames": l_count, "changed_frames": l_changes,
+                "duration": l_duration, "bytes": len(self.buf)}
+
+########################################################################
+### COMMAND LINE
+########################################################################
+def main(argv):
+    parser = argparse.ArgumentParser(description = "Inspect or replay a python_lx DMX output log")
+    parser.add_argument("command", choices = ["info", "dump", "replay"])
+    parser.add_argument("log_file")
+    parser.add_argument("--speed", type = float, default = 1.0, help = "replay speed multiplier, 0 = as fast as possible")
+    parser.add_argument("--port", default = None, help = "serial port to replay into (default: no hardware)")
+    parser.add_argument("--protocol", choices = ["framed", "legacy"], default = "framed", help = "serial protocol the arduino sketch speaks")
+    args = parser.parse_args(argv)
+
+    replayer = DMX_Log_Replayer(args.log_file)
+    if(args.command == "info"):
+        info = replayer.summary()
+        print("Channels:       {}".format(info["channels"]))
+        print("Frames:         {}".format(info["frames"]))
+        print("Changed frames: {}".format(info["changed_frames"]))
+        print("Duration:       {:.3f} s".format(info["duration"]))
+        print("Size:           {} bytes".format(info["bytes"]))
+    elif(args.command == "dump"):
+        for (l_frame_time, l_frame) in replayer.frames():
+            print("{:10.4f} ".format(l_frame_time) + " ".join(str(v) for v in l_frame))
+    else:
+        if(args.port is None):
+            output = lx_output.Null_Output()
+        else:
+            output = lx_serial_protocol.open_serial_output(args.port, args.protocol)
+        try:
+            l_count = replayer.replay(output, speed = args.speed)
+        finally:
+            output.close()
+        print("Replayed {} frames".format(l_count))
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))
@@ -0,0 +1,276 @@
+########################################################################
+########################################################################
+###
+### Python_LX - A simple, Python and Arduino based DMX512 lighting console
+### by Chris Gerth - Summer/Fall 2014
+###
+### File - lx_effects.py - chases, waveforms and flicker layered on top
+###                        of the cue output
+### Dependencies - none
+###
+########################################################################
+########################################################################
+
+import sys, math, random, time, threading, argparse #system dependencies
+
+#An effect runs one waveform over a selection of channels, each channel offset
+#in phase from the last. Everything that doesn't change from frame to frame is
+#worked out once when the effect starts:
+#  - the waveform is sampled into a table of ready-to-use levels (low..high)
+#  - each channel's phase becomes an integer offset into that table
+#  - the channel selection is broken into runs of neighbouring channels
+#so a frame is one table lookup per channel (a list comprehension) and one
+#slice operation per run to merge it into the output. No trig, no per-channel
+#method calls in the frame loop.
+#Effects are applied to a copy of the frame on its way to the serial port, so
+#they never end up in g_cur_dmx_output or in recorded cues.
+
+c_wave_table_size = 256 #samples per cycle (at least)
+c_flicker_table_size = 1021 #random levels per flicker loop - long and odd so the repeat isn't obvious
+
+c_WAVEFORMS = ["sine", "saw", "square", "chase", "flicker"]
+c_MERGE_MODES = ["htp", "ltp", "scale"] #highest takes precedence, latest takes precedence, dim the cue level
+
+########################################################################
+### EFFECT DEFINITION
+########################################################################
+#channels - 1-based DMX channels in effect order (a chase runs in this order)
+#rate     - cycles per second. For a chase, steps per second. For flicker, new random levels per second.
+#low/high - level range the waveform swings between
+#spread   - phase offset from the first channel to the last, in cycles. 0 = all in step.
+#           Chases default to 1 (one channel on at a time), flicker to random offsets.
+#width    - fraction of each cycle a square wave is high. Chases default to one step.
+#merge    - how the effect combines with the cue level on its channels, see c_MERGE_MODES
+class Effect:
+    def __init__(self, name, channels, waveform="sine", rate=1.0, low=0, high=255, spread=None, width=None, merge="htp", seed=0):
+        if(waveform not in c_WAVEFORMS):
+            raise ValueError("Unknown waveform {}, expected one of {}".format(waveform, ", ".join(c_WAVEFORMS)))
+        if(merge not in c_MERGE_MODES):
+            raise ValueError("Unknown merge mode {}, expected one of {}".format(merge, ", ".join(c_MERGE_MODES)))
+        if(len(channels) == 0):
+            raise ValueError("Effect {} has no channels".format(name))
+        self.name = name
+        self.channels = [int(ch) for ch in channels]
+        self.waveform = waveform
+        self.rate = float(rate)
+        self.low = max(0, min(int(low), 255))
+        self.high = max(0, min(int(high), 255))
+        self.spread = spread
+        self.width = width
+        self.merge = merge
+        self.seed = seed
+        self.start_time = 0.0
+        self._compile()
+
+    #everything needed to build the same effect again (in another process, or a file)
+    def params(self):
+        return {"name": self.name, "channels": list(self.channels), "waveform": self.waveform, "rate": self.rate,
+                "low": self.low, "high": self.high, "spread": self.spread, "width": self.width,
+                "merge": self.merge, "seed": self.seed}
+
+    def _compile(self):
+        l_num = len(self.channels)
+        l_rand = random.Random(self.seed)
+        if(self.waveform == "flicker"):
+            l_table = [l_rand.randint(self.low, self.high) for i in range(0, c_flicker_table_size)]
+            self.steps_per_sec = self.rate
+        else:
+            l_width = self.width
+            if(l_width == None):
+                l_width = 1.0/l_num if self.waveform == "chase" else 0.5
+            #a whole number of samples per channel, so phase offsets land exactly on samples
+            l_size = l_num*max(1, c_wave_table_size//l_num)
+            l_table = [_wave_level(self.waveform, float(i)/l_size, l_width, self.low, self.high) for i in range(0, l_size)]
+            self.steps_per_sec = self.rate*l_size
+            if(self.waveform == "chase"):
+                self.steps_per_sec = self.rate*l_size/l_num
+        l_size = len(l_table)
+        self.table = l_table + l_table #doubled, so position + phase never needs wrapping
+        self.table_size = l_size
+
+        #phase offsets. A positive spread means later channels lag behind earlier ones.
+        if(self.waveform == "flicker" and self.spread == None):
+            self.phases = [l_rand.randrange(0, l_size) for i in range(0, l_num)]
+        else:
+            l_spread = self.spread
+            if(l_spread == None):
+                l_spread = 1.0 if self.waveform == "chase" else 0.0
+            self.phases = [int(round(-float(i)*l_spread*l_size/l_num)) % l_size for i in range(0, l_num)]
+
+        #split the (0-based) channels into runs of consecutive addresses, ascending or descending
+        self.runs = [] #(first frame index, slice stop, step, first value index, last value index + 1)
+        l_idx = [ch-1 for ch in self.channels]
+        l_run_start = 0
+        for i in range(1, l_num+1):
+            if(i < l_num):
+                l_step = l_idx[i] - l_idx[i-1]
+                if(abs(l_step) == 1 and (i-1 == l_run_start or l_step == l_idx[i-1] - l_idx[i-2])):
+                    continue #still the same run
+            l_first = l_idx[l_run_start]
+            l_last = l_idx[i-1]
+            l_step = 1 if l_last >= l_first else -1
+            l_stop = l_last + l_step
+            if(l_stop < 0):
+                l_stop = None #slice down to and including index 0
+            self.runs.append((l_first, l_stop, l_step, l_run_start, i))
+            l_run_start = i
+
+    #levels for every channel in self.channels at time now
+    def levels(self, now):
+        l_pos = int((now - self.start_time)*self.steps_per_sec) % self.table_size
+        l_table = self.table
+        return [l_table[l_pos + ph] for ph in self.phases]
+
+    #merge this effect's levels into frame (a list indexed from DMX channel 1)
+    def apply(self, frame, now):
+        l_vals = self.levels(now)
+        l_max_index = len(frame)
+        for (l_first, l_stop, l_step, l_lo, l_hi) in self.runs:
+            if(l_first >= l_max_index or (l_stop != None and l_stop > l_max_index)):
+                #part of the run is beyond this rig, trim it
+                if(l_step == 1):
+                    if(l_first >= l_max_index):
+                        continue
+                    l_hi -= l_stop - l_max_index
+                    l_stop = l_max_index
+                else:
+                    if(l_stop != None and l_stop >= l_max_index - 1):
+                        continue
+                    l_lo += l_first - (l_max_index - 1)
+                    l_first = l_max_index - 1
+            l_new = l_vals[l_lo:l_hi]
+            if(self.merge == "ltp"):
+                frame[l_first:l_stop:l_step] = l_new
+            elif(self.merge == "htp"):
+                frame[l_first:l_stop:l_step] = list(map(max, frame[l_first:l_stop:l_step], l_new))
+            else:
+                frame[l_first:l_stop:l_step] = [a*b//255 for (a, b) in zip(frame[l_first:l_stop:l_step], l_new)]
+
+#one sample of a waveform, x is the position in the cycle [0,1)
+def _wave_level(waveform, x, width, low, high):
+    if(waveform == "sine"):
+        l_frac = 0.5 - 0.5*math.cos(2.0*math.pi*x) #starts at low
+    elif(waveform == "saw"):
+        l_frac = x
+    else: #square and chase
+        l_frac = 1.0 if x < width else 0.0
+    return int(round(low + (high - low)*l_frac))
+
+########################################################################
+### EFFECTS ENGINE
+########################################################################
+#The running effects. Button handlers start and stop them, the frame loop calls
+#apply() once per frame on the outgoing frame. Later effects are merged on top
+#of earlier ones.
+class Effects_Engine:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.effects = []
+        self.channel_indices = set() #0-based frame indices any running effect writes
+
+    def start(self, effect, now):
+        self.lock.acquire()
+        effect.start_time = now
+        self.effects = [e for e in self.effects if e.name != effect.name] + [effect] #same name replaces
+        self._update_channels()
+        self.lock.release()
+
+    def stop(self, name):
+        self.lock.acquire()
+        self.effects = [e for e in self.effects if e.name != name]
+        self._update_channels()
+        self.lock.release()
+
+    def stop_all(self):
+        self.lock.acquire()
+        self.effects = []
+        self._update_channels()
+        self.lock.release()
+
+    def names(self):
+        return [e.name for e in self.effects]
+
+    def is_running(self):
+        return len(self.effects) > 0
+
+    #start exactly these effects from their params() dicts, stopping anything else
+    def load_params(self, params_list, now):
+        l_effects = [Effect(**p) for p in params_list]
+        for l_effect in l_effects:
+            l_effect.start_time = now
+        self.lock.acquire()
+        self.effects = l_effects
+        self._update_channels()
+        self.lock.release()
+
+    def params(self):
+        return [e.params() for e in self.effects]
+
+    #merge every running effect into frame, in place
+    def apply(self, frame, now):
+        l_effects = self.effects #list is replaced, never changed in place, so no lock needed here
+        for l_effect in l_effects:
+            l_effect.apply(frame, now)
+        return frame
+
+    def _update_channels(self):
+        l_set = set()
+        for l_effect in self.effects:
+            l_set.update(ch-1 for ch in l_effect.channels)
+        self.channel_indices = l_set
+
+#"1-10+15+20-16" style channel selection, same syntax as the Set Ch dialog
+#(without the "* level" part). Order is kept - "10-1" runs backwards - and
+#"/" means every channel.
+def parse_channel_selection(sel_str, max_ch):
+    l_str = "".join(sel_str.split())
+    if(l_str == "/"):
+        return list(range(1, max_ch+1))
+    l_channels = []
+    for l_part in l_str.split("+"):
+        if(l_part == ""):
+            continue
+        (l_lo_str, l_dash, l_hi_str) = l_part.partition("-")
+        l_lo = max(1, min(int(l_lo_str), max_ch))
+        if(l_dash == ""):
+            l_channels.append(l_lo)
+            continue
+        l_hi = max(1, min(int(l_hi_str), max_ch))
+        l_step = 1 if l_hi >= l_lo else -1
+        l_channels.extend(range(l_lo, l_hi + l_step, l_step))
+    return l_channels
+
+########################################################################
+### COMMAND LINE
+########################################################################
+#how long it takes to apply a pile of effects to a big rig
+def main(argv):
+    parser = argparse.ArgumentParser(description = "Benchmark the python_lx effects engine")
+    parser.add_argument("--effects", type = int, default = 40)
+    parser.add_argument("--channels", type = int, default = 512, help = "frame size")
+    parser.add_argument("--effect-channels", type = int, default = 200, help = "channels per effect")
+    parser.add_argument("--frames", type = int, default = 500)
+    parser.add_argument("--frame-time", type = float, default = 0.05)
+    args = parser.parse_args(argv)
+
+    l_rand = random.Random(0)
+    l_engine = Effects_Engine()
+    for i in range(0, args.effects):
+        l_first = l_rand.randrange(1, args.channels - args.effect_channels + 2)
+        l_channels = list(range(l_first, l_first + args.effect_channels))
+        if(i % 3 == 1):
+            l_channels = l_channels[::-1] + [l_rand.randrange(1, args.channels+1) for j in range(0, 10)] #some ragged selections too
+        l_engine.start(Effect("fx{}".format(i), l_channels, c_WAVEFORMS[i % len(c_WAVEFORMS)], rate = 0.5 + i % 4,
+                              spread = 1.0, merge = c_MERGE_MODES[i % len(c_MERGE_MODES)], seed = i), 0.0)
+    l_frame = [0]*args.channels
+    l_start = time.time()
+    for i in range(0, args.frames):
+        l_frame[:] = [128]*args.channels
+        l_engine.apply(l_frame, i*args.frame_time)
+    l_per_frame = (time.time() - l_start)/args.frames
+    print("{} effects x {} channels on a {} channel frame: {:.2f} ms per frame ({:.1f}% of a {:.0f} ms frame)".format(
+        args.effects, args.effect_channels, args.channels, l_per_frame*1000.0, 100.0*l_per_frame/args.frame_time, args.frame_time*1000.0))
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))
@@ -0,0 +1,294 @@
+########################################################################
+########################################################################
+###
+### Python_LX - A simple, Python and Arduino based DMX512 lighting console
+### by Chris Gerth - Summer/Fall 2014
+###
+### File - lx_engine.py - fade math and cue timing shared by the realtime
+###                       loop and anything else that needs to run a show
+### Dependencies - none
+###
+########################################################################
+########################################################################
+
+import threading, heapq #system dependencies
+import lx_clock
+
+########################################################################
+### STATE DEFINITIONS
+########################################################################
+#"enum" def for states of the system
+c_STATE_NOT_READY = -1
+c_STATE_STANDBY = 0
+c_STATE_TRANSITION_FWD = 1
+c_STATE_TRANSITION_BKW = 2
+
+c_CH_STATE_NO_CHANGE = 0
+c_CH_STATE_INC = 1
+c_CH_STATE_DEC = 2
+c_CH_STATE_CAPTURED = 3
+
+########################################################################
+### FADE MATH
+########################################################################
+#figure out which way each channel has to move to get from one cue to the next
+def update_ch_states(ch_states, prev_vals, next_vals):
+    prev_vals = prev_vals[:] #plain lists, even for tracked cue levels (lx_tracking.py)
+    next_vals = next_vals[:]
+    for i in range(0,len(ch_states)):
+        if(ch_states[i] != c_CH_STATE_CAPTURED): #captured channels should remain captured
+            if(prev_vals[i] == next_vals[i]):
+                ch_states[i] = c_CH_STATE_NO_CHANGE
+            elif(prev_vals[i] > next_vals[i]):
+                ch_states[i] = c_CH_STATE_DEC
+            elif(prev_vals[i] < next_vals[i]):
+                ch_states[i] = c_CH_STATE_INC
+
+#how long the transition into a cue takes once its delay has run out
+def fade_duration(cue):
+    return max(cue.UP_TIME, cue.DOWN_TIME)
+
+#calculate each dmx value based on how far we are through the fade into cue.
+#sec_into_transition is real elapsed time, so it doesn't have to land on a frame boundary
+def calc_fade_frame(cur_out, prev_out, ch_states, cue, sec_into_transition):
+    l_sec = max(0.0, sec_into_transition)
+    l_up_frac = min(1.0, l_sec/cue.UP_TIME)
+    l_down_frac = min(1.0, l_sec/cue.DOWN_TIME)
+    l_target = cue.DMX_VALS[:] #one lookup for tracked cue levels instead of one per channel
+    for i in range(0, len(cur_out)):
+        if(ch_states[i] == c_CH_STATE_INC): #captured channels should not change
+            cur_out[i] = int(round(float(prev_out[i])*(1.0-l_up_frac)+float(l_target[i])*l_up_frac))
+        elif(ch_states[i] == c_CH_STATE_DEC): #captured channels should not change
+            cur_out[i] = int(round(float(prev_out[i])*(1.0-l_down_frac)+float(l_target[i])*l_down_frac))
+        elif(ch_states[i] == c_CH_STATE_NO_CHANGE):
+            cur_out[i] = int(round(l_target[i])) #required in case the user is mashing go/back buttons so channels don't hang
+
+#end-of-fade snap, accounts for discrete timestep issues
+def finish_fade(cur_out, ch_states, cue):
+    l_target = cue.DMX_VALS[:]
+    for i in range(0, len(cur_out)):
+        if(ch_states[i] != c_CH_STATE_CAPTURED):
+            cur_out[i] = int(round(l_target[i]))
+
+########################################################################
+### CUE SCHEDULER
+########################################################################
+#Holds timed actions (auto-follows and the like) in a heap ordered by the
+#absolute clock time they are due. The realtime loop polls it once per frame,
+#so there's never more than the one timer thread no matter how many cues are
+#waiting. Actions get called with the exact time they were due, not the time
+#the loop noticed, so a chain of follows doesn't drift by a frame per cue.
+class Cue_Scheduler:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.events = []
+        self.seq = 0 #tie-breaker so equal due times run in the order they were added
+
+    def schedule(self, due_time, action, *args):
+        self.lock.acquire()
+        self.seq += 1
+        heapq.heappush(self.events, (due_time, self.seq, action, args))
+        self.lock.release()
+
+    def cancel_all(self):
+        self.lock.acquire()
+        self.events = []
+        self.lock.release()
+
+    def next_due_time(self):
+        self.lock.acquire()
+        l_time = None
+        if(len(self.events) > 0):
+            l_time = self.events[0][0]
+        self.lock.release()
+        return l_time
+
+    def pending_count(self):
+        return len(self.events)
+
+    #run every action due at or before now, in due-time order.
+    #Actions are allowed to schedule more actions (that's how follows chain).
+    def run_due(self, now):
+        l_ran = 0
+        while(True):
+            self.lock.acquire()
+            if(len(self.events) == 0 or self.events[0][0] > now):
+                self.lock.release()
+                return l_ran
+            (l_due_time, l_seq, l_action, l_args) = heapq.heappop(self.events)
+            self.lock.release()
+            l_action(l_due_time, *l_args)
+            l_ran += 1
+
+#where a cue numbered cue_num belongs in cue_list: (index, True if it replaces the cue already there)
+def find_cue_slot(cue_list, cue_num):
+    for i in range(0, len(cue_list)):
+        if(cue_list[i].CUE_NUM == cue_num):
+            return (i, True)
+        if(cue_list[i].CUE_NUM > cue_num):
+            return (i, False)
+    return (len(cue_list), False)
+
+########################################################################
+### PLAYBACK ENGINE
+########################################################################
+#The one implementation of the GO/BACK/GoTo/Set Ch/Record Cue actions, the
+#fades and the auto-follows. python_lx.py's timed thread, the output process,
+#lx_render and lx_stress all run a Playback_Engine. No Tk, no serial port, and
+#the clock is whatever you hand it, so it can run against a Virtual_Clock as
+#fast as the CPU allows (offline rendering) or against lx_clock.monotonic in
+#its own thread or process.
+class Playback_Engine:
+    def __init__(self, cue_list, num_ch, clock=lx_clock.monotonic):
+        self.lock = threading.RLock() #reentrant - follows call go() from inside step()
+        self.clock = clock
+        self.num_ch = num_ch
+        self.cue_list = cue_list
+        self.cur_out = [0]*num_ch
+        self.prev_out = [0]*num_ch
+        self.ch_states = [c_CH_STATE_NO_CHANGE]*num_ch
+        self.cur_cue_index = 0
+        self.state = c_STATE_STANDBY
+        self.transition_start_time = 0.0
+        self.sec_into_transition = 0.0
+        self.scheduler = Cue_Scheduler()
+        self.transition_listener = None #called as listener(engine, go_time) whenever a fade is started
+        if(len(cue_list) > 0):
+            self.snap_to_cue(0)
+
+    #jump straight to a cue's levels, no fade, captured channels released
+    def snap_to_cue(self, cue_index):
+        self.lock.acquire()
+        self.scheduler.cancel_all()
+        self.cur_cue_index = cue_index
+        self.cur_out[:] = [int(round(v)) for v in self.cue_list[cue_index].DMX_VALS]
+        self.ch_states[:] = [c_CH_STATE_NO_CHANGE]*self.num_ch
+        self.state = c_STATE_STANDBY
+        self.sec_into_transition = 0.0
+        self.lock.release()
+
+    def go(self, go_time=None):
+        self.lock.acquire()
+        l_ok = self.cur_cue_index < len(self.cue_list)-1
+        if(l_ok):
+            self._start_transition(self.cur_cue_index+1, go_time, c_STATE_TRANSITION_FWD)
+        self.lock.release()
+        return l_ok
+
+    def back(self, go_time=None):
+        self.lock.acquire()
+        l_ok = self.cur_cue_index > 0
+        if(l_ok):
+            self._start_transition(self.cur_cue_index-1, go_time, c_STATE_TRANSITION_BKW)
+        self.lock.release()
+        return l_ok
+
+    def goto(self, cue_num, go_time=None):
+        self.lock.acquire()
+        l_index = -1
+        for i in range(0, len(self.cue_list)):
+            if(self.cue_list[i].CUE_NUM == cue_num):
+                l_index = i
+                break
+        if(l_index != -1):
+            self._start_transition(l_index, go_time, c_STATE_TRANSITION_FWD)
+        self.lock.release()
+        return l_index != -1
+
+    #channels are 1-based like the Set Ch dialog; they stay put until released
+    def set_channels(self, channels, level):
+        self.lock.acquire()
+        for ch in channels:
+            self.cur_out[ch-1] = level
+            self.ch_states[ch-1] = c_CH_STATE_CAPTURED
+        self.lock.release()
+
+    def release_captured(self):
+        self.lock.acquire()
+        if(self.state == c_STATE_STANDBY):
+            l_cue = self.cue_list[self.cur_cue_index]
+            for i in range(0, self.num_ch):
+                if(self.ch_states[i] == c_CH_STATE_CAPTURED):
+                    self.cur_out[i] = l_cue.DMX_VALS[i]
+                    self.ch_states[i] = c_CH_STATE_NO_CHANGE
+        self.lock.release()
+
+    #what Record Cue does: whatever is on stage now belongs to the current cue
+    def uncapture_all(self):
+        self.lock.acquire()
+        self.ch_states[:] = [c_CH_STATE_NO_CHANGE]*self.num_ch
+        self.lock.release()
+
+    #what Record Cue does with a new cue: it replaces the cue with the same number
+    #or goes in where its number says, becomes the current cue, and whatever was
+    #captured now belongs to it. Only in standby. Returns the cue's index, or -1.
+    #A follow still waiting would fire from the new current cue, not the one it
+    #was scheduled from, so it's cancelled - same as any other edit.
+    def record_cue(self, cue):
+        self.lock.acquire()
+        l_index = -1
+        if(self.state == c_STATE_STANDBY):
+            self.scheduler.cancel_all()
+            (l_index, l_replace) = find_cue_slot(self.cue_list, cue.CUE_NUM)
+            if(l_replace):
+                self.cue_list[l_index] = cue
+            else:
+                self.cue_list.insert(l_index, cue)
+            self.cur_cue_index = l_index
+            self.ch_states[:] = [c_CH_STATE_NO_CHANGE]*self.num_ch
+        self.lock.release()
+        return l_index
+
+    #swap in an edited cue list without disturbing what's on stage. Pending
+    #follows are cancelled, the indices they'd go from may have moved.
+    def set_cue_list(self, cue_list, cur_cue_index=None):
+        self.lock.acquire()
+        self.scheduler.cancel_all()
+        self.cue_list = cue_list
+        if(cur_cue_index != None):
+            self.cur_cue_index = cur_cue_index
+        self.cur_cue_index = max(0, min(self.cur_cue_index, len(cue_list)-1))
+        self.lock.release()
+
+    def is_idle(self):
+        return self.state == c_STATE_STANDBY and self.scheduler.pending_count() == 0
+
+    #advance to time now (run due follows, calculate the fade) and return the current frame.
+    #The returned list is the engine's own - copy it if you keep it.
+    def step(self, now=None):
+        if(now == None):
+            now = self.clock()
+        self.scheduler.run_due(now)
+        self.lock.acquire()
+        if(self.state == c_STATE_TRANSITION_FWD or self.state == c_STATE_TRANSITION_BKW):
+            l_cue = self.cue_list[self.cur_cue_index]
+            self.sec_into_transition = max(0.0, now - self.transition_start_time)
+            calc_fade_frame(self.cur_out, self.prev_out, self.ch_states, l_cue, self.sec_into_transition)
+            if(self.sec_into_transition >= fade_duration(l_cue)):
+                self.state = c_STATE_STANDBY
+                self.sec_into_transition = 0.0
+                finish_fade(self.cur_out, self.ch_states, l_cue)
+        self.lock.release()
+        return self.cur_out
+
+    def _start_transition(self, next_cue_index, go_time, new_state):
+        if(go_time == None):
+            go_time = self.clock()
+        update_ch_states(self.ch_states, self.cue_list[self.cur_cue_index].DMX_VALS, self.cue_list[next_cue_index].DMX_VALS)
+        self.prev_out[:] = self.cur_out
+        self.cur_cue_index = next_cue_index
+        self.scheduler.cancel_all() #any new transition replaces pending follows
+        l_cue = self.cue_list[next_cue_index]
+        if(new_state == c_STATE_TRANSITION_FWD):
+            self.transition_start_time = go_time + l_cue.DELAY_TIME
+            if(l_cue.FOLLOW_TIME != None and next_cue_index < len(self.cue_list)-1):
+                self.scheduler.schedule(go_time + l_cue.FOLLOW_TIME, self._follow)
+        else:
+            self.transition_start_time = go_time #going backwards is always immediate
+        self.sec_into_transition = 0.0
+        self.state = new_state
+        if(self.transition_listener != None):
+            self.transition_listener(self, go_time)
+
+    def _follow(self, due_time):
+        self.go(due_time)
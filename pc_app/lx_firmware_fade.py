@@ -0,0 +1,378 @@
+########################################################################
+########################################################################
+###
+### Python_LX - A simple, Python and Arduino based DMX512 lighting console
+### by Chris Gerth - Summer/Fall 2014
+###
+### File - lx_firmware_fade.py - lets the arduino run fades itself, plus
+###                              an emulator of that firmware for testing
+### Dependencies - none (pySerial to talk to real hardware)
+###
+########################################################################
+########################################################################
+
+import sys, struct, threading, argparse #system dependencies
+import lx_clock, lx_engine, lx_serial_protocol, lx_show_file
+
+#Normally every frame of every fade is calculated here and streamed down the
+#serial link, so fade smoothness is limited by the baud rate and by how
+#steadily the PC keeps time. In firmware fade mode the host sends one FADE
+#message per GO (target levels, up/down time, delay) and the sketch
+#interpolates on its own clock. Serial traffic then follows the cue changes,
+#not the frame rate:
+#  - on GO/BACK/GoTo: one LEVELS (where the host thinks we are) + one FADE
+#  - during a fade: LEVELS for captured channels only, and only when they change
+#    (every channel while the masters or the patch are active - the firmware
+#    doesn't know about them - and for the rest of any fade that was streamed)
+#  - between fades: LEVELS when something changes, plus a resync every
+#    c_firmware_resync_period in case the arduino got reset
+#Needs the framed protocol (c_serial_protocol = "framed") and the matching sketch.
+
+c_FRAME_FADE = 0x04 #payload: <delay ms u32> <up ms u32> <down ms u32> <start channel u16> <target level>...
+c_fade_header_size = 14
+c_firmware_resync_period = 1.0 #seconds between full LEVELS frames while idle
+
+def encode_fade_frame(targets, up_time, down_time, delay=0.0, start_ch=1):
+    l_header = struct.pack("<IIIH", _to_ms(delay), _to_ms(up_time), _to_ms(down_time), start_ch)
+    return lx_serial_protocol.encode_frame(c_FRAME_FADE, l_header + bytes(bytearray(targets)))
+
+def _to_ms(secs):
+    return max(0, int(round(secs*1000.0)))
+
+########################################################################
+### HOST SIDE
+########################################################################
+#Sits between the frame loop and a Serial_Writer (anything with send_command).
+#The frame loop still calculates every fade frame for the display; this just
+#decides which of them the arduino actually needs to hear about.
+class Firmware_Fade_Sender:
+    def __init__(self, writer, num_ch, clock=lx_clock.monotonic):
+        self.writer = writer
+        self.num_ch = num_ch
+        self.clock = clock
+        self.lock = threading.Lock() #fade() comes from button handlers, frame() from the timed thread
+        self.sent = None #levels the firmware is at, or fading to. None = no idea, send everything.
+        self.all_channels = frozenset(range(0, num_ch)) #pass as live_channels to stream every channel
+        self.last_full_time = None
+        self.firmware_fading = False #True while the firmware runs the current fade itself, see frame()
+        self.cur_fade = None #(targets, up time, down time, start time) of the last fade sent
+        self.reconnects = getattr(writer, "reconnects", 0)
+        #statistics
+        self.fades_sent = 0
+        self.level_frames_sent = 0
+        self.bytes_sent = 0
+
+    #call when a transition into cue starts. cur_levels is what's on stage right now,
+    #start_time is the clock time the fade proper starts (GO time + the cue's delay).
+    def fade(self, cur_levels, ch_states, cue, start_time):
+        l_targets = [0]*self.num_ch
+        for i in range(0, self.num_ch):
+            if(ch_states[i] == lx_engine.c_CH_STATE_CAPTURED):
+                l_targets[i] = int(cur_levels[i]) #captured channels stay where they are
+            else:
+                l_targets[i] = int(round(cue.DMX_VALS[i]))
+        self.lock.acquire()
+        l_delay = max(0.0, start_time - self.clock())
+        #re-anchor first so the fade starts from the same place on both ends
+        l_buf = lx_serial_protocol.encode_levels_frame(cur_levels[0:self.num_ch])
+        l_buf += encode_fade_frame(l_targets, cue.UP_TIME, cue.DOWN_TIME, l_delay)
+        self.sent = l_targets
+        self.last_full_time = self.clock()
+        self.firmware_fading = True
+        self.cur_fade = (l_targets, cue.UP_TIME, cue.DOWN_TIME, start_time)
+        self.fades_sent += 1
+        self.level_frames_sent += 1
+        self._send(l_buf)
+        self.lock.release()
+
+    #call once per frame instead of write_frame. fading is True while the host is mid-transition.
+    #live_channels are 0-based channels that change on their own (effects) and always go out.
+    #A fade that started (or spent any time) streamed with every channel live is no
+    #longer the firmware's, so it stays streamed to the end - otherwise turning the
+    #masters off mid-fade would freeze the fading channels until the next resync.
+    def frame(self, levels, ch_states, fading, live_channels=()):
+        self.lock.acquire()
+        l_now = self.clock()
+        if(getattr(self.writer, "reconnects", 0) != self.reconnects):
+            self._resync(levels, fading, l_now)
+        if(not fading):
+            self.firmware_fading = False
+        elif(live_channels is self.all_channels):
+            self.firmware_fading = False #the streamed levels have taken over from the FADE
+        elif(not self.firmware_fading):
+            live_channels = self.all_channels
+        if(self.sent == None or (not fading and (list(levels[0:self.num_ch]) != self.sent or
+                                                 l_now - self.last_full_time >= c_firmware_resync_period))):
+            self._send_full(levels, l_now)
+        elif(fading):
+            #the firmware owns every fading channel. Only channels the operator
+            #grabbed with Set Ch (or an effect is running on) go out, in runs,
+            #so the rest keep fading.
+            l_buf = b""
+            l_run_start = None
+            for i in range(0, self.num_ch+1):
+                l_changed = (i < self.num_ch and levels[i] != self.sent[i] and
+                             (ch_states[i] == lx_engine.c_CH_STATE_CAPTURED or i in live_channels))
+                if(l_changed and l_run_start == None):
+                    l_run_start = i
+                elif(not l_changed and l_run_start != None):
+                    l_buf += lx_serial_protocol.encode_levels_frame(levels[l_run_start:i], l_run_start+1)
+                    self.sent[l_run_start:i] = levels[l_run_start:i]
+                    self.level_frames_sent += 1
+                    l_run_start = None
+            if(len(l_buf) > 0):
+                self._send(l_buf)
+        self.lock.release()
+
+    #the port was down for a while, so whatever went out since it dropped (the
+    #FADE for a GO, say) is gone. Re-anchor, and hand the firmware the rest of
+    #a fade it was running; anything else gets a full LEVELS this frame.
+    def _resync(self, levels, fading, now):
+        self.reconnects = getattr(self.writer, "reconnects", 0)
+        self.sent = None
+        if(not (fading and self.firmware_fading and self.cur_fade != None)):
+            return
+        (l_targets, l_up_time, l_down_time, l_start_time) = self.cur_fade
+        l_fade_start = max(now, l_start_time) #starting from here, the rest of the way
+        l_buf = lx_serial_protocol.encode_levels_frame(levels[0:self.num_ch])
+        l_buf += encode_fade_frame(l_targets, max(0.0, l_start_time + l_up_time - l_fade_start),
+                                   max(0.0, l_start_time + l_down_time - l_fade_start), l_fade_start - now)
+        self.sent = list(l_targets)
+        self.last_full_time = now
+        self.level_frames_sent += 1
+        self.fades_sent += 1
+        self._send(l_buf)
+
+    def stats(self):
+        return {"fades": self.fades_sent, "level_frames": self.level_frames_sent, "bytes": self.bytes_sent}
+
+    def _send_full(self, levels, now):
+        self.sent = list(levels[0:self.num_ch])
+        self.last_full_time = now
+        self.level_frames_sent += 1
+        self._send(lx_serial_protocol.encode_levels_frame(self.sent))
+
+    def _send(self, buf):
+        self.bytes_sent += len(buf)
+        try:
+            self.writer.send_command(buf)
+        except Exception:
+            print("Error while trying to queue fade command for serial port!!!")
+
+########################################################################
+### FIRMWARE EMULATOR
+########################################################################
+#Python copy of python_lx_arduino.ino (framed protocol + fades), down to the
+#integer fade math, so the host side can be tested without an arduino.
+#Time is whatever the caller says it is - feed it lx_clock.monotonic() or a
+#Virtual_Clock. Keep it in step with the sketch.
+c_emulator_max_ch = 150 #MAX_DMX_CH in the sketch
+
+class Firmware_Emulator:
+    def __init__(self, max_ch=c_emulator_max_ch):
+        self.max_ch = max_ch
+        l_max_payload = max_ch + c_fade_header_size
+        self.rx_buf_size = l_max_payload + 5 + (l_max_payload + 5)//254 + 2 #RX_BUF_SIZE
+        self.bad_frames = 0
+        self.frames_handled = 0
+        self.bytes_received = 0
+        self.reset()
+
+    #what the arduino does when the port is opened (DTR reset)
+    def reset(self):
+        self.baud = lx_serial_protocol.c_initial_baud
+        self.rx_buf = bytearray()
+        self.rx_overflow = False
+        self.replies = bytearray()
+        self.cur_level = [0]*self.max_ch
+        self.fade_start = [0]*self.max_ch
+        self.fade_target = [0]*self.max_ch
+        self.fade_begin_ms = 0
+        self.fade_up_ms = 0
+        self.fade_down_ms = 0
+        self.fade_active = False
+
+    #bytes arriving over the wire at time now (seconds)
+    def receive(self, data, now):
+        self._update_fade(now)
+        self.bytes_received += len(data)
+        for b in bytearray(data):
+            if(b == 0):
+                if(not self.rx_overflow and len(self.rx_buf) > 0):
+                    self._handle_frame(self.rx_buf, now)
+                self.rx_buf = bytearray()
+                self.rx_overflow = False
+            elif(len(self.rx_buf) < self.rx_buf_size):
+                self.rx_buf.append(b)
+            else:
+                self.rx_overflow = True
+
+    #what DmxSimple would be putting on the wire at time now
+    def levels(self, now):
+        self._update_fade(now)
+        return list(self.cur_level)
+
+    #raw_opener for lx_serial_protocol.open_framed_serial_port
+    def open_port(self, port_name, baud=lx_serial_protocol.c_initial_baud, write_timeout=None, clock=lx_clock.monotonic):
+        self.reset()
+        return Emulated_Serial_Port(self, baud, clock)
+
+    def _handle_frame(self, encoded, now):
+        try:
+            (l_type, l_payload) = lx_serial_protocol.decode_frame(encoded)
+        except ValueError:
+            self.bad_frames += 1
+            return
+        self.frames_handled += 1
+        l_payload = bytearray(l_payload)
+        if(l_type == lx_serial_protocol.c_FRAME_LEVELS and len(l_payload) >= 2):
+            l_ch = l_payload[0] | (l_payload[1] << 8)
+            for l_level in l_payload[2:]:
+                if(l_ch > self.max_ch):
+                    break
+                self.cur_level[l_ch-1] = l_level
+                self.fade_start[l_ch-1] = l_level #a level set wins over any fade on that channel
+                self.fade_target[l_ch-1] = l_level
+                l_ch += 1
+        elif(l_type == c_FRAME_FADE and len(l_payload) >= c_fade_header_size):
+            (l_delay, l_up, l_down, l_first_ch) = struct.unpack_from("<IIIH", bytes(l_payload))
+            for i in range(0, self.max_ch):
+                self.fade_start[i] = self.cur_level[i]
+                l_idx = c_fade_header_size + (i + 1 - l_first_ch)
+                if(i + 1 >= l_first_ch and l_idx < len(l_payload)):
+                    self.fade_target[i] = l_payload[l_idx]
+                else:
+                    self.fade_target[i] = self.cur_level[i] #not in this fade, stay put
+            self.fade_begin_ms = _millis(now) + l_delay
+            self.fade_up_ms = l_up
+            self.fade_down_ms = l_down
+            self.fade_active = True
+        elif(l_type == lx_serial_protocol.c_FRAME_PING):
+            self.replies.extend(lx_serial_protocol.encode_frame(lx_serial_protocol.c_FRAME_PONG,
+                struct.pack("<BH", lx_serial_protocol.c_protocol_version, self.max_ch)))
+        elif(l_type == lx_serial_protocol.c_FRAME_SET_BAUD and len(l_payload) == 4):
+            self.replies.extend(lx_serial_protocol.encode_frame(lx_serial_protocol.c_FRAME_BAUD_ACK, bytes(l_payload)))
+            self.baud = struct.unpack("<I", bytes(l_payload))[0]
+
+    def _update_fade(self, now):
+        if(not self.fade_active):
+            return
+        l_now_ms = _millis(now)
+        if(l_now_ms < self.fade_begin_ms):
+            return #still in the delay
+        l_elapsed = l_now_ms - self.fade_begin_ms
+        l_up_frac = _fade_fraction(l_elapsed, self.fade_up_ms)
+        l_down_frac = _fade_fraction(l_elapsed, self.fade_down_ms)
+        for i in range(0, self.max_ch):
+            l_start = self.fade_start[i]
+            l_diff = self.fade_target[i] - l_start
+            l_frac = l_up_frac if l_diff > 0 else l_down_frac
+            self.cur_level[i] = l_start + ((l_diff * l_frac) >> 8)
+        if(l_up_frac == 256 and l_down_frac == 256):
+            self.fade_active = False
+
+def _millis(now):
+    return int(now*1000.0)
+
+#fraction of the way through a fade of duration_ms, 0-256
+def _fade_fraction(elapsed_ms, duration_ms):
+    if(elapsed_ms >= duration_ms):
+        return 256
+    return (elapsed_ms*256)//duration_ms
+
+#Stands in for a pySerial port wired to a Firmware_Emulator. Bytes written at
+#the wrong baud rate are lost, same as on real hardware.
+class Emulated_Serial_Port:
+    def __init__(self, emulator, baud, clock=lx_clock.monotonic):
+        self.emulator = emulator
+        self.baudrate = baud
+        self.clock = clock
+        self.timeout = None
+        self.is_open = True
+
+    def write(self, data):
+        if(not self.is_open):
+            raise IOError("Emulated port is closed")
+        if(self.baudrate == self.emulator.baud):
+            self.emulator.receive(data, self.clock())
+        return len(data)
+
+    def read(self, size=1):
+        l_out = bytes(self.emulator.replies[0:size])
+        del self.emulator.replies[0:size]
+        return l_out
+
+    def close(self):
+        self.is_open = False
+
+########################################################################
+### COMMAND LINE
+########################################################################
+#Runs a show straight through on the headless engine twice over: once the
+#normal way, and once in firmware fade mode against the emulator, and
+#compares what each would put on the DMX line and what it cost on the serial link.
+def compare_show(cue_list, sec_per_frame=0.05, hold_time=1.0, max_time=3600.0):
+    l_num_ch = min(len(cue_list[0].DMX_VALS), c_emulator_max_ch)
+    l_clock = lx_clock.Virtual_Clock()
+    l_emulator = Firmware_Emulator()
+    l_port = lx_serial_protocol.open_framed_serial_port("emulator", clock = l_clock,
+        raw_opener = lambda name, baud, timeout: l_emulator.open_port(name, baud, timeout, l_clock))
+    l_link = lx_serial_protocol.Framed_Serial_Output(l_port)
+    l_sender = Firmware_Fade_Sender(l_link, l_num_ch, l_clock)
+    l_engine = lx_engine.Playback_Engine(cue_list, len(cue_list[0].DMX_VALS), clock = l_clock)
+    l_engine.transition_listener = lambda e, go_time: l_sender.fade(e.cur_out, e.ch_states, e.cue_list[e.cur_cue_index], e.transition_start_time)
+    l_stats = {"frames": 0, "max_error": 0, "end_errors": 0, "streamed_bytes": 0}
+    l_idle_since = None
+    l_frame_index = 0
+    while(l_frame_index*sec_per_frame <= max_time):
+        l_now = l_frame_index*sec_per_frame
+        l_clock.advance_to(l_now)
+        if(l_engine.is_idle()):
+            if(l_idle_since == None):
+                l_idle_since = l_now
+            if(l_now - l_idle_since >= hold_time):
+                if(not l_engine.go(l_now)):
+                    break
+                l_idle_since = None
+        else:
+            l_idle_since = None
+        l_frame = l_engine.step(l_now)
+        l_sender.frame(l_frame, l_engine.ch_states, l_engine.state != lx_engine.c_STATE_STANDBY)
+        l_fw_levels = l_emulator.levels(l_now)
+        l_error = max([abs(l_frame[i] - l_fw_levels[i]) for i in range(0, l_num_ch)])
+        l_stats["max_error"] = max(l_stats["max_error"], l_error)
+        if(l_engine.state == lx_engine.c_STATE_STANDBY and l_error != 0):
+            l_stats["end_errors"] += 1
+        l_stats["streamed_bytes"] += len(lx_serial_protocol.encode_levels_frame(l_frame[0:l_num_ch]))
+        l_stats["frames"] += 1
+        l_frame_index += 1
+    l_stats["fade_mode_bytes"] = l_emulator.bytes_received
+    l_stats["bad_frames"] = l_emulator.bad_frames
+    l_stats.update(l_sender.stats())
+    return l_stats
+
+def main(argv):
+    parser = argparse.ArgumentParser(description = "Compare host-streamed fades with firmware fades on an emulated arduino")
+    parser.add_argument("show_files", nargs = "*", help = ".plx files (a random 150 channel show if none)")
+    parser.add_argument("--hold", type = float, default = 1.0, help = "seconds to hold each cue before the next GO")
+    parser.add_argument("--frame-time", type = float, default = 0.05)
+    args = parser.parse_args(argv)
+
+    l_shows = [(l_fname, lx_show_file.load_show_file(l_fname)) for l_fname in args.show_files]
+    if(len(l_shows) == 0):
+        import lx_render
+        l_shows = [("random show", lx_render.make_bench_show(c_emulator_max_ch, 20, 3.0))]
+    l_ret = 0
+    for (l_name, l_cue_list) in l_shows:
+        l_stats = compare_show(l_cue_list, args.frame_time, args.hold)
+        print("{}: {} frames, {} GOs".format(l_name, l_stats["frames"], l_stats["fades"]))
+        print("  serial bytes streamed: {}, firmware fades: {} ({:.1f}%)".format(l_stats["streamed_bytes"], l_stats["fade_mode_bytes"],
+            100.0*l_stats["fade_mode_bytes"]/max(1, l_stats["streamed_bytes"])))
+        print("  worst level difference mid-fade: {}, frames off while idle: {}, bad frames: {}".format(
+            l_stats["max_error"], l_stats["end_errors"], l_stats["bad_frames"]))
+        if(l_stats["end_errors"] > 0 or l_stats["bad_frames"] > 0):
+            l_ret = 1
+    return l_ret
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))
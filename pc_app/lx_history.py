@@ -0,0 +1,200 @@
+########################################################################
+########################################################################
+###
+### Python_LX - A simple, Python and Arduino based DMX512 lighting console
+### by Chris Gerth - Summer/Fall 2014
+###
+### File - lx_history.py - undo/redo for cue list edits
+### Dependencies - none
+###
+########################################################################
+########################################################################
+
+import sys, time, threading, argparse #system dependencies
+
+#Every cue list edit (Record Cue, ...) saves a snapshot of the whole list.
+#Cues are never changed once built - an edit replaces the Cue object - so
+#snapshots can share them. A snapshot is a tuple of chunks (tuples of up to
+#c_chunk_size cue references), and each new snapshot reuses every chunk of
+#the previous one that the edit didn't touch. An edit therefore costs about
+#c_chunk_size + len(list)/c_chunk_size references of new memory however long
+#the show is, instead of a deep copy of every cue and every level.
+#The live g_cue_list stays a plain list; the history works out what changed
+#by comparing cue identities against the last snapshot.
+
+c_chunk_size = 32
+c_default_depth = 1000 #edits kept for undo
+
+class Cue_Snapshot:
+    def __init__(self, chunks):
+        self.chunks = tuple(chunks)
+        self.length = sum(len(c) for c in self.chunks)
+
+    def __len__(self):
+        return self.length
+
+    def __getitem__(self, index):
+        if(index < 0):
+            index += self.length
+        for l_chunk in self.chunks:
+            if(index < len(l_chunk)):
+                return l_chunk[index]
+            index -= len(l_chunk)
+        raise IndexError("Cue_Snapshot index out of range")
+
+    def to_list(self):
+        l_out = []
+        for l_chunk in self.chunks:
+            l_out.extend(l_chunk)
+        return l_out
+
+def _split_chunks(items):
+    return [tuple(items[i:i+c_chunk_size]) for i in range(0, len(items), c_chunk_size)]
+
+#snapshot of cue_list, sharing every chunk of base that's unchanged
+def make_snapshot(cue_list, base=None):
+    l_new = list(cue_list)
+    if(base == None or len(base) == 0):
+        return Cue_Snapshot(_split_chunks(l_new))
+    l_old = base.to_list()
+    l_old_len = len(l_old)
+    l_new_len = len(l_new)
+    l_min_len = min(l_old_len, l_new_len)
+    #same cue objects at the front and at the back
+    l_prefix = 0
+    while(l_prefix < l_min_len and l_old[l_prefix] is l_new[l_prefix]):
+        l_prefix += 1
+    l_suffix = 0
+    while(l_suffix < l_min_len - l_prefix and l_old[l_old_len-1-l_suffix] is l_new[l_new_len-1-l_suffix]):
+        l_suffix += 1
+
+    #old chunks entirely inside the unchanged front...
+    l_chunks = []
+    l_pos = 0
+    i = 0
+    while(i < len(base.chunks) and l_pos + len(base.chunks[i]) <= l_prefix):
+        l_chunks.append(base.chunks[i])
+        l_pos += len(base.chunks[i])
+        i += 1
+    #...and the unchanged back
+    l_tail = []
+    l_old_end = l_old_len
+    j = len(base.chunks) - 1
+    while(j >= i and l_old_end - len(base.chunks[j]) >= l_old_len - l_suffix):
+        l_old_end -= len(base.chunks[j])
+        l_tail.append(base.chunks[j])
+        j -= 1
+    #everything between gets new chunks
+    l_chunks.extend(_split_chunks(l_new[l_pos:l_new_len - (l_old_len - l_old_end)]))
+    l_chunks.extend(reversed(l_tail))
+    return Cue_Snapshot(l_chunks)
+
+#States are (snapshot, current cue index, label). label names the edit that
+#produced the state, so undo can say what it's undoing.
+class Cue_History:
+    def __init__(self, max_depth=c_default_depth):
+        self.lock = threading.Lock()
+        self.max_depth = max_depth
+        self.undo_stack = []
+        self.redo_stack = []
+        self.current = None
+
+    #start over from cue_list, e.g. after opening a show
+    def reset(self, cue_list, cur_cue_index):
+        self.lock.acquire()
+        self.undo_stack = []
+        self.redo_stack = []
+        self.current = (make_snapshot(cue_list), cur_cue_index, "")
+        self.lock.release()
+
+    #call after each edit
+    def record(self, cue_list, cur_cue_index, label):
+        self.lock.acquire()
+        l_base = None
+        if(self.current != None):
+            l_base = self.current[0]
+            self.undo_stack.append(self.current)
+            if(len(self.undo_stack) > self.max_depth):
+                self.undo_stack.pop(0)
+        self.current = (make_snapshot(cue_list, l_base), cur_cue_index, label)
+        self.redo_stack = []
+        self.lock.release()
+
+    def can_undo(self):
+        return len(self.undo_stack) > 0
+
+    def can_redo(self):
+        return len(self.redo_stack) > 0
+
+    #returns (cue list, cur cue index, label of the edit undone), or None if there's nothing to undo
+    def undo(self):
+        self.lock.acquire()
+        l_result = None
+        if(len(self.undo_stack) > 0):
+            l_undone = self.current
+            self.redo_stack.append(l_undone)
+            self.current = self.undo_stack.pop()
+            l_result = (self.current[0].to_list(), self.current[1], l_undone[2])
+        self.lock.release()
+        return l_result
+
+    #returns (cue list, cur cue index, label of the edit redone), or None
+    def redo(self):
+        self.lock.acquire()
+        l_result = None
+        if(len(self.redo_stack) > 0):
+            self.undo_stack.append(self.current)
+            self.current = self.redo_stack.pop()
+            l_result = (self.current[0].to_list(), self.current[1], self.current[2])
+        self.lock.release()
+        return l_result
+
+    #memory actually held: states, distinct chunks, and cue references in those chunks
+    def stats(self):
+        self.lock.acquire()
+        l_states = self.undo_stack + self.redo_stack
+        if(self.current != None):
+            l_states = l_states + [self.current]
+        l_chunks = {}
+        l_full_refs = 0
+        for (l_snapshot, l_index, l_label) in l_states:
+            l_full_refs += len(l_snapshot)
+            for l_chunk in l_snapshot.chunks:
+                l_chunks[id(l_chunk)] = len(l_chunk)
+        self.lock.release()
+        return {"states": len(l_states), "chunks": len(l_chunks), "refs": sum(l_chunks.values()),
+                "unshared_refs": l_full_refs}
+
+########################################################################
+### COMMAND LINE
+########################################################################
+#simulate a long programming session and show what the history costs
+def main(argv):
+    import random
+    parser = argparse.ArgumentParser(description = "Measure python_lx undo history memory")
+    parser.add_argument("--cues", type = int, default = 500)
+    parser.add_argument("--edits", type = int, default = 1000)
+    args = parser.parse_args(argv)
+
+    l_rand = random.Random(0)
+    l_cue_list = [object() for i in range(0, args.cues)] #stand-ins, the history only cares about identity
+    l_history = Cue_History(max_depth = args.edits)
+    l_history.reset(l_cue_list, 0)
+    l_start = time.time()
+    for i in range(0, args.edits):
+        l_index = l_rand.randrange(0, len(l_cue_list))
+        if(i % 3 == 0):
+            l_cue_list.insert(l_index, object())
+        else:
+            l_cue_list[l_index] = object()
+        l_history.record(l_cue_list, l_index, "edit")
+    l_per_edit = (time.time() - l_start)/args.edits
+    l_stats = l_history.stats()
+    print("{} edits on a {} cue show: {:.2f} ms per edit".format(args.edits, args.cues, l_per_edit*1000.0))
+    print("{} snapshots hold {} cue references in {} chunks ({} with full copies, {:.1f}x less)".format(
+        l_stats["states"], l_stats["refs"], l_stats["chunks"], l_stats["unshared_refs"],
+        float(l_stats["unshared_refs"])/max(1, l_stats["refs"])))
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))
@@ -0,0 +1,135 @@
+########################################################################
+########################################################################
+###
+### Python_LX - A simple, Python and Arduino based DMX512 lighting console
+### by Chris Gerth - Summer/Fall 2014
+###
+### File - lx_masters.py - grand master, blackout and submasters
+### Dependencies - none
+###
+########################################################################
+########################################################################
+
+import sys, time, threading, argparse #system dependencies
+
+#The last thing a frame goes through before the serial port:
+#
+#   out = grand_master * HTP(frame, sub_1 * fader_1, ..., sub_n * fader_n)
+#   or all zeros in blackout
+#
+#A submaster is a stored set of levels (usually grabbed from the stage) that
+#its fader brings in highest-takes-precedence on top of whatever the cues are
+#doing. Nothing here ever touches cue data or g_cur_dmx_output - it works on
+#the outgoing copy of the frame.
+#All the multiplying happens when a fader moves, not every frame:
+#  - the submasters are pre-scaled and HTP-combined into one layer
+#  - the grand master becomes a 256 entry translate table
+#so a frame is one map(max) for the layer and one bytearray.translate() for
+#the grand master, both of which run in C. With everything at full and no
+#submasters up, apply() hands the frame back untouched.
+
+c_full = 255
+
+class Master_Stage:
+    def __init__(self, num_ch, num_submasters=4):
+        self.lock = threading.Lock()
+        self.num_ch = num_ch
+        self.grand_master = c_full
+        self.blackout = False
+        self.sub_levels = [[0]*num_ch for i in range(0, num_submasters)]
+        self.sub_faders = [0]*num_submasters
+        self.gm_table = None #None = grand master at full
+        self.sub_layer = None #None = no submaster contributing anything
+
+    def num_submasters(self):
+        return len(self.sub_faders)
+
+    #0-255
+    def set_grand_master(self, level):
+        self.lock.acquire()
+        self.grand_master = max(0, min(int(level), c_full))
+        if(self.grand_master == c_full):
+            self.gm_table = None
+        else:
+            self.gm_table = bytes(bytearray([(v*self.grand_master + c_full//2)//c_full for v in range(0, 256)]))
+        self.lock.release()
+
+    def set_blackout(self, on):
+        self.blackout = bool(on)
+
+    def toggle_blackout(self):
+        self.blackout = not self.blackout
+        return self.blackout
+
+    #0-255
+    def set_submaster_fader(self, sub_index, level):
+        self.lock.acquire()
+        self.sub_faders[sub_index] = max(0, min(int(level), c_full))
+        self._build_sub_layer()
+        self.lock.release()
+
+    #levels a submaster brings up at full, one per channel
+    def set_submaster_levels(self, sub_index, levels):
+        self.lock.acquire()
+        self.sub_levels[sub_index] = [max(0, min(int(round(v)), c_full)) for v in levels[0:self.num_ch]]
+        self.sub_levels[sub_index].extend([0]*(self.num_ch - len(self.sub_levels[sub_index])))
+        self._build_sub_layer()
+        self.lock.release()
+
+    #True if apply() would change anything
+    def is_active(self):
+        return self.blackout or self.gm_table != None or self.sub_layer != None
+
+    #returns the frame as it should be transmitted. frame itself isn't changed.
+    def apply(self, frame):
+        if(self.blackout):
+            return [0]*len(frame)
+        l_sub_layer = self.sub_layer #both get replaced whole when a fader moves, so no lock needed here
+        l_gm_table = self.gm_table
+        l_out = frame
+        if(l_sub_layer != None):
+            l_out = list(map(max, l_out, l_sub_layer))
+        if(l_gm_table != None):
+            l_out = list(bytearray(l_out).translate(l_gm_table))
+        return l_out
+
+    def _build_sub_layer(self):
+        l_layer = None
+        for i in range(0, len(self.sub_faders)):
+            l_fader = self.sub_faders[i]
+            if(l_fader == 0 or max(self.sub_levels[i]) == 0):
+                continue
+            l_scaled = [(v*l_fader + c_full//2)//c_full for v in self.sub_levels[i]]
+            if(l_layer == None):
+                l_layer = l_scaled
+            else:
+                l_layer = list(map(max, l_layer, l_scaled))
+        self.sub_layer = l_layer
+
+########################################################################
+### COMMAND LINE
+########################################################################
+#per-frame cost of the master stage with everything in use
+def main(argv):
+    parser = argparse.ArgumentParser(description = "Benchmark the python_lx master stage")
+    parser.add_argument("--channels", type = int, default = 512)
+    parser.add_argument("--submasters", type = int, default = 8)
+    parser.add_argument("--frames", type = int, default = 2000)
+    args = parser.parse_args(argv)
+
+    l_stage = Master_Stage(args.channels, args.submasters)
+    for i in range(0, args.submasters):
+        l_stage.set_submaster_levels(i, [(ch*7 + i*31) % 256 for ch in range(0, args.channels)])
+        l_stage.set_submaster_fader(i, 128 + i)
+    l_stage.set_grand_master(200)
+    l_frame = [ch % 256 for ch in range(0, args.channels)]
+    l_start = time.time()
+    for i in range(0, args.frames):
+        l_stage.apply(l_frame)
+    l_per_frame = (time.time() - l_start)/args.frames
+    print("{} channels, {} submasters up, grand master at {}: {:.3f} ms per frame".format(
+        args.channels, args.submasters, l_stage.grand_master, l_per_frame*1000.0))
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))
@@ -0,0 +1,418 @@
+########################################################################
+########################################################################
+###
+### Python_LX - A simple, Python and Arduino based DMX512 lighting console
+### by Chris Gerth - Summer/Fall 2014
+###
+### File - lx_monitor.py - stream the live output to other programs on
+###                        this machine
+### Dependencies - none
+###
+########################################################################
+########################################################################
+
+import sys, time, errno, struct, socket, select, threading, argparse #system dependencies
+import lx_clock
+
+#Set c_monitor_port in python_lx.py and whatever goes out the serial port is
+#also published on that TCP port (localhost only), so extra level displays or
+#logging tools can watch the show without touching the console's GUI.
+#
+#The output loop never waits on a subscriber. All it does per frame is
+#publish(), which drops a copy of the frame in a slot. A publisher thread
+#picks up whatever is in the slot at most c_default_rate times a second and
+#sends each subscriber the channels that changed since the last update that
+#subscriber got. A subscriber still busy with its previous update just gets
+#skipped (the next one it does get covers everything it missed); one that
+#falls c_max_backlog bytes behind, or makes no progress for c_drop_after
+#seconds, is disconnected.
+
+c_default_port = 5742
+c_default_rate = 20.0 #updates per second, at most
+c_heartbeat_period = 1.0 #seconds between updates sent even if nothing changed
+c_max_backlog = 65536 #bytes queued for one subscriber before it's dropped
+c_drop_after = 5.0 #seconds a subscriber can make no progress before it's dropped
+c_would_block = (errno.EAGAIN, errno.EWOULDBLOCK, getattr(errno, "WSAEWOULDBLOCK", errno.EAGAIN)) #socket full, try later
+c_bench_give_up = 60.0 #seconds bench waits for the stalled subscriber to be dropped
+c_send_buffer = 16384 #kernel send buffer per subscriber - small, so a slow one shows up as slow instead of queueing stale frames
+
+########################################################################
+### STREAM FORMAT
+########################################################################
+#Each message is a header then a body:
+#  header: <type byte> <uint32 sequence> <double output time> <uint16 count>
+#  FULL:   count level bytes, channel 1 first
+#  DELTA:  count (uint16 channel index, 0-based) (level byte) pairs
+#A new subscriber gets a FULL first, after that whichever of FULL/DELTA is
+#smaller. Sequence numbers count publisher updates, so a jump means updates
+#were skipped for this subscriber. The output time is lx_clock.monotonic() in
+#the output loop when the frame was made. An empty DELTA is a heartbeat.
+
+c_MSG_FULL = 1
+c_MSG_DELTA = 2
+
+c_header = struct.Struct("<BIdH")
+c_delta_item = struct.Struct("<HB")
+
+#message bringing a subscriber that has prev_levels (None for nothing yet) up to levels
+def encode_update(seq, frame_time, levels, prev_levels):
+    if(prev_levels != None and len(prev_levels) == len(levels)):
+        l_changed = [i for i in range(0, len(levels)) if levels[i] != prev_levels[i]]
+        if(len(l_changed)*c_delta_item.size < len(levels)):
+            l_msg = bytearray(c_header.pack(c_MSG_DELTA, seq, frame_time, len(l_changed)))
+            for i in l_changed:
+                l_msg += c_delta_item.pack(i, levels[i])
+            return bytes(l_msg)
+    return c_header.pack(c_MSG_FULL, seq, frame_time, len(levels)) + bytes(bytearray(levels))
+
+########################################################################
+### PUBLISHER
+########################################################################
+class _Subscriber:
+    def __init__(self, sock, address, now):
+        self.sock = sock
+        self.address = address
+        self.out = b"" #encoded but not yet accepted by the socket
+        self.levels = None #what this subscriber will have once out is sent
+        self.last_progress = now
+        self.last_msg_time = 0.0
+        self.skipped = 0
+
+class Monitor_Publisher(threading.Thread):
+    def __init__(self, port=c_default_port, max_rate=c_default_rate, host="127.0.0.1"):
+        threading.Thread.__init__(self)
+        self.name = "PYTHON_LX_MONITOR"
+        self.daemon = True
+        self.period = 1.0/max_rate
+        self.latest = None #(levels, output time) - written by the output loop, read here
+        self.seq = 0
+        self.subscribers = []
+        self.stats = {"updates": 0, "skipped": 0, "dropped": 0, "bytes": 0}
+        self.kill = False
+        self.listen_sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        self.listen_sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        try:
+            self.listen_sock.bind((host, port))
+        except socket.error:
+            self.listen_sock.close()
+            raise
+        self.listen_sock.listen(8)
+        self.listen_sock.setblocking(0)
+        self.port = self.listen_sock.getsockname()[1] #the real one, if port was 0
+
+    #called by the output loop every frame - a copy and one assignment, never blocks
+    def publish(self, levels, frame_time=None):
+        if(frame_time == None):
+            frame_time = lx_clock.monotonic()
+        self.latest = (list(levels), frame_time)
+
+    def close(self):
+        self.kill = True
+        if(self.is_alive()):
+            self.join(1.0)
+
+    def subscriber_count(self):
+        return len(self.subscribers)
+
+    def run(self):
+        l_next_update = lx_clock.monotonic()
+        l_sent = None #the frame last sent out, so an unchanged frame isn't re-encoded
+        try:
+            while(not self.kill):
+                l_timeout = max(0.0, min(l_next_update - lx_clock.monotonic(), 0.1))
+                l_readers = [self.listen_sock] + [s.sock for s in self.subscribers]
+                l_writers = [s.sock for s in self.subscribers if len(s.out) > 0]
+                try:
+                    (l_readable, l_writable, l_errored) = select.select(l_readers, l_writers, [], l_timeout)
+                except (select.error, socket.error, ValueError):
+                    (l_readable, l_writable) = ([], []) #a subscriber went away mid-select, caught below
+                l_now = lx_clock.monotonic()
+                for l_sock in l_readable:
+                    if(l_sock is self.listen_sock):
+                        self._accept(l_now)
+                    else:
+                        self._read(self._find(l_sock))
+                for l_sock in l_writable:
+                    self._flush(self._find(l_sock), l_now)
+                if(l_now >= l_next_update):
+                    l_latest = self.latest
+                    if(l_latest != None and (l_sent == None or l_latest[0] != l_sent[0])):
+                        self.seq += 1
+                        l_sent = l_latest
+                    if(l_sent != None):
+                        self._send_update(l_sent, l_now)
+                    l_next_update += self.period
+                    if(l_now > l_next_update):
+                        l_next_update = l_now
+        finally:
+            for l_sub in list(self.subscribers):
+                self._drop(l_sub, False)
+            self.listen_sock.close()
+
+    def _find(self, sock):
+        for l_sub in self.subscribers:
+            if(l_sub.sock is sock):
+                return l_sub
+        return None
+
+    def _accept(self, now):
+        try:
+            (l_sock, l_address) = self.listen_sock.accept()
+        except socket.error:
+            return
+        l_sock.setblocking(0)
+        l_sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        l_sock.setsockopt(socket.SOL_SOCKET, socket.SO_SNDBUF, c_send_buffer)
+        self.subscribers.append(_Subscriber(l_sock, l_address, now))
+
+    #subscribers don't send anything, so readable means it hung up
+    def _read(self, sub):
+        if(sub == None):
+            return
+        try:
+            l_data = sub.sock.recv(4096)
+        except socket.error:
+            l_data = b""
+        if(len(l_data) == 0):
+            self._drop(sub, False)
+
+    def _flush(self, sub, now):
+        if(sub == None or len(sub.out) == 0):
+            return
+        try:
+            l_count = sub.sock.send(sub.out)
+        except socket.error as e:
+            if(e.args[0] in c_would_block):
+                return
+            self._drop(sub, False)
+            return
+        if(l_count > 0):
+            sub.out = sub.out[l_count:]
+            sub.last_progress = now
+            self.stats["bytes"] += l_count
+
+    def _send_update(self, latest, now):
+        (l_levels, l_frame_time) = latest
+        l_encoded = {} #id(prev levels) -> message, subscribers in step share one encode
+        for l_sub in list(self.subscribers):
+            if(len(l_sub.out) > 0):
+                #still sending the last one: skip it, or give up on it
+                if(len(l_sub.out) > c_max_backlog or now - l_sub.last_progress > c_drop_after):
+                    self._drop(l_sub, True)
+                else:
+                    l_sub.skipped += 1
+                    self.stats["skipped"] += 1
+                continue
+            if(l_sub.levels is l_levels and now - l_sub.last_msg_time < c_heartbeat_period):
+                continue #nothing new for it
+            l_key = id(l_sub.levels) if l_sub.levels is not l_levels else -1
+            l_msg = l_encoded.get(l_key)
+            if(l_msg == None):
+                if(l_sub.levels is l_levels):
+                    l_msg = c_header.pack(c_MSG_DELTA, self.seq, l_frame_time, 0)
+                else:
+                    l_msg = encode_update(self.seq, l_frame_time, l_levels, l_sub.levels)
+                l_encoded[l_key] = l_msg
+            l_sub.out = l_msg
+            l_sub.levels = l_levels
+            l_sub.last_msg_time = now
+            l_sub.last_progress = now
+            self._flush(l_sub, now)
+        self.stats["updates"] += 1
+
+    def _drop(self, sub, too_slow):
+        if(sub in self.subscribers):
+            self.subscribers.remove(sub)
+            if(too_slow):
+                self.stats["dropped"] += 1
+                print("Monitor: dropped {} - too slow".format(sub.address))
+        try:
+            sub.sock.close()
+        except socket.error:
+            pass
+
+#a started publisher, or None if the port can't be had (already in use, say) -
+#the show goes on without a monitor rather than not at all
+def start_publisher(port=c_default_port, max_rate=c_default_rate):
+    try:
+        l_pub = Monitor_Publisher(port, max_rate)
+    except socket.error as e:
+        print("Could not stream output to monitors on port " + str(port) + " (" + str(e) + "), running without them")
+        return None
+    l_pub.start()
+    return l_pub
+
+########################################################################
+### SUBSCRIBER
+########################################################################
+class Monitor_Client:
+    def __init__(self, host="127.0.0.1", port=c_default_port, timeout=None):
+        self.sock = socket.create_connection((host, port), timeout)
+        self.levels = None
+        self.seq = 0
+        self.frame_time = 0.0
+        self.missed_updates = 0 #skipped by the publisher because we were slow
+
+    #block for the next update. Returns the 0-based channels it changed (all of
+    #them for a FULL), or None once the publisher has gone away.
+    def read_update(self):
+        l_header = self._recv_exact(c_header.size)
+        if(l_header == None):
+            return None
+        (l_type, l_seq, l_frame_time, l_count) = c_header.unpack(l_header)
+        if(l_type == c_MSG_FULL):
+            l_body = self._recv_exact(l_count)
+            if(l_body == None):
+                return None
+            self.levels = list(bytearray(l_body))
+            l_changed = list(range(0, l_count))
+        else:
+            l_body = self._recv_exact(l_count*c_delta_item.size)
+            if(l_body == None):
+                return None
+            l_changed = []
+            for j in range(0, l_count):
+                (i, l_level) = c_delta_item.unpack_from(l_body, j*c_delta_item.size)
+                self.levels[i] = l_level
+                l_changed.append(i)
+        if(self.seq != 0 and l_seq > self.seq + 1):
+            self.missed_updates += l_seq - self.seq - 1
+        self.seq = l_seq
+        self.frame_time = l_frame_time
+        return l_changed
+
+    def _recv_exact(self, count):
+        l_buf = b""
+        while(len(l_buf) < count):
+            l_data = self.sock.recv(count - len(l_buf))
+            if(len(l_data) == 0):
+                return None
+            l_buf += l_data
+        return l_buf
+
+    def close(self):
+        self.sock.close()
+
+########################################################################
+### COMMAND LINE
+########################################################################
+def _watch(args):
+    l_client = Monitor_Client(args.host, args.port)
+    l_updates = 0
+    l_last_report = time.time()
+    while(True):
+        try:
+            l_changed = l_client.read_update()
+        except KeyboardInterrupt:
+            return 0
+        if(l_changed == None):
+            print("Publisher went away")
+            return 0
+        l_updates += 1
+        if(len(l_changed) > 0 and not args.quiet):
+            l_shown = " ".join("{}={}".format(i+1, l_client.levels[i]) for i in l_changed[0:16])
+            if(len(l_changed) > 16):
+                l_shown += " ..."
+            print("#{} {}".format(l_client.seq, l_shown))
+        if(time.time() - l_last_report >= 5.0):
+            l_age = ""
+            if(lx_clock.c_monotonic_is_system_wide):
+                l_age = ", latest frame {:.1f} ms old".format((lx_clock.monotonic() - l_client.frame_time)*1000.0)
+            print("{:.1f} updates/s, {} skipped by the publisher{}".format(l_updates/(time.time() - l_last_report), l_client.missed_updates, l_age))
+            l_updates = 0
+            l_last_report = time.time()
+
+def _log(args):
+    import lx_dmx_log
+    l_client = Monitor_Client(args.host, args.port)
+    l_client.read_update()
+    l_recorder = lx_dmx_log.DMX_Recorder(args.log_file, len(l_client.levels))
+    print("Logging to " + args.log_file + ", ctrl-c to stop")
+    try:
+        while(l_client.levels != None):
+            l_recorder.record(l_client.levels, l_client.frame_time)
+            if(l_client.read_update() == None):
+                break
+    except KeyboardInterrupt:
+        pass
+    l_recorder.close()
+    print("{} updates logged".format(l_recorder.frame_count))
+    return 0
+
+#a 40Hz fake output loop, some subscribers keeping up and one that never reads
+def _bench(args):
+    import random
+    l_pub = Monitor_Publisher(0, args.rate)
+    l_pub.start()
+    l_clients = [Monitor_Client("127.0.0.1", l_pub.port) for i in range(0, args.clients)]
+    l_stalled = socket.create_connection(("127.0.0.1", l_pub.port))
+    l_stalled.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, 4096)
+    l_counts = [0]*len(l_clients)
+    def reader(n):
+        while(l_clients[n].read_update() != None):
+            l_counts[n] += 1
+    l_readers = [threading.Thread(target = reader, args = (n,)) for n in range(0, len(l_clients))]
+    for l_thread in l_readers:
+        l_thread.daemon = True
+        l_thread.start()
+
+    l_rand = random.Random(0)
+    l_churn = args.churn if args.churn != None else args.channels
+    l_levels = [0]*args.channels
+    l_costs = []
+    l_next = lx_clock.monotonic()
+    l_end = l_next + args.seconds
+    l_give_up = l_next + max(args.seconds, c_bench_give_up)
+    l_drop_time = None
+    #at least --seconds, then on until the stall has really happened
+    while(l_next < l_end or (l_drop_time == None and l_next < l_give_up)):
+        if(l_drop_time == None and l_pub.stats["dropped"] > 0):
+            l_drop_time = l_next - (l_end - args.seconds)
+        time.sleep(max(0.0, l_next - lx_clock.monotonic()))
+        for i in range(0, l_rand.randint(0, l_churn)):
+            l_levels[l_rand.randrange(0, args.channels)] = l_rand.randint(0, 255)
+        l_start = lx_clock.monotonic()
+        l_pub.publish(l_levels, l_start)
+        l_costs.append(lx_clock.monotonic() - l_start)
+        l_next += 0.025
+    time.sleep(0.2)
+    l_final = [list(c.levels) == l_levels for c in l_clients]
+    l_pub.close()
+    l_costs.sort()
+    print("publish() in the output loop: p50 {:.1f} us, p99 {:.1f} us, max {:.1f} us".format(
+        l_costs[len(l_costs)//2]*1e6, l_costs[int(len(l_costs)*0.99)]*1e6, l_costs[-1]*1e6))
+    print("{} publisher updates, {} received by the {} clients keeping up, {} bytes sent".format(
+        l_pub.stats["updates"], sum(l_counts), len(l_clients), l_pub.stats["bytes"]))
+    if(l_drop_time != None):
+        print("stalled subscriber: {} updates skipped, dropped after {:.1f} s".format(l_pub.stats["skipped"], l_drop_time))
+    else:
+        print("stalled subscriber: {} updates skipped, never dropped in {:.0f} s - try more --churn".format(
+            l_pub.stats["skipped"], max(args.seconds, c_bench_give_up)))
+    print("clients ending on the final frame: {} of {}".format(l_final.count(True), len(l_final)))
+    return 0 if all(l_final) and l_drop_time != None else 1
+
+def main(argv):
+    parser = argparse.ArgumentParser(description = "Watch the live output of python_lx")
+    parser.add_argument("--host", default = "127.0.0.1")
+    parser.add_argument("--port", type = int, default = c_default_port)
+    parser.set_defaults(quiet = False)
+    l_subparsers = parser.add_subparsers(dest = "command")
+    l_watch = l_subparsers.add_parser("watch", help = "print channel changes as they happen")
+    l_watch.add_argument("-q", "--quiet", action = "store_true", help = "only the rate/latency line")
+    l_log = l_subparsers.add_parser("log", help = "record the stream to a .plxlog (see lx_dmx_log.py)")
+    l_log.add_argument("log_file")
+    l_bench = l_subparsers.add_parser("bench", help = "publisher against a fake output loop, with one stalled subscriber")
+    l_bench.add_argument("--clients", type = int, default = 4)
+    l_bench.add_argument("--channels", type = int, default = 512)
+    l_bench.add_argument("--seconds", type = float, default = 5.0, help = "at least - it keeps going until the stalled subscriber is dropped")
+    l_bench.add_argument("--rate", type = float, default = c_default_rate)
+    l_bench.add_argument("--churn", type = int, default = None, help = "most channels changed per frame (default: all of them)")
+    args = parser.parse_args(argv)
+    if(args.command == "log"):
+        return _log(args)
+    elif(args.command == "bench"):
+        return _bench(args)
+    return _watch(args)
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))
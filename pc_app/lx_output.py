@@ -0,0 +1,207 @@
+########################################################################
+########################################################################
+###
+### Python_LX - A simple, Python and Arduino based DMX512 lighting console
+### by Chris Gerth - Summer/Fall 2014
+###
+### File - lx_output.py - DMX output backends
+### Dependencies - pySerial (serial backends only)
+###
+########################################################################
+########################################################################
+
+#An output backend is anything with a write_frame(levels) and a close() method.
+#levels is a sequence of ints in [0,255], index 0 is DMX channel 1.
+#The realtime loop and the log replayer both talk to the hardware through these,
+#so a recorded show can be pushed into any of them.
+
+import threading, collections #system dependencies
+import lx_clock
+
+c_legacy_start_of_frame = 0x10 #must match START_OF_FRAME in python_lx_arduino.ino
+c_reconnect_period = 1.0 #seconds between attempts to reopen a lost serial port
+c_write_timeout = 0.5 #seconds before a stuck write gives up
+
+#Original protocol: 0x10 start byte, then one byte per channel.
+#0x10 can't appear as a level, so those get bumped to 0x11 on the wire.
+def encode_legacy_frame(levels):
+    l_buf = bytearray([c_legacy_start_of_frame])
+    l_buf.extend(bytearray(levels).replace(b'\x10', b'\x11')) #make sure we don't tx the start-of-frame char
+    return bytes(l_buf)
+
+class Legacy_Serial_Output:
+    def __init__(self, ser_port):
+        self.ser_port = ser_port
+
+    def write_frame(self, levels):
+        self.ser_port.write(encode_legacy_frame(levels)) #one write per frame, start byte included
+
+    def close(self):
+        self.ser_port.close()
+
+#Throws frames away. Handy for replaying logs without a rig attached.
+class Null_Output:
+    def __init__(self):
+        self.frame_count = 0
+
+    def write_frame(self, levels):
+        self.frame_count += 1
+
+    def close(self):
+        pass
+
+#Prints each frame as a line of levels - poor man's monitor
+class Print_Output:
+    def __init__(self, out_file=None):
+        self.out_file = out_file
+
+    def write_frame(self, levels):
+        l_line = " ".join("{:3d}".format(v) for v in levels)
+        if(self.out_file is None):
+            print(l_line)
+        else:
+            self.out_file.write(l_line + "\n")
+
+    def close(self):
+        pass
+
+def open_serial_port(port_name, baud=115200, write_timeout=None):
+    import serial #only needed when there is real hardware
+    if(write_timeout == None):
+        return serial.Serial(port_name, baud)
+    try:
+        return serial.Serial(port_name, baud, write_timeout = write_timeout)
+    except TypeError:
+        return serial.Serial(port_name, baud, writeTimeout = write_timeout) #pyserial 2.x spelling
+
+########################################################################
+### SERIAL WRITER
+########################################################################
+#Output backend that owns the serial port in a thread of its own.
+#write_frame() never blocks the frame loop: it encodes the frame into one
+#buffer and drops it in a single "latest frame" slot. If the writer hasn't
+#sent the previous frame yet, that frame is stale and gets replaced (and
+#counted), rather than queued up behind a slow USB link. Each frame goes out
+#in one write() call, and the write is timed. If a write fails (cable
+#pulled), the port is closed and reopened every c_reconnect_period until it
+#comes back. Frames that arrive while the port is down are dropped.
+#Commands (send_command) are different: they go out in order, ahead of the
+#latest frame, and are never replaced by something newer. They're lost with
+#the port too, though - anything that can't be resent as part of the next
+#frame should watch reconnects and resend after one (Firmware_Fade_Sender does).
+class Serial_Writer(threading.Thread):
+    def __init__(self, port_name, baud=115200, encoder=encode_legacy_frame, port_opener=open_serial_port, clock=lx_clock.monotonic):
+        threading.Thread.__init__(self)
+        self.name = "PYTHON_LX_SERIAL_WRITER"
+        self.daemon = True
+        self.port_name = port_name
+        self.baud = baud
+        self.encoder = encoder
+        self.port_opener = port_opener
+        self.clock = clock
+        self.ser_port = None
+        self.slot = None #encoded frame waiting to go out
+        self.commands = collections.deque() #encoded commands waiting to go out, in order
+        self.slot_cond = threading.Condition(threading.Lock())
+        self.kill = False
+        self.last_connect_attempt = None
+        #statistics
+        self.frames_written = 0
+        self.frames_dropped = 0 #replaced before they were sent
+        self.frames_lost = 0 #arrived while disconnected
+        self.write_errors = 0
+        self.reconnects = 0
+        self.last_write_time = 0.0
+        self.max_write_time = 0.0
+
+    #try to open the port right away so startup can tell the user if it's missing
+    def connect(self):
+        self.last_connect_attempt = self.clock()
+        try:
+            self.ser_port = self.port_opener(self.port_name, self.baud, c_write_timeout)
+        except Exception:
+            self.ser_port = None
+        return self.ser_port != None
+
+    def write_frame(self, levels):
+        l_buf = self.encoder(levels)
+        self.slot_cond.acquire()
+        if(self.slot != None):
+            self.frames_dropped += 1
+        self.slot = l_buf
+        self.slot_cond.notify()
+        self.slot_cond.release()
+
+    #already-encoded bytes that must not be dropped just because a newer one came along
+    def send_command(self, buf):
+        self.slot_cond.acquire()
+        self.commands.append(buf)
+        self.slot_cond.notify()
+        self.slot_cond.release()
+
+    def close(self):
+        self.slot_cond.acquire()
+        self.kill = True
+        self.slot_cond.notify()
+        self.slot_cond.release()
+        if(self.is_alive()):
+            self.join()
+        self._drop_port()
+
+    def is_connected(self):
+        return self.ser_port != None
+
+    def stats(self):
+        return {"written": self.frames_written, "dropped": self.frames_dropped, "lost": self.frames_lost,
+                "errors": self.write_errors, "reconnects": self.reconnects, "connected": self.is_connected(),
+                "last_write_time": self.last_write_time, "max_write_time": self.max_write_time}
+
+    def run(self):
+        while(True):
+            self.slot_cond.acquire()
+            while(self.slot == None and len(self.commands) == 0 and not self.kill):
+                self.slot_cond.wait(c_reconnect_period)
+                if(self.ser_port == None):
+                    break #go try to reconnect even if no frames are coming in
+            if(self.kill):
+                self.slot_cond.release()
+                return
+            l_bufs = list(self.commands)
+            self.commands.clear()
+            if(self.slot != None):
+                l_bufs.append(self.slot)
+            self.slot = None
+            self.slot_cond.release()
+
+            if(self.ser_port == None):
+                l_now = self.clock()
+                if(self.last_connect_attempt == None or l_now - self.last_connect_attempt >= c_reconnect_period):
+                    if(self.connect()):
+                        self.reconnects += 1
+                        print("Serial port " + str(self.port_name) + " reconnected")
+            if(len(l_bufs) == 0):
+                continue
+            if(self.ser_port == None):
+                self.frames_lost += len(l_bufs)
+                continue
+
+            l_start = self.clock()
+            try:
+                self.ser_port.write(b"".join(l_bufs))
+            except Exception:
+                self.write_errors += 1
+                print("Error while trying to write to serial port!!! Will keep trying to reconnect.")
+                self._drop_port()
+                continue
+            self.last_write_time = self.clock() - l_start
+            self.max_write_time = max(self.max_write_time, self.last_write_time)
+            self.frames_written += 1
+
+    def _drop_port(self):
+        l_port = self.ser_port
+        self.ser_port = None
+        if(l_port != None):
+            try:
+                l_port.close()
+            except Exception:
+                pass
@@ -0,0 +1,364 @@
+########################################################################
+########################################################################
+###
+### Python_LX - A simple, Python and Arduino based DMX512 lighting console
+### by Chris Gerth - Summer/Fall 2014
+###
+### File - lx_output_process.py - runs frame generation and serial output
+###                                in a process of its own
+### Dependencies - pySerial
+###
+########################################################################
+########################################################################
+
+import os, sys, time, struct, multiprocessing #system dependencies
+import lx_clock, lx_engine, lx_serial_protocol, lx_show_file, lx_dmx_log, lx_firmware_fade, lx_effects, lx_masters, lx_patch, lx_monitor
+
+#The realtime thread in python_lx.py shares the GIL with Tk and every button
+#handler, so a dialog box or a garbage collection can make it miss frames.
+#This moves the Playback_Engine and the serial port into a child process.
+#The GUI talks to it through shared memory only:
+#  - command ring: GUI -> output process, GO/BACK/GoTo/Set Ch/etc
+#  - frame buffer: output process -> GUI, current levels + channel states + status
+#Whole cue lists are too big for the ring, they go over a pipe after each edit,
+#and so do effect definitions and master/submaster moves.
+#
+#The pipe and the ring aren't ordered against each other, so each cue list
+#carries a generation number and every ring command the generation that was
+#current when it was sent. A command newer than the loaded cue list waits for
+#that list to be read out of the pipe, so a GO right after Record Cue always
+#runs against the new cue.
+
+########################################################################
+### COMMAND RING
+########################################################################
+c_CMD_GO = 1
+c_CMD_BACK = 2
+c_CMD_GOTO = 3
+c_CMD_SET_CH = 4
+c_CMD_RELEASE = 5
+c_CMD_SNAP = 6
+c_CMD_QUIT = 7
+
+c_ring_size = 16384 #bytes. Plenty - the output process drains it every frame.
+
+#Single-producer, single-consumer byte ring in shared memory. Each message is a
+#2-byte length then the payload. The writer only moves head, the reader only
+#moves tail, and each only publishes its index after the bytes are in place,
+#so no lock is shared between the processes.
+class Command_Ring:
+    def __init__(self, size=c_ring_size):
+        self.size = size
+        self.buf = multiprocessing.RawArray('B', size)
+        self.head = multiprocessing.RawValue('l', 0) #next byte the writer fills
+        self.tail = multiprocessing.RawValue('l', 0) #next byte the reader takes
+
+    def put(self, msg):
+        l_data = bytearray(struct.pack("<H", len(msg))) + bytearray(msg)
+        l_head = self.head.value
+        l_free = (self.tail.value - l_head - 1) % self.size
+        if(len(l_data) > l_free):
+            return False #full - caller decides whether that matters
+        for b in l_data:
+            self.buf[l_head] = b
+            l_head = (l_head + 1) % self.size
+        self.head.value = l_head
+        return True
+
+    def get(self):
+        l_tail = self.tail.value
+        if(l_tail == self.head.value):
+            return None
+        l_len = self.buf[l_tail] | (self.buf[(l_tail+1) % self.size] << 8)
+        l_tail = (l_tail + 2) % self.size
+        l_msg = bytearray(l_len)
+        for i in range(0, l_len):
+            l_msg[i] = self.buf[l_tail]
+            l_tail = (l_tail + 1) % self.size
+        self.tail.value = l_tail
+        return bytes(l_msg)
+
+########################################################################
+### FRAME BUFFER
+########################################################################
+#status slots
+c_STATUS_STATE = 0
+c_STATUS_CUE_INDEX = 1
+c_STATUS_FRAME_COUNT = 2
+c_STATUS_MISSED_FRAMES = 3
+c_STATUS_SIZE = 4
+
+#Levels, channel states and status written by the output process once per frame.
+#Guarded by a sequence counter (seqlock): the writer makes it odd while it
+#writes and even when it's done, and a reader retries if it saw an odd count or
+#the count moved under it. The writer never waits on the GUI. If the output
+#process died mid-write the count stays odd for good, so a reader gives up
+#after c_max_read_tries and gets the last frame it read cleanly.
+c_max_read_tries = 100 #a publish takes microseconds
+
+class Frame_Buffer:
+    def __init__(self, num_ch):
+        self.num_ch = num_ch
+        self.seq = multiprocessing.RawValue('l', 0)
+        self.levels = multiprocessing.RawArray('B', num_ch)
+        self.ch_states = multiprocessing.RawArray('b', num_ch)
+        self.status = multiprocessing.RawArray('d', c_STATUS_SIZE)
+        self.last_good = ([0]*num_ch, [0]*num_ch, [0.0]*c_STATUS_SIZE) #reader side, see read()
+
+    def publish(self, levels, ch_states, status):
+        self.seq.value += 1
+        self.levels[:] = levels
+        self.ch_states[:] = ch_states
+        self.status[:] = status
+        self.seq.value += 1
+
+    #returns (levels, ch_states, status) as plain lists
+    def read(self):
+        for i in range(0, c_max_read_tries):
+            l_seq = self.seq.value
+            if(l_seq % 2 == 1):
+                time.sleep(0)
+                continue
+            l_levels = self.levels[:]
+            l_ch_states = self.ch_states[:]
+            l_status = self.status[:]
+            if(self.seq.value == l_seq):
+                self.last_good = (l_levels, l_ch_states, l_status)
+                return (l_levels, l_ch_states, l_status)
+        return (list(self.last_good[0]), list(self.last_good[1]), list(self.last_good[2]))
+
+########################################################################
+### OUTPUT PROCESS - GUI SIDE
+########################################################################
+class Output_Process:
+    def __init__(self, cue_list, num_ch, sec_per_frame, port_name, protocol="framed", record_fname=None, firmware_fades=False, num_submasters=4,
+                 patch=None, output_universe=1, monitor_port=None):
+        self.num_ch = num_ch
+        self.generation = 0 #of the cue list last sent, see load_cue_list
+        self.ring = Command_Ring()
+        self.frame_buf = Frame_Buffer(num_ch)
+        (self.show_conn, l_child_conn) = multiprocessing.Pipe()
+        self.process = multiprocessing.Process(target = _output_process_main, name = "PYTHON_LX_OUTPUT_PROCESS",
+            args = (self.ring, self.frame_buf, l_child_conn, lx_show_file.pack_cue_list(cue_list),
+                    num_ch, sec_per_frame, port_name, protocol, record_fname, firmware_fades, num_submasters,
+                    (lx_patch.pack_patch(patch) if patch != None else None), output_universe, monitor_port))
+        self.process.daemon = True
+
+    def start(self):
+        self.process.start()
+
+    def stop(self, timeout=2.0):
+        self._send(struct.pack("<B", c_CMD_QUIT))
+        self.process.join(timeout)
+        if(self.process.is_alive()):
+            self.process.terminate()
+
+    def is_alive(self):
+        return self.process.is_alive()
+
+    def go(self, go_time=None):
+        self._send(struct.pack("<Bd", c_CMD_GO, self._stamp(go_time)))
+
+    def back(self, go_time=None):
+        self._send(struct.pack("<Bd", c_CMD_BACK, self._stamp(go_time)))
+
+    def goto(self, cue_num, go_time=None):
+        self._send(struct.pack("<Bdd", c_CMD_GOTO, cue_num, self._stamp(go_time)))
+
+    def set_channels(self, channels, level):
+        self._send(struct.pack("<BBH", c_CMD_SET_CH, level, len(channels)) + struct.pack("<{}H".format(len(channels)), *channels))
+
+    def release_captured(self):
+        self._send(struct.pack("<B", c_CMD_RELEASE))
+
+    def snap_to_cue(self, cue_index):
+        self._send(struct.pack("<BI", c_CMD_SNAP, cue_index))
+
+    #after any edit to the cue list. uncapture=True is what Record Cue does to channel states,
+    #snap=True jumps straight to cur_cue_index (a show was opened).
+    def load_cue_list(self, cue_list, cur_cue_index, uncapture=False, snap=False):
+        self.generation += 1
+        self.show_conn.send(("cues", lx_show_file.pack_cue_list(cue_list), cur_cue_index, uncapture, snap, self.generation))
+
+    #effect is an lx_effects.Effect - it's rebuilt over there from its params
+    def start_effect(self, effect):
+        self.show_conn.send(("start_effect", effect.params()))
+
+    def stop_effect(self, name):
+        self.show_conn.send(("stop_effect", name))
+
+    def stop_all_effects(self):
+        self.show_conn.send(("stop_all_effects",))
+
+    #levels are 0-255, like lx_masters.Master_Stage
+    def set_grand_master(self, level):
+        self.show_conn.send(("grand_master", level))
+
+    def set_blackout(self, on):
+        self.show_conn.send(("blackout", on))
+
+    def set_submaster_fader(self, sub_index, level):
+        self.show_conn.send(("submaster_fader", sub_index, level))
+
+    def set_submaster_levels(self, sub_index, levels):
+        self.show_conn.send(("submaster_levels", sub_index, list(levels)))
+
+    #(levels, ch_states, status list) - see c_STATUS_*
+    def read_frame(self):
+        return self.frame_buf.read()
+
+    def _stamp(self, go_time):
+        if(not lx_clock.c_monotonic_is_system_wide):
+            return -1.0 #our clock means nothing over there, let the output process stamp it
+        if(go_time == None):
+            go_time = lx_clock.monotonic()
+        return go_time
+
+    def _send(self, msg):
+        if(not self.ring.put(struct.pack("<I", self.generation) + msg)):
+            print("Output process command ring full, dropped a command!")
+
+########################################################################
+### OUTPUT PROCESS - CHILD SIDE
+########################################################################
+def _output_process_main(ring, frame_buf, show_conn, packed_cue_list, num_ch, sec_per_frame, port_name, protocol, record_fname, firmware_fades, num_submasters, packed_patch, output_universe, monitor_port):
+    l_out = lx_serial_protocol.make_serial_writer(port_name, protocol)
+    if(not l_out.connect()):
+        print("Output process: error opening serial port to DMX TX Module, is it plugged in and unused? Will keep trying...")
+    l_out.start()
+    l_recorder = None
+    if(record_fname != None):
+        l_recorder = lx_dmx_log.DMX_Recorder(record_fname, num_ch)
+    l_monitor = None
+    if(monitor_port != None):
+        l_monitor = lx_monitor.start_publisher(monitor_port) #here, so monitors put no load on the GUI process
+    l_engine = lx_engine.Playback_Engine(lx_show_file.unpack_cue_list(packed_cue_list), num_ch)
+    l_effects = lx_effects.Effects_Engine()
+    l_masters = lx_masters.Master_Stage(num_ch, num_submasters)
+    l_patch = None
+    if(packed_patch != None):
+        l_patch = lx_patch.unpack_patch(packed_patch)
+    l_fade_sender = None
+    if(firmware_fades):
+        l_fade_sender = lx_firmware_fade.Firmware_Fade_Sender(l_out, num_ch)
+        def _send_fade(engine, go_time):
+            if(not l_masters.is_active() and l_patch == None): #fades from the firmware would skip the masters and patch
+                l_fade_sender.fade(engine.cur_out, engine.ch_states, engine.cue_list[engine.cur_cue_index], engine.transition_start_time)
+        l_engine.transition_listener = _send_fade
+    l_generation = [0] #of the loaded cue list
+    def _catch_up(generation): #the edit was sent before the command, so it's already in the pipe
+        while(l_generation[0] < generation):
+            _run_show_msg(show_conn.recv(), l_engine, l_effects, l_masters, l_generation, lx_clock.monotonic())
+    l_frame_count = 0
+    l_missed_frames = 0
+    l_next_frame_time = lx_clock.monotonic()
+    print("Starting output process")
+    try:
+        while(True):
+            l_sleep_time = l_next_frame_time - lx_clock.monotonic()
+            if(l_sleep_time > 0):
+                time.sleep(l_sleep_time)
+            l_now = lx_clock.monotonic()
+
+            #show edits, then commands - a command newer than the cue list waits for its edit
+            try:
+                while(show_conn.poll()):
+                    _run_show_msg(show_conn.recv(), l_engine, l_effects, l_masters, l_generation, l_now)
+                if(not _run_commands(ring, l_engine, l_now, _catch_up)):
+                    break
+            except (EOFError, IOError):
+                print("Output process: lost the GUI, exiting")
+                break
+
+            l_frame = l_engine.step(l_now)
+            l_out_frame = l_frame
+            if(l_effects.is_running()):
+                l_out_frame = l_effects.apply(list(l_frame), l_now) #effects never go into the engine's levels
+            if(l_masters.is_active()):
+                l_out_frame = l_masters.apply(l_out_frame)
+            if(l_patch != None):
+                l_out_frame = l_patch.apply_universe(l_out_frame, output_universe)
+            try:
+                if(l_fade_sender != None):
+                    l_live = l_effects.channel_indices
+                    if(l_masters.is_active() or l_patch != None):
+                        l_live = l_fade_sender.all_channels #the firmware doesn't know about masters or the patch, stream everything
+                    l_fade_sender.frame(l_out_frame, l_engine.ch_states, l_engine.state != lx_engine.c_STATE_STANDBY, l_live)
+                else:
+                    l_out.write_frame(l_out_frame)
+            except Exception:
+                print("Error while trying to queue frame for serial port!!!")
+            if(l_recorder != None):
+                l_recorder.record(l_out_frame, l_now)
+            if(l_monitor != None):
+                l_monitor.publish(l_out_frame, l_now)
+            l_frame_count += 1
+            frame_buf.publish(l_frame, l_engine.ch_states, [l_engine.state, l_engine.cur_cue_index, l_frame_count, l_missed_frames])
+
+            l_next_frame_time = l_next_frame_time + sec_per_frame
+            if(lx_clock.monotonic() > l_next_frame_time):
+                l_missed_frames += 1
+                print("WARNING MISSED OUTPUT PROCESS DEADLINE")
+                l_next_frame_time = lx_clock.monotonic()
+    finally:
+        l_out.close()
+        if(l_recorder != None):
+            l_recorder.close()
+        if(l_monitor != None):
+            l_monitor.close()
+        print("Output process: exiting")
+
+def _run_show_msg(msg, engine, effects, masters, generation, now):
+    if(msg[0] == "cues"):
+        (l_tag, l_packed, l_index, l_uncapture, l_snap, generation[0]) = msg
+        engine.set_cue_list(lx_show_file.unpack_cue_list(l_packed), l_index)
+        if(l_snap and len(engine.cue_list) > 0):
+            engine.snap_to_cue(engine.cur_cue_index)
+        elif(l_uncapture):
+            engine.uncapture_all()
+    elif(msg[0] == "start_effect"):
+        effects.start(lx_effects.Effect(**msg[1]), now)
+    elif(msg[0] == "stop_effect"):
+        effects.stop(msg[1])
+    elif(msg[0] == "stop_all_effects"):
+        effects.stop_all()
+    elif(msg[0] == "grand_master"):
+        masters.set_grand_master(msg[1])
+    elif(msg[0] == "blackout"):
+        masters.set_blackout(msg[1])
+    elif(msg[0] == "submaster_fader"):
+        masters.set_submaster_fader(msg[1], msg[2])
+    elif(msg[0] == "submaster_levels"):
+        masters.set_submaster_levels(msg[1], msg[2])
+
+#drain the ring. Returns False when told to quit.
+def _run_commands(ring, engine, now, catch_up):
+    while(True):
+        l_msg = ring.get()
+        if(l_msg == None):
+            return True
+        catch_up(struct.unpack_from("<I", l_msg)[0])
+        l_msg = l_msg[4:]
+        l_op = struct.unpack_from("<B", l_msg)[0]
+        if(l_op == c_CMD_GO or l_op == c_CMD_BACK):
+            l_go_time = struct.unpack_from("<Bd", l_msg)[1]
+            if(l_go_time < 0):
+                l_go_time = now
+            if(l_op == c_CMD_GO):
+                engine.go(l_go_time)
+            else:
+                engine.back(l_go_time)
+        elif(l_op == c_CMD_GOTO):
+            (l_op, l_cue_num, l_go_time) = struct.unpack_from("<Bdd", l_msg)
+            if(l_go_time < 0):
+                l_go_time = now
+            engine.goto(l_cue_num, l_go_time)
+        elif(l_op == c_CMD_SET_CH):
+            (l_op, l_level, l_count) = struct.unpack_from("<BBH", l_msg)
+            engine.set_channels(struct.unpack_from("<{}H".format(l_count), l_msg, 4), l_level)
+        elif(l_op == c_CMD_RELEASE):
+            engine.release_captured()
+        elif(l_op == c_CMD_SNAP):
+            engine.snap_to_cue(struct.unpack_from("<BI", l_msg)[1])
+        elif(l_op == c_CMD_QUIT):
+            return False
@@ -0,0 +1,224 @@
+########################################################################
+########################################################################
+###
+### Python_LX - A simple, Python and Arduino based DMX512 lighting console
+### by Chris Gerth - Summer/Fall 2014
+###
+### File - lx_palettes.py - named looks that cues refer to instead of
+###                         copying the levels
+### Dependencies - none
+###
+########################################################################
+########################################################################
+
+import sys, copy, time, random, threading, argparse #system dependencies
+
+#A palette is a named set of channel levels ("warm wash", "blue sky"). A cue
+#that refers to a palette takes those channels from the palette, in the order
+#the cue lists them, so changing the palette changes every cue that uses it.
+#
+#The fade engine never sees a palette. Each cue's DMX_VALS always holds its
+#fully resolved levels: the levels the operator recorded (BASE_VALS, kept for
+#any cue that uses palettes) with each palette laid on top in order, worked
+#out again from BASE_VALS when the cue is recorded or a palette it uses
+#changes. A palette re-recorded with fewer channels hands the ones it dropped
+#back to the cue. The library keeps, for each palette, the cues that use it
+#(by cue number, the list is sorted by it), so an edit only visits those. Cues are never changed once they're in the list (the undo
+#history shares them, see lx_history.py), and neither are palettes: editing a
+#palette makes a new Palette, and each cue using the old one is replaced by a
+#re-resolved copy. The cues nobody touched are left alone.
+#
+#Cues hold the Palette objects themselves (cue.PALETTES), so pickling a show
+#saves the palettes its cues use along with it, and putting back a cue list
+#from the undo history puts back the palettes it was recorded with.
+
+class Palette:
+    def __init__(self, name, levels):
+        self.name = name
+        self.version = 0
+        self.set_levels(levels)
+
+    #levels is {1-based channel: level}
+    def set_levels(self, levels):
+        l_items = sorted((int(ch)-1, max(0, min(int(round(v)), 255))) for (ch, v) in levels.items())
+        self.indices = tuple(i for (i, v) in l_items)
+        self.values = tuple(v for (i, v) in l_items)
+        self.version += 1
+
+    def levels(self):
+        return dict((i+1, v) for (i, v) in zip(self.indices, self.values))
+
+    def channel_count(self):
+        return len(self.indices)
+
+    #same as lx_tracking.Tracked_Levels, for shows written by python 3
+    def __reduce__(self):
+        return (_restore_palette, (self.name, self.version, self.indices, self.values))
+
+def _restore_palette(name, version, indices, values):
+    l_palette = Palette(name, {})
+    (l_palette.version, l_palette.indices, l_palette.values) = (version, tuple(indices), tuple(values))
+    return l_palette
+
+#the levels the operator recorded, before any palette
+def base_levels(cue):
+    if(cue.BASE_VALS != None):
+        return cue.BASE_VALS
+    return cue.DMX_VALS
+
+#a copy of cue using palettes (default: the ones it has): its base levels
+#with each palette on top, in order. cue itself isn't touched.
+def resolve_cue(cue, palettes=None):
+    l_cue = copy.copy(cue)
+    if(palettes != None):
+        l_cue.PALETTES = tuple(palettes)
+    l_base = list(base_levels(cue))
+    l_levels = list(l_base)
+    l_num_ch = len(l_levels)
+    for l_palette in l_cue.PALETTES:
+        for (i, v) in zip(l_palette.indices, l_palette.values):
+            if(i < l_num_ch):
+                l_levels[i] = v
+    l_cue.BASE_VALS = None
+    if(len(l_cue.PALETTES) > 0):
+        l_cue.BASE_VALS = l_base
+    l_cue.DMX_VALS = l_levels
+    l_cue.PALETTE_VERSIONS = tuple(p.version for p in l_cue.PALETTES)
+    return l_cue
+
+def is_stale(cue):
+    return tuple(p.version for p in cue.PALETTES) != cue.PALETTE_VERSIONS
+
+#index of the cue numbered cue_num in a list sorted by cue number, or -1
+def _find_cue(cue_list, cue_num):
+    (l_low, l_high) = (0, len(cue_list))
+    while(l_low < l_high):
+        l_mid = (l_low + l_high)//2
+        if(cue_list[l_mid].CUE_NUM < cue_num):
+            l_low = l_mid + 1
+        else:
+            l_high = l_mid
+    if(l_low < len(cue_list) and cue_list[l_low].CUE_NUM == cue_num):
+        return l_low
+    return -1
+
+class Palette_Library:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.palettes = {} #name -> Palette
+        self.dependents = {} #name -> {cue number: cue}, cues using that palette. Entries for cues
+                             #since overwritten or removed are dropped when they're next visited.
+
+    def clear(self):
+        self.lock.acquire()
+        self.palettes = {}
+        self.dependents = {}
+        self.lock.release()
+
+    def _add_dependent(self, cue):
+        for l_palette in cue.PALETTES:
+            self.dependents.setdefault(l_palette.name, {})[cue.CUE_NUM] = cue
+
+    def names(self):
+        return sorted(self.palettes.keys())
+
+    def get(self, name):
+        return self.palettes.get(name)
+
+    #create a palette, or replace an existing one and swap a re-resolved copy
+    #into cue_list for every cue that used it. Returns the number of cues replaced.
+    def set_palette(self, name, levels, cue_list=()):
+        self.lock.acquire()
+        l_old = self.palettes.get(name)
+        l_new = Palette(name, levels)
+        self.palettes[name] = l_new
+        l_count = 0
+        if(l_old != None):
+            l_new.version = l_old.version + 1
+            l_dependents = self.dependents.get(name, {})
+            for (l_num, l_cue) in list(l_dependents.items()):
+                i = _find_cue(cue_list, l_num)
+                if(i == -1 or cue_list[i] is not l_cue or l_old not in l_cue.PALETTES):
+                    del l_dependents[l_num] #no longer in the list
+                    continue
+                cue_list[i] = resolve_cue(l_cue, [l_new if p is l_old else p for p in l_cue.PALETTES])
+                self._add_dependent(cue_list[i])
+                l_count += 1
+        self.lock.release()
+        return l_count
+
+    #a copy of cue using these palettes (by name, in order), resolved. It's
+    #counted as a dependent from now on, so put it in the list.
+    def attach(self, cue, names):
+        self.lock.acquire()
+        l_missing = [n for n in names if n not in self.palettes]
+        if(len(l_missing) > 0):
+            self.lock.release()
+            raise ValueError("No palette named " + ", ".join(l_missing))
+        l_cue = resolve_cue(cue, [self.palettes[n] for n in names])
+        self._add_dependent(l_cue)
+        self.lock.release()
+        return l_cue
+
+    #catch up after the cue list was replaced (a show opened, an undo): the
+    #palettes the cues carry become the library's, and any cue resolved against
+    #something else is swapped for a re-resolved copy. Returns the number of
+    #cues replaced.
+    def index_cue_list(self, cue_list):
+        self.lock.acquire()
+        l_carried = {}
+        for l_cue in cue_list:
+            for l_palette in l_cue.PALETTES:
+                l_carried.setdefault(l_palette.name, l_palette) #first one wins if cues disagree
+        self.palettes.update(l_carried)
+        self.dependents = {}
+        l_count = 0
+        for i in range(0, len(cue_list)):
+            l_cue = cue_list[i]
+            l_palettes = [self.palettes[p.name] for p in l_cue.PALETTES]
+            if(is_stale(l_cue) or any(a is not b for (a, b) in zip(l_palettes, l_cue.PALETTES))):
+                cue_list[i] = resolve_cue(l_cue, l_palettes)
+                l_count += 1
+            self._add_dependent(cue_list[i])
+        self.lock.release()
+        return l_count
+
+########################################################################
+### COMMAND LINE
+########################################################################
+#cost of editing a palette in a big show, compared to re-resolving every cue
+def main(argv):
+    import lx_show_file
+    parser = argparse.ArgumentParser(description = "Benchmark python_lx palette edits")
+    parser.add_argument("--cues", type = int, default = 1000)
+    parser.add_argument("--channels", type = int, default = 512)
+    parser.add_argument("--palettes", type = int, default = 50)
+    parser.add_argument("--refs", type = int, default = 2, help = "palettes per cue")
+    args = parser.parse_args(argv)
+
+    l_rand = random.Random(0)
+    l_library = Palette_Library()
+    for i in range(0, args.palettes):
+        l_first = l_rand.randrange(1, args.channels - 30)
+        l_library.set_palette("p{}".format(i), dict((ch, l_rand.randint(0, 255)) for ch in range(l_first, l_first + 24)))
+    l_cue_list = []
+    for i in range(0, args.cues):
+        l_cue = lx_show_file.Show_Cue(i + 1, [0]*args.channels, 3.0, 3.0, "")
+        l_cue_list.append(l_library.attach(l_cue, l_rand.sample(l_library.names(), args.refs)))
+
+    l_start = time.time()
+    l_count = 0
+    for l_name in l_library.names():
+        l_count += l_library.set_palette(l_name, dict((ch, l_rand.randint(0, 255)) for ch in l_library.get(l_name).levels()), l_cue_list)
+    l_per_edit = (time.time() - l_start)/args.palettes
+    l_start = time.time()
+    for i in range(0, len(l_cue_list)):
+        l_cue_list[i] = resolve_cue(l_cue_list[i])
+    l_full = time.time() - l_start
+    print("{} cues, {} palettes, {} per cue".format(args.cues, args.palettes, args.refs))
+    print("palette edit: {:.0f} cues re-resolved in {:.2f} ms (re-resolving every cue: {:.2f} ms)".format(
+        float(l_count)/args.palettes, l_per_edit*1000.0, l_full*1000.0))
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))
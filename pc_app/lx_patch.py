@@ -0,0 +1,215 @@
+########################################################################
+########################################################################
+###
+### Python_LX - A simple, Python and Arduino based DMX512 lighting console
+### by Chris Gerth - Summer/Fall 2014
+###
+### File - lx_patch.py - patch logical channels to DMX addresses, with
+###                      dimmer curves and proportional levels
+### Dependencies - none
+###
+########################################################################
+########################################################################
+
+import sys, math, time, operator, threading, argparse #system dependencies
+
+#Without a patch, channel n in a cue is DMX address n. With one, each
+#logical channel can drive any number of (universe, address) outputs, each
+#at its own proportion (80% = never more than 80%) through its own dimmer
+#curve. Every address is driven by at most one channel.
+#
+#The patch is compiled, not interpreted. Proportion and curve are folded into
+#one 256 entry lookup table per output, and outputs that share a table are
+#grouped. A frame is then, per universe:
+#  - one itemgetter per group to gather the channel levels it needs
+#  - one bytearray.translate() per group through that group's table
+#  - one itemgetter to put the results back in address order
+#all of which run in C, so a big patch costs no Python work per channel.
+#
+#Patch file, one output per line, '#' starts a comment:
+#   <channel> [<universe>/]<address> [<percent>%] [<curve>]
+#e.g. "12 1/40 80% square". Universe defaults to 1.
+
+c_default_universe = 1
+
+def _curve_linear(x):
+    return x
+
+def _curve_square(x): #incandescent-ish, more resolution at the bottom
+    return x*x
+
+def _curve_sqrt(x):
+    return math.sqrt(x)
+
+def _curve_scurve(x): #slow at both ends
+    return x*x*(3.0 - 2.0*x)
+
+def _curve_switch(x): #non-dims: relays, fans, practicals on a switch pack
+    return 1.0 if x >= 0.5 else 0.0
+
+c_CURVES = {"linear": _curve_linear, "square": _curve_square, "sqrt": _curve_sqrt,
+            "scurve": _curve_scurve, "switch": _curve_switch}
+
+#the 256 entry table for one output: proportion first, then the curve
+def make_lut(proportion=100.0, curve="linear"):
+    if(curve not in c_CURVES):
+        raise ValueError("Unknown dimmer curve {}, expected one of {}".format(curve, ", ".join(sorted(c_CURVES.keys()))))
+    l_curve = c_CURVES[curve]
+    l_table = bytearray(256)
+    for v in range(0, 256):
+        l_level = min(255, int(round(v*proportion/100.0)))
+        l_table[v] = max(0, min(255, int(round(l_curve(l_level/255.0)*255.0))))
+    return bytes(l_table)
+
+#always returns a sequence, even for one index (itemgetter alone returns the bare item)
+def _gatherer(indices):
+    if(len(indices) == 1):
+        l_index = indices[0]
+        return lambda seq: (seq[l_index],)
+    return operator.itemgetter(*indices)
+
+class Patch:
+    def __init__(self, num_ch, universe_size=512):
+        self.lock = threading.Lock()
+        self.num_ch = num_ch
+        self.universe_size = universe_size
+        self.outputs = {} #(universe, address) -> (channel, proportion, curve)
+        self.compiled = None
+
+    def add(self, channel, address, universe=c_default_universe, proportion=100.0, curve="linear"):
+        if(channel < 1 or channel > self.num_ch):
+            raise ValueError("Channel {} is outside 1-{}".format(channel, self.num_ch))
+        if(address < 1 or address > self.universe_size):
+            raise ValueError("Address {} is outside 1-{}".format(address, self.universe_size))
+        if((universe, address) in self.outputs):
+            raise ValueError("Address {}/{} is already patched to channel {}".format(universe, address, self.outputs[(universe, address)][0]))
+        if(proportion < 0 or proportion > 100):
+            raise ValueError("Proportion {}% is outside 0-100%".format(proportion))
+        make_lut(proportion, curve) #check the curve name now, not in the frame loop
+        self.lock.acquire()
+        self.outputs[(universe, address)] = (channel, float(proportion), curve)
+        self.compiled = None
+        self.lock.release()
+
+    def remove(self, address, universe=c_default_universe):
+        self.lock.acquire()
+        self.outputs.pop((universe, address), None)
+        self.compiled = None
+        self.lock.release()
+
+    def universes(self):
+        return sorted(set(u for (u, a) in self.outputs.keys()))
+
+    #logical frame in, {universe: list of universe_size levels} out
+    def apply(self, frame):
+        l_compiled = self.compiled
+        if(l_compiled == None):
+            l_compiled = self.compile()
+        l_src = frame
+        if(len(frame) < self.num_ch):
+            l_src = list(frame) + [0]*(self.num_ch - len(frame))
+        l_out = {}
+        for (l_universe, l_groups, l_reorder) in l_compiled:
+            l_buf = bytearray()
+            for (l_gather, l_lut) in l_groups:
+                l_buf += bytearray(l_gather(l_src)).translate(l_lut)
+            l_buf.append(0) #unpatched addresses point here
+            l_out[l_universe] = list(l_reorder(l_buf))
+        return l_out
+
+    #one universe only, e.g. the one the serial port carries
+    def apply_universe(self, frame, universe=c_default_universe):
+        return self.apply(frame).get(universe, [0]*self.universe_size)
+
+    def compile(self):
+        self.lock.acquire()
+        l_compiled = []
+        for l_universe in self.universes():
+            l_by_lut = {} #(proportion, curve) -> list of (address, source index)
+            for ((u, l_address), (l_channel, l_proportion, l_curve)) in self.outputs.items():
+                if(u == l_universe):
+                    l_by_lut.setdefault((l_proportion, l_curve), []).append((l_address, l_channel-1))
+            l_groups = []
+            l_position = {} #address -> position in the gathered, translated buffer
+            for l_key in sorted(l_by_lut.keys()):
+                l_members = sorted(l_by_lut[l_key])
+                for (l_address, l_src) in l_members:
+                    l_position[l_address] = len(l_position)
+                l_groups.append((_gatherer([l_src for (l_address, l_src) in l_members]), make_lut(*l_key)))
+            l_zero = len(l_position)
+            l_reorder = _gatherer([l_position.get(a, l_zero) for a in range(1, self.universe_size+1)])
+            l_compiled.append((l_universe, l_groups, l_reorder))
+        self.compiled = l_compiled
+        self.lock.release()
+        return l_compiled
+
+def load_patch_file(fname, num_ch, universe_size=512):
+    l_patch = Patch(num_ch, universe_size)
+    l_file = open(fname, "r")
+    try:
+        l_line_num = 0
+        for l_line in l_file:
+            l_line_num += 1
+            l_parts = l_line.split("#")[0].split()
+            if(len(l_parts) == 0):
+                continue
+            try:
+                l_channel = int(l_parts[0])
+                (l_universe, l_slash, l_address) = l_parts[1].rpartition("/")
+                l_universe = int(l_universe) if l_slash != "" else c_default_universe
+                l_proportion = 100.0
+                l_curve = "linear"
+                for l_part in l_parts[2:]:
+                    if(l_part.endswith("%")):
+                        l_proportion = float(l_part[:-1])
+                    else:
+                        l_curve = l_part.lower()
+                l_patch.add(l_channel, int(l_address), l_universe, l_proportion, l_curve)
+            except (ValueError, IndexError) as e:
+                raise ValueError("{} line {}: {}".format(fname, l_line_num, e))
+    finally:
+        l_file.close()
+    return l_patch
+
+#everything needed to rebuild a patch (in the output process)
+def pack_patch(patch):
+    return (patch.num_ch, patch.universe_size, [(u, a, c, p, cv) for ((u, a), (c, p, cv)) in patch.outputs.items()])
+
+def unpack_patch(packed):
+    (l_num_ch, l_universe_size, l_outputs) = packed
+    l_patch = Patch(l_num_ch, l_universe_size)
+    for (u, a, c, p, cv) in l_outputs:
+        l_patch.add(c, a, u, p, cv)
+    return l_patch
+
+########################################################################
+### COMMAND LINE
+########################################################################
+def main(argv):
+    parser = argparse.ArgumentParser(description = "Check a python_lx patch file and time it")
+    parser.add_argument("patch_file", nargs = "?", default = None, help = "patch file (a random 512 channel x 2 universe patch if none)")
+    parser.add_argument("--channels", type = int, default = 512)
+    parser.add_argument("--frames", type = int, default = 1000)
+    args = parser.parse_args(argv)
+
+    if(args.patch_file != None):
+        l_patch = load_patch_file(args.patch_file, args.channels)
+    else:
+        l_patch = Patch(args.channels)
+        l_curves = sorted(c_CURVES.keys())
+        for ch in range(1, args.channels+1):
+            l_patch.add(ch, ((ch*7) % 512) + 1, 1, 100 - (ch % 5)*10, l_curves[ch % len(l_curves)])
+            l_patch.add(ch, ch, 2)
+    for l_universe in l_patch.universes():
+        l_count = len([1 for (u, a) in l_patch.outputs if u == l_universe])
+        print("universe {}: {} addresses patched".format(l_universe, l_count))
+    l_frame = [ch % 256 for ch in range(0, args.channels)]
+    l_patch.compile()
+    l_start = time.time()
+    for i in range(0, args.frames):
+        l_patch.apply(l_frame)
+    print("{:.3f} ms per frame".format((time.time() - l_start)*1000.0/args.frames))
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))
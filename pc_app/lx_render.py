@@ -0,0 +1,263 @@
+########################################################################
+########################################################################
+###
+### Python_LX - A simple, Python and Arduino based DMX512 lighting console
+### by Chris Gerth - Summer/Fall 2014
+###
+### File - lx_render.py - run a show against a virtual clock and capture
+###                       every frame, as fast as the CPU will go
+### Dependencies - none
+###
+########################################################################
+########################################################################
+
+import sys, time, random, argparse #system dependencies
+import lx_clock, lx_engine, lx_show_file, lx_dmx_log
+
+c_default_sec_per_frame = 0.05 #keep in step with c_sec_per_frame in python_lx.py
+c_default_hold_time = 1.0 #seconds to sit on each cue before the automatic GO
+c_default_max_time = 24*60*60.0 #give up after a day of show time
+
+########################################################################
+### RENDER RESULT
+########################################################################
+#Every frame the engine produced, packed one byte per channel into a single
+#bytearray (frame i starts at i*num_ch), plus a list of what happened when.
+class Render_Result:
+    def __init__(self, num_ch, sec_per_frame):
+        self.num_ch = num_ch
+        self.sec_per_frame = sec_per_frame
+        self.frames = bytearray()
+        self.events = [] #(frame index, event name, cue number)
+
+    def frame_count(self):
+        return len(self.frames) // self.num_ch
+
+    def duration(self):
+        return self.frame_count() * self.sec_per_frame
+
+    def frame(self, frame_index):
+        return self.frames[frame_index*self.num_ch:(frame_index+1)*self.num_ch]
+
+    def levels_at(self, show_time):
+        l_index = min(int(show_time / self.sec_per_frame), self.frame_count()-1)
+        return self.frame(l_index)
+
+    #cue number -> frame at the moment each fade finished. Later visits to
+    #the same cue overwrite earlier ones.
+    def cue_end_states(self):
+        l_states = {}
+        for (l_frame_index, l_event, l_cue_num) in self.events:
+            if(l_event == "complete"):
+                l_states[l_cue_num] = self.frame(l_frame_index)
+        return l_states
+
+    #list of (frame index, channel, level here, level there), at most max_diffs long
+    def diff(self, other, max_diffs=20):
+        l_diffs = []
+        l_num_ch = min(self.num_ch, other.num_ch)
+        for l_frame_index in range(0, min(self.frame_count(), other.frame_count())):
+            l_a = self.frame(l_frame_index)
+            l_b = other.frame(l_frame_index)
+            if(l_a[0:l_num_ch] == l_b[0:l_num_ch]):
+                continue
+            for i in range(0, l_num_ch):
+                if(l_a[i] != l_b[i]):
+                    l_diffs.append((l_frame_index, i+1, l_a[i], l_b[i]))
+                    if(len(l_diffs) >= max_diffs):
+                        return l_diffs
+        return l_diffs
+
+    def save_raw(self, fname):
+        l_file = open(fname, "wb")
+        try:
+            l_file.write(bytes(self.frames))
+        finally:
+            l_file.close()
+
+    #same format the live recorder writes, so lx_dmx_log.py can replay a render
+    def save_log(self, fname):
+        l_clock = lx_clock.Virtual_Clock()
+        l_recorder = lx_dmx_log.DMX_Recorder(fname, self.num_ch, clock = l_clock)
+        try:
+            for i in range(0, self.frame_count()):
+                l_clock.advance_to(i * self.sec_per_frame)
+                l_recorder.record(self.frame(i))
+        finally:
+            l_recorder.close()
+
+########################################################################
+### RENDERER
+########################################################################
+#script is a list of (show time, action, argument) where action is one of
+#"go", "back", "goto" (argument = cue number), "set" (argument = (channel list, level))
+#or "release". With no script, the show is run straight through: hold each
+#cue for hold_time once it (and any follow chain) has finished, then GO.
+def render_show(cue_list, num_ch=None, sec_per_frame=c_default_sec_per_frame, script=None,
+                hold_time=c_default_hold_time, max_time=c_default_max_time):
+    if(num_ch == None):
+        num_ch = len(cue_list[0].DMX_VALS)
+    l_clock = lx_clock.Virtual_Clock()
+    l_engine = lx_engine.Playback_Engine(cue_list, num_ch, clock = l_clock)
+    l_result = Render_Result(num_ch, sec_per_frame)
+    l_auto = (script == None)
+    l_script = []
+    if(not l_auto):
+        l_script = sorted(script, key = lambda a: a[0])
+    l_script_pos = 0
+    l_idle_since = None
+    l_prev_cue_index = l_engine.cur_cue_index
+    l_prev_state = l_engine.state
+    l_frame_index = 0
+    while(True):
+        l_now = l_frame_index * sec_per_frame
+        if(l_now > max_time):
+            break
+        l_clock.advance_to(l_now)
+
+        #operator actions land at their exact script time, not the frame time
+        while(l_script_pos < len(l_script) and l_script[l_script_pos][0] <= l_now):
+            (l_action_time, l_action, l_arg) = l_script[l_script_pos]
+            _run_action(l_engine, l_action, l_arg, l_action_time)
+            l_script_pos += 1
+
+        if(l_engine.is_idle()):
+            if(l_idle_since == None):
+                l_idle_since = l_now
+            if(l_now - l_idle_since >= hold_time):
+                if(l_auto and l_engine.go(l_now)):
+                    l_idle_since = None
+                elif(l_script_pos >= len(l_script)):
+                    break #nothing left to do
+        else:
+            l_idle_since = None
+
+        l_frame = l_engine.step(l_now)
+        l_result.frames.extend(bytearray(l_frame))
+
+        if(l_engine.cur_cue_index != l_prev_cue_index or (l_engine.state != lx_engine.c_STATE_STANDBY and l_prev_state == lx_engine.c_STATE_STANDBY)):
+            l_result.events.append((l_frame_index, "start", cue_list[l_engine.cur_cue_index].CUE_NUM))
+        if(l_engine.state == lx_engine.c_STATE_STANDBY and l_prev_state != lx_engine.c_STATE_STANDBY):
+            l_result.events.append((l_frame_index, "complete", cue_list[l_engine.cur_cue_index].CUE_NUM))
+        l_prev_cue_index = l_engine.cur_cue_index
+        l_prev_state = l_engine.state
+        l_frame_index += 1
+    return l_result
+
+def _run_action(engine, action, arg, action_time):
+    if(action == "go"):
+        engine.go(action_time)
+    elif(action == "back"):
+        engine.back(action_time)
+    elif(action == "goto"):
+        engine.goto(arg, action_time)
+    elif(action == "set"):
+        engine.set_channels(arg[0], arg[1])
+    elif(action == "release"):
+        engine.release_captured()
+    else:
+        raise ValueError("Unknown script action " + str(action))
+
+#script file: one action per line, "<seconds> go|back|release", "<seconds> goto <cue>"
+#or "<seconds> set <ch>[,<ch>...] <level>". '#' starts a comment.
+def read_script_file(fname):
+    l_script = []
+    l_file = open(fname, "r")
+    try:
+        for l_line in l_file:
+            l_parts = l_line.split("#")[0].split()
+            if(len(l_parts) == 0):
+                continue
+            l_time = float(l_parts[0])
+            l_action = l_parts[1].lower()
+            l_arg = None
+            if(l_action == "goto"):
+                l_arg = round(float(l_parts[2]), 1)
+            elif(l_action == "set"):
+                l_arg = ([int(ch) for ch in l_parts[2].split(",")], max(0, min(int(l_parts[3]), 255)))
+            l_script.append((l_time, l_action, l_arg))
+    finally:
+        l_file.close()
+    return l_script
+
+#random show for benchmarking the fade engine at scale
+def make_bench_show(num_ch, num_cues, fade_time, seed=0):
+    l_rand = random.Random(seed)
+    l_cue_list = []
+    for i in range(0, num_cues):
+        l_vals = [l_rand.randrange(0, 256) for ch in range(0, num_ch)]
+        l_cue_list.append(lx_show_file.Show_Cue(i+1, l_vals, fade_time, fade_time, "bench"))
+    return l_cue_list
+
+########################################################################
+### COMMAND LINE
+########################################################################
+def main(argv):
+    parser = argparse.ArgumentParser(description = "Render python_lx shows offline, faster than real time")
+    sub = parser.add_subparsers(dest = "command")
+    for l_name in ["render", "check", "diff"]:
+        p = sub.add_parser(l_name)
+        p.add_argument("show_files", nargs = (2 if l_name == "diff" else 1))
+        p.add_argument("--hold", type = float, default = c_default_hold_time, help = "seconds to hold each cue before the next GO")
+        p.add_argument("--script", default = None, help = "file of timed operator actions instead of a straight run")
+        p.add_argument("--frame-time", type = float, default = c_default_sec_per_frame)
+        if(l_name == "render"):
+            p.add_argument("-o", "--output", default = None, help = ".plxlog for a replayable log, anything else for raw frames")
+    p = sub.add_parser("bench")
+    p.add_argument("--channels", type = int, default = 512)
+    p.add_argument("--cues", type = int, default = 50)
+    p.add_argument("--fade", type = float, default = 3.0)
+    p.add_argument("--frame-time", type = float, default = c_default_sec_per_frame)
+    args = parser.parse_args(argv)
+
+    if(args.command == "bench"):
+        l_cue_list = make_bench_show(args.channels, args.cues, args.fade)
+        l_start = time.time()
+        l_result = render_show(l_cue_list, sec_per_frame = args.frame_time, hold_time = 0.0)
+        l_wall = max(time.time() - l_start, 1e-9)
+        print("{} frames x {} ch in {:.3f} s: {:.0f} frames/s, {:.1f}x real time".format(
+            l_result.frame_count(), args.channels, l_wall, l_result.frame_count()/l_wall, l_result.duration()/l_wall))
+        return 0
+
+    l_script = None
+    if(args.script != None):
+        l_script = read_script_file(args.script)
+    l_results = []
+    for l_fname in args.show_files:
+        l_start = time.time()
+        l_result = render_show(lx_show_file.load_show_file(l_fname), sec_per_frame = args.frame_time, script = l_script, hold_time = args.hold)
+        l_wall = max(time.time() - l_start, 1e-9)
+        print("{}: {} frames, {:.1f} s of show in {:.3f} s".format(l_fname, l_result.frame_count(), l_result.duration(), l_wall))
+        l_results.append(l_result)
+
+    if(args.command == "render"):
+        if(args.output != None):
+            if(args.output.endswith(".plxlog")):
+                l_results[0].save_log(args.output)
+            else:
+                l_results[0].save_raw(args.output)
+        return 0
+    elif(args.command == "check"):
+        #every cue we faded into should have landed exactly on its recorded levels
+        l_cue_list = lx_show_file.load_show_file(args.show_files[0])
+        l_bad = 0
+        for (l_cue_num, l_frame) in sorted(l_results[0].cue_end_states().items()):
+            for l_cue in l_cue_list:
+                if(l_cue.CUE_NUM == l_cue_num and list(l_frame) != [int(round(v)) for v in l_cue.DMX_VALS[0:len(l_frame)]]):
+                    print("Cue {} did not end on its recorded levels".format(l_cue_num))
+                    l_bad += 1
+        print("{} bad fade end states".format(l_bad))
+        return 1 if l_bad > 0 else 0
+    else:
+        l_diffs = l_results[0].diff(l_results[1])
+        if(l_results[0].frame_count() != l_results[1].frame_count()):
+            print("Frame counts differ: {} vs {}".format(l_results[0].frame_count(), l_results[1].frame_count()))
+        for (l_frame_index, l_ch, l_a, l_b) in l_diffs:
+            print("t={:.2f}s ch{}: {} vs {}".format(l_frame_index*args.frame_time, l_ch, l_a, l_b))
+        if(len(l_diffs) == 0 and l_results[0].frame_count() == l_results[1].frame_count()):
+            print("Outputs are identical")
+            return 0
+        return 1
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))
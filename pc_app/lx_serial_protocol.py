@@ -0,0 +1,206 @@
+########################################################################
+########################################################################
+###
+### Python_LX - A simple, Python and Arduino based DMX512 lighting console
+### by Chris Gerth - Summer/Fall 2014
+###
+### File - lx_serial_protocol.py - framed, checksummed serial protocol
+###                                spoken with python_lx_arduino.ino
+### Dependencies - pySerial
+###
+########################################################################
+########################################################################
+
+import struct, time #system dependencies
+import lx_clock, lx_output
+
+########################################################################
+### PROTOCOL DEFINITION
+########################################################################
+#The original protocol reserves 0x10 as a start-of-frame byte, so level 16 can
+#never be sent and there's no way to tell a corrupted frame from a good one.
+#Framed protocol, every message is:
+#
+#   COBS( <type u8> <payload length u16 LE> <payload> <crc16 LE> ) 0x00
+#
+#COBS (consistent overhead byte stuffing) removes every 0x00 from the message
+#for at most 1 extra byte per 254, so 0x00 always marks the end of a frame
+#and the receiver can resync on the next one whatever garbage came before.
+#The crc is CRC-16/MCRF4XX (reflected 0x1021, init 0xFFFF), which is what
+#avr-libc's _crc_ccitt_update() computes, over type + length + payload.
+#
+#Both ends start at c_initial_baud. The host PINGs until the firmware answers
+#(the Arduino resets when the port opens), then asks for c_framed_baud with
+#SET_BAUD. The firmware ACKs at the old rate and both sides switch.
+#Keep every number here in step with python_lx_arduino.ino.
+
+c_protocol_version = 1
+c_initial_baud = 115200
+c_framed_baud = 500000 #exact divisor on a 16MHz AVR
+c_handshake_timeout = 4.0 #seconds to wait for the firmware to boot and answer
+
+c_FRAME_LEVELS = 0x01 #payload: <start channel u16, 1-based> <level>...
+c_FRAME_SET_BAUD = 0x02 #payload: <baud u32>
+c_FRAME_PING = 0x03 #payload: none
+c_FRAME_REPLY_FLAG = 0x80 #firmware answers type t with t|0x80
+c_FRAME_PONG = c_FRAME_PING | c_FRAME_REPLY_FLAG #payload: <protocol version u8> <max channel u16>
+c_FRAME_BAUD_ACK = c_FRAME_SET_BAUD | c_FRAME_REPLY_FLAG #payload: <baud u32>
+
+def _make_crc_table():
+    l_table = []
+    for i in range(0, 256):
+        l_crc = i
+        for j in range(0, 8):
+            if(l_crc & 1):
+                l_crc = (l_crc >> 1) ^ 0x8408
+            else:
+                l_crc >>= 1
+        l_table.append(l_crc)
+    return l_table
+_g_crc_table = _make_crc_table()
+
+def crc16(data, crc=0xFFFF):
+    l_table = _g_crc_table
+    for b in bytearray(data):
+        crc = (crc >> 8) ^ l_table[(crc ^ b) & 0xFF]
+    return crc
+
+def cobs_encode(data):
+    l_out = bytearray()
+    for l_block in bytearray(data).split(b'\x00'):
+        #a run of more than 254 non-zero bytes is split into 0xFF blocks with no implied zero
+        while(len(l_block) >= 0xFF-1):
+            l_out.append(0xFF)
+            l_out.extend(l_block[0:0xFF-1])
+            l_block = l_block[0xFF-1:]
+        l_out.append(len(l_block)+1)
+        l_out.extend(l_block)
+    return l_out
+
+def cobs_decode(data):
+    l_data = bytearray(data)
+    l_out = bytearray()
+    l_pos = 0
+    while(l_pos < len(l_data)):
+        l_code = l_data[l_pos]
+        if(l_code == 0 or l_pos + l_code > len(l_data)):
+            raise ValueError("Bad COBS block")
+        l_out.extend(l_data[l_pos+1:l_pos+l_code])
+        l_pos += l_code
+        if(l_code != 0xFF and l_pos < len(l_data)):
+            l_out.append(0)
+    return l_out
+
+def encode_frame(frame_type, payload=b""):
+    l_body = bytearray(struct.pack("<BH", frame_type, len(payload))) + bytearray(payload)
+    l_body.extend(struct.pack("<H", crc16(l_body)))
+    l_out = cobs_encode(l_body)
+    l_out.append(0)
+    return bytes(l_out)
+
+#decode one frame (delimiter already stripped). Returns (type, payload), raises ValueError if it's bad.
+def decode_frame(encoded):
+    l_body = cobs_decode(encoded)
+    if(len(l_body) < 5):
+        raise ValueError("Frame too short")
+    (l_type, l_len) = struct.unpack_from("<BH", bytes(l_body))
+    if(l_len + 5 != len(l_body)):
+        raise ValueError("Frame length mismatch")
+    if(crc16(l_body[0:3+l_len]) != struct.unpack_from("<H", bytes(l_body), 3+l_len)[0]):
+        raise ValueError("Frame checksum mismatch")
+    return (l_type, bytes(l_body[3:3+l_len]))
+
+#all 256 levels go out as-is, no more bumping 16 to 17
+def encode_levels_frame(levels, start_ch=1):
+    return encode_frame(c_FRAME_LEVELS, struct.pack("<H", start_ch) + bytes(bytearray(levels)))
+
+#Splits a byte stream back into frames. Bad frames are counted and skipped.
+class Frame_Reader:
+    def __init__(self):
+        self.buf = bytearray()
+        self.bad_frames = 0
+
+    #returns a list of (type, payload) for every complete good frame in data
+    def feed(self, data):
+        l_frames = []
+        for b in bytearray(data):
+            if(b != 0):
+                self.buf.append(b)
+                continue
+            if(len(self.buf) > 0):
+                try:
+                    l_frames.append(decode_frame(self.buf))
+                except ValueError:
+                    self.bad_frames += 1
+            self.buf = bytearray()
+        return l_frames
+
+########################################################################
+### HOST SIDE LINK
+########################################################################
+#Opens the port, waits for the firmware to answer a PING, and moves the link to baud.
+#Raises IOError if the firmware never answers (not plugged in, or old firmware
+#that only speaks the 0x10 protocol) so Serial_Writer will try again later.
+#raw_opener opens the bare port - swap it for lx_firmware_fade.Emulated_Serial_Port to run without hardware.
+def open_framed_serial_port(port_name, baud=c_framed_baud, write_timeout=None, clock=lx_clock.monotonic, raw_opener=lx_output.open_serial_port):
+    l_port = raw_opener(port_name, c_initial_baud, write_timeout)
+    try:
+        l_port.timeout = 0.1
+        l_reader = Frame_Reader()
+        l_pong = _exchange(l_port, l_reader, encode_frame(c_FRAME_PING), c_FRAME_PONG, c_handshake_timeout, clock)
+        if(l_pong == None):
+            raise IOError("No answer from DMX firmware on " + str(port_name) + " - is it running the framed protocol?")
+        if(bytearray(l_pong)[0] != c_protocol_version):
+            raise IOError("DMX firmware speaks protocol version {}, expected {}".format(bytearray(l_pong)[0], c_protocol_version))
+        if(baud != c_initial_baud):
+            l_ack = _exchange(l_port, l_reader, encode_frame(c_FRAME_SET_BAUD, struct.pack("<I", baud)), c_FRAME_BAUD_ACK, 1.0, clock)
+            if(l_ack == None or struct.unpack("<I", l_ack)[0] != baud):
+                raise IOError("DMX firmware did not accept {} baud".format(baud))
+            l_port.baudrate = baud
+            time.sleep(0.01) #give the firmware a moment to switch too
+        return l_port
+    except:
+        l_port.close()
+        raise
+
+#keep sending msg until a reply of the wanted type shows up or we run out of time
+def _exchange(port, reader, msg, want_type, timeout, clock):
+    l_give_up = clock() + timeout
+    while(clock() < l_give_up):
+        port.write(msg)
+        l_resend = clock() + 0.25
+        while(clock() < min(l_resend, l_give_up)):
+            for (l_type, l_payload) in reader.feed(port.read(64)):
+                if(l_type == want_type):
+                    return l_payload
+    return None
+
+#Blocking backend for a port that's already been through open_framed_serial_port
+class Framed_Serial_Output:
+    def __init__(self, ser_port):
+        self.ser_port = ser_port
+
+    def write_frame(self, levels):
+        self.ser_port.write(encode_levels_frame(levels))
+
+    def send_command(self, buf):
+        self.ser_port.write(buf)
+
+    def close(self):
+        self.ser_port.close()
+
+#Serial_Writer set up for either protocol. protocol is "framed" or "legacy".
+def make_serial_writer(port_name, protocol="framed"):
+    if(protocol == "framed"):
+        return lx_output.Serial_Writer(port_name, c_framed_baud, encoder = encode_levels_frame, port_opener = open_framed_serial_port)
+    elif(protocol == "legacy"):
+        return lx_output.Serial_Writer(port_name, c_initial_baud)
+    raise ValueError("Unknown serial protocol " + str(protocol))
+
+#blocking backend (no writer thread) for tools like the log replayer
+def open_serial_output(port_name, protocol="framed"):
+    if(protocol == "framed"):
+        return Framed_Serial_Output(open_framed_serial_port(port_name))
+    elif(protocol == "legacy"):
+        return lx_output.Legacy_Serial_Output(lx_output.open_serial_port(port_name, c_initial_baud))
+    raise ValueError("Unknown serial protocol " + str(protocol))
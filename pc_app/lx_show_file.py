@@ -0,0 +1,67 @@
+########################################################################
+########################################################################
+###
+### Python_LX - A simple, Python and Arduino based DMX512 lighting console
+### by Chris Gerth - Summer/Fall 2014
+###
+### File - lx_show_file.py - read .plx show files without starting the GUI
+### Dependencies - none
+###
+########################################################################
+########################################################################
+
+import pickle
+
+#Show files are a pickled list of python_lx.py's Cue objects. Because python_lx.py
+#runs as a script they are pickled as __main__.Cue, which only exists inside the
+#GUI process. Anything else that wants to read a show maps that onto a cue class
+#of its own - Show_Cue unless told otherwise.
+
+#Bare stand-in for python_lx.Cue. Attributes come straight out of the pickle,
+#class-level defaults cover fields older shows don't have.
+class Show_Cue:
+    DELAY_TIME = 0.0
+    FOLLOW_TIME = None
+    PALETTES = ()
+    PALETTE_VERSIONS = ()
+    BASE_VALS = None
+    def __init__(self, i_cue_num, i_dmx_vals, i_up_time, i_down_time, i_desc_str, i_delay_time=0.0, i_follow_time=None):
+        self.CUE_NUM = i_cue_num
+        self.DMX_VALS = [int(round(v)) for v in i_dmx_vals]
+        self.UP_TIME = i_up_time
+        self.DOWN_TIME = i_down_time
+        self.DESCRIPTION = i_desc_str
+        self.DELAY_TIME = max(i_delay_time, 0.0)
+        if(i_follow_time != None):
+            self.FOLLOW_TIME = i_follow_time
+
+class _Show_Unpickler(pickle.Unpickler):
+    def __init__(self, in_file, cue_class):
+        try:
+            pickle.Unpickler.__init__(self, in_file, encoding = "latin1") #python 3 reading a python 2 pickle
+        except TypeError:
+            pickle.Unpickler.__init__(self, in_file)
+        self.cue_class = cue_class
+
+    def find_class(self, module, name):
+        if(name == "Cue" and module in ("__main__", "python_lx")):
+            return self.cue_class
+        return pickle.Unpickler.find_class(self, module, name)
+
+def load_show_file(fname, cue_class=Show_Cue):
+    l_file = open(fname, "rb")
+    try:
+        l_cue_list = _Show_Unpickler(l_file, cue_class).load()
+    finally:
+        l_file.close()
+    if(not isinstance(l_cue_list, list)):
+        raise ValueError("{} does not contain a cue list".format(fname))
+    return l_cue_list
+
+#Cue lists as plain tuples, for handing to another process (or file format)
+#without dragging whichever Cue class built them along.
+def pack_cue_list(cue_list):
+    return [(c.CUE_NUM, list(c.DMX_VALS), c.UP_TIME, c.DOWN_TIME, c.DESCRIPTION, c.DELAY_TIME, c.FOLLOW_TIME) for c in cue_list]
+
+def unpack_cue_list(packed, cue_class=Show_Cue):
+    return [cue_class(*t) for t in packed]
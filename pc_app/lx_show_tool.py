@@ -0,0 +1,283 @@
+########################################################################
+########################################################################
+###
+### Python_LX - A simple, Python and Arduino based DMX512 lighting console
+### by Chris Gerth - Summer/Fall 2014
+###
+### File - lx_show_tool.py - check, convert, summarize and diff a pile of
+###                          .plx show files from the command line
+### Dependencies - none
+###
+########################################################################
+########################################################################
+
+import os, sys, time, pickle, argparse, multiprocessing #system dependencies
+import lx_show_file, lx_tracking, lx_palettes
+
+#Every command takes any number of show files and/or directories (searched for
+#.plx files) and farms them out to a pool of worker processes, one show per
+#task. Results are printed as each show finishes rather than at the end, so a
+#big archive starts reporting straight away. The exit code is 1 if any show
+#had an error.
+#
+#   python lx_show_tool.py validate ../test_shows
+#   python lx_show_tool.py summarize ../test_shows
+#   python lx_show_tool.py diff --against ../test_shows/cue_list_test.plx ../test_shows
+#   python lx_show_tool.py diff old.plx new.plx
+#   python lx_show_tool.py convert --tracked --out-dir converted ../test_shows
+
+#Shows are pickled as __main__.Cue because python_lx.py runs as a script.
+#This file runs as a script too, so converted shows are written with this Cue
+#and load anywhere an original would.
+class Cue(lx_show_file.Show_Cue):
+    #python 3 can't write the old-style instances python 2 python_lx expects, so
+    #it rebuilds the cue by calling Cue() instead (python 2 ignores this)
+    def __reduce__(self):
+        l_state = dict(self.__dict__)
+        return (Cue, (self.CUE_NUM, [0]*len(self.DMX_VALS), self.UP_TIME, self.DOWN_TIME, self.DESCRIPTION,
+                      self.DELAY_TIME, self.FOLLOW_TIME), l_state)
+
+########################################################################
+### PER-SHOW WORK (runs in the worker processes)
+########################################################################
+#returns a list of (severity, message), severity "error" or "warning"
+def validate_cue_list(cue_list):
+    l_problems = []
+    if(len(cue_list) == 0):
+        return [("error", "show has no cues")]
+    l_num_ch = None
+    l_prev_num = None
+    for l_cue in cue_list:
+        try:
+            l_name = "cue {}".format(l_cue.CUE_NUM)
+            l_levels = list(l_cue.DMX_VALS)
+            if(l_num_ch == None):
+                l_num_ch = len(l_levels)
+            elif(len(l_levels) != l_num_ch):
+                l_problems.append(("error", "{} has {} channels, cue {} has {}".format(l_name, len(l_levels), cue_list[0].CUE_NUM, l_num_ch)))
+            l_bad = [ch+1 for ch in range(0, len(l_levels)) if not (0 <= l_levels[ch] <= 255)]
+            if(len(l_bad) > 0):
+                l_problems.append(("error", "{} has levels outside 0-255 on channel(s) {}".format(l_name, ", ".join(str(ch) for ch in l_bad[0:10]))))
+            if(l_prev_num != None and l_cue.CUE_NUM <= l_prev_num):
+                l_problems.append(("error", "{} is out of order after cue {}".format(l_name, l_prev_num)))
+            l_prev_num = l_cue.CUE_NUM
+            if(l_cue.UP_TIME <= 0 or l_cue.DOWN_TIME <= 0):
+                l_problems.append(("error", "{} has a zero or negative fade time".format(l_name)))
+            if(l_cue.DELAY_TIME < 0):
+                l_problems.append(("error", "{} has a negative delay".format(l_name)))
+            if(l_cue.FOLLOW_TIME != None and l_cue.FOLLOW_TIME <= 0):
+                l_problems.append(("error", "{} has a zero or negative follow time".format(l_name)))
+            if(l_cue.FOLLOW_TIME != None and l_cue is cue_list[-1]):
+                l_problems.append(("warning", "{} is the last cue but has a follow time".format(l_name)))
+            if(lx_palettes.is_stale(l_cue)):
+                l_problems.append(("warning", "{} was not re-resolved after a palette changed".format(l_name)))
+        except (AttributeError, TypeError) as e:
+            l_problems.append(("error", "cue {} is malformed: {}".format(cue_list.index(l_cue), e)))
+    return l_problems
+
+def summarize_cue_list(cue_list):
+    l_levels = [list(c.DMX_VALS) for c in cue_list]
+    l_changes = [sum(1 for (a, b) in zip(l_levels[i-1], l_levels[i]) if a != b) for i in range(1, len(l_levels))]
+    l_palettes = set()
+    for l_cue in cue_list:
+        l_palettes.update(p.name for p in l_cue.PALETTES)
+    return {"cues": len(cue_list),
+            "channels": len(l_levels[0]) if len(l_levels) > 0 else 0,
+            "first": cue_list[0].CUE_NUM if len(cue_list) > 0 else None,
+            "last": cue_list[-1].CUE_NUM if len(cue_list) > 0 else None,
+            "fade_time": sum(c.DELAY_TIME + max(c.UP_TIME, c.DOWN_TIME) for c in cue_list[1:]),
+            "follows": sum(1 for c in cue_list if c.FOLLOW_TIME != None),
+            "delays": sum(1 for c in cue_list if c.DELAY_TIME > 0),
+            "palettes": len(l_palettes),
+            "tracked": sum(1 for c in cue_list if isinstance(c.DMX_VALS, lx_tracking.Tracked_Levels)),
+            "avg_changes": float(sum(l_changes))/len(l_changes) if len(l_changes) > 0 else 0.0}
+
+#returns a list of difference descriptions, b compared to a
+def diff_cue_lists(cue_list_a, cue_list_b):
+    l_diffs = []
+    l_a = dict((c.CUE_NUM, c) for c in cue_list_a)
+    l_b = dict((c.CUE_NUM, c) for c in cue_list_b)
+    for l_num in sorted(set(l_a.keys()) | set(l_b.keys())):
+        if(l_num not in l_b):
+            l_diffs.append("cue {} removed".format(l_num))
+            continue
+        if(l_num not in l_a):
+            l_diffs.append("cue {} added".format(l_num))
+            continue
+        (l_cue_a, l_cue_b) = (l_a[l_num], l_b[l_num])
+        l_what = []
+        for (l_label, l_attr) in [("up", "UP_TIME"), ("down", "DOWN_TIME"), ("delay", "DELAY_TIME"), ("follow", "FOLLOW_TIME"), ("description", "DESCRIPTION")]:
+            if(getattr(l_cue_a, l_attr) != getattr(l_cue_b, l_attr)):
+                l_what.append("{} {!r} -> {!r}".format(l_label, getattr(l_cue_a, l_attr), getattr(l_cue_b, l_attr)))
+        l_levels_a = list(l_cue_a.DMX_VALS)
+        l_levels_b = list(l_cue_b.DMX_VALS)
+        l_channels = [ch for ch in range(0, max(len(l_levels_a), len(l_levels_b)))
+                      if ch >= len(l_levels_a) or ch >= len(l_levels_b) or l_levels_a[ch] != l_levels_b[ch]]
+        if(len(l_channels) > 0):
+            l_shown = ", ".join("ch{} {}->{}".format(ch+1, l_levels_a[ch] if ch < len(l_levels_a) else "-", l_levels_b[ch] if ch < len(l_levels_b) else "-")
+                                for ch in l_channels[0:8])
+            if(len(l_channels) > 8):
+                l_shown += ", ..."
+            l_what.append("{} levels ({})".format(len(l_channels), l_shown))
+        if(len(l_what) > 0):
+            l_diffs.append("cue {} changed: {}".format(l_num, "; ".join(l_what)))
+    return l_diffs
+
+#write cue_list to fname in the current format, optionally tracked or plain
+def convert_cue_list(cue_list, fname, tracked=None):
+    for l_cue in cue_list:
+        l_cue.__class__ = Cue #whatever class it was read as, it's written as __main__.Cue
+        #fields older shows only get from class defaults become real attributes
+        for l_attr in ["DELAY_TIME", "FOLLOW_TIME", "PALETTES", "PALETTE_VERSIONS", "BASE_VALS"]:
+            setattr(l_cue, l_attr, getattr(l_cue, l_attr))
+        if(not isinstance(l_cue.DMX_VALS, lx_tracking.Tracked_Levels)):
+            l_cue.DMX_VALS = [max(0, min(int(round(v)), 255)) for v in l_cue.DMX_VALS]
+    if(tracked == True):
+        lx_tracking.track_cue_list(cue_list, rebuild = True)
+    elif(tracked == False):
+        lx_tracking.untrack_cue_list(cue_list)
+    l_tmp_fname = fname + ".tmp"
+    l_file = open(l_tmp_fname, "wb")
+    try:
+        pickle.dump(cue_list, l_file, 2) #protocol 2 is the newest python 2 reads
+        l_file.close()
+        _replace_file(l_tmp_fname, fname) #never leave a half written show behind
+    except:
+        l_file.close()
+        if(os.path.exists(l_tmp_fname)):
+            os.remove(l_tmp_fname)
+        raise
+
+#os.rename won't replace an existing file on Windows under python 2, so the old
+#show is moved aside first and only deleted once the new one is in place
+def _replace_file(src, dst):
+    if(hasattr(os, "replace")): #python 3
+        os.replace(src, dst)
+        return
+    try:
+        os.rename(src, dst)
+        return
+    except OSError:
+        if(not os.path.exists(dst)):
+            raise
+    l_backup = dst + ".bak"
+    if(os.path.exists(l_backup)):
+        os.remove(l_backup)
+    os.rename(dst, l_backup)
+    try:
+        os.rename(src, dst)
+    except OSError:
+        os.rename(l_backup, dst) #put the original back
+        raise
+    os.remove(l_backup)
+
+#one task: (command, fname, options). Returns (fname, ok, lines) and never raises,
+#so one broken show can't take the pool down.
+def _run_task(task):
+    (l_command, l_fname, l_options) = task
+    try:
+        l_cue_list = lx_show_file.load_show_file(l_fname, Cue)
+        if(l_command == "validate"):
+            l_problems = validate_cue_list(l_cue_list)
+            l_ok = len([p for p in l_problems if p[0] == "error"]) == 0
+            l_lines = ["{}: {}".format(s, m) for (s, m) in l_problems]
+            if(len(l_lines) == 0):
+                l_lines = ["ok, {} cues".format(len(l_cue_list))]
+            return (l_fname, l_ok, l_lines)
+        elif(l_command == "summarize"):
+            l_ok = len([p for p in validate_cue_list(l_cue_list) if p[0] == "error"]) == 0
+            s = summarize_cue_list(l_cue_list)
+            return (l_fname, l_ok, ["{} cues ({} - {}), {} channels, {:.1f} s of fades, {} follows, {} delays, {} palettes, {} tracked, {:.1f} channels change per cue".format(
+                s["cues"], s["first"], s["last"], s["channels"], s["fade_time"], s["follows"], s["delays"], s["palettes"], s["tracked"], s["avg_changes"])])
+        elif(l_command == "diff"):
+            l_other = lx_show_file.load_show_file(l_options["against"], Cue)
+            l_diffs = diff_cue_lists(l_other, l_cue_list)
+            if(len(l_diffs) == 0):
+                l_diffs = ["identical to " + l_options["against"]]
+            return (l_fname, True, l_diffs)
+        else:
+            l_out = l_fname
+            if(l_options["out_dir"] != None):
+                l_out = os.path.join(l_options["out_dir"], os.path.basename(l_fname))
+            convert_cue_list(l_cue_list, l_out, l_options["tracked"])
+            return (l_fname, True, ["written to " + l_out])
+    except Exception as e:
+        return (l_fname, False, ["error: {}: {}".format(type(e).__name__, e)])
+
+########################################################################
+### COMMAND LINE
+########################################################################
+def find_show_files(paths):
+    l_files = []
+    for l_path in paths:
+        if(os.path.isdir(l_path)):
+            for (l_dir, l_subdirs, l_names) in os.walk(l_path):
+                l_subdirs.sort()
+                l_files.extend(os.path.join(l_dir, n) for n in sorted(l_names) if n.endswith(".plx"))
+        else:
+            l_files.append(l_path)
+    return l_files
+
+def main(argv):
+    parser = argparse.ArgumentParser(description = "Check, convert, summarize and diff python_lx show files in bulk")
+    sub = parser.add_subparsers(dest = "command")
+    for l_name in ["validate", "summarize", "diff", "convert"]:
+        p = sub.add_parser(l_name)
+        p.add_argument("paths", nargs = "+", help = "show files and/or directories of them")
+        p.add_argument("-j", "--jobs", type = int, default = None, help = "worker processes (default: one per CPU)")
+        if(l_name == "diff"):
+            p.add_argument("--against", default = None, help = "compare every show to this one (default: exactly two shows, second against first)")
+        if(l_name == "convert"):
+            p.add_argument("--out-dir", default = None, help = "write converted shows here")
+            p.add_argument("--in-place", action = "store_true", help = "write converted shows over the originals")
+            l_group = p.add_mutually_exclusive_group()
+            l_group.add_argument("--tracked", dest = "tracked", action = "store_const", const = True, default = None, help = "store cues as changes (lx_tracking.py)")
+            l_group.add_argument("--plain", dest = "tracked", action = "store_const", const = False, help = "store every level of every cue")
+    args = parser.parse_args(argv)
+
+    l_files = find_show_files(args.paths)
+    l_options = {}
+    if(args.command == "diff"):
+        if(args.against == None):
+            if(len(l_files) != 2):
+                parser.error("diff needs exactly two shows, or --against")
+            (args.against, l_files) = (l_files[0], l_files[1:])
+        l_options["against"] = args.against
+    if(args.command == "convert"):
+        if(args.out_dir == None and not args.in_place):
+            parser.error("convert needs --out-dir, or --in-place to overwrite the originals")
+        l_options["out_dir"] = args.out_dir
+        l_options["tracked"] = args.tracked
+        if(args.out_dir != None and not os.path.isdir(args.out_dir)):
+            os.makedirs(args.out_dir)
+    if(len(l_files) == 0):
+        print("No show files found")
+        return 1
+
+    l_start = time.time()
+    l_tasks = [(args.command, f, l_options) for f in l_files]
+    l_jobs = args.jobs or multiprocessing.cpu_count()
+    l_failed = 0
+    if(l_jobs <= 1 or len(l_tasks) == 1):
+        l_results = (_run_task(t) for t in l_tasks)
+        l_pool = None
+    else:
+        l_pool = multiprocessing.Pool(min(l_jobs, len(l_tasks)))
+        l_results = l_pool.imap_unordered(_run_task, l_tasks)
+    try:
+        for (l_fname, l_ok, l_lines) in l_results:
+            if(not l_ok):
+                l_failed += 1
+            print("{} [{}]".format(l_fname, "ok" if l_ok else "FAILED"))
+            for l_line in l_lines:
+                print("    " + l_line)
+            sys.stdout.flush()
+    finally:
+        if(l_pool != None):
+            l_pool.terminate()
+            l_pool.join()
+    print("{} shows, {} failed, {:.2f} s".format(len(l_tasks), l_failed, time.time() - l_start))
+    return 1 if l_failed > 0 else 0
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))
@@ -0,0 +1,330 @@
+########################################################################
+########################################################################
+###
+### Python_LX - A simple, Python and Arduino based DMX512 lighting console
+### by Chris Gerth - Summer/Fall 2014
+###
+### File - lx_stress.py - button-mash the playback engine from several
+###                       threads and check nothing breaks
+### Dependencies - none
+###
+########################################################################
+########################################################################
+
+import sys, time, random, threading, collections, argparse #system dependencies
+import lx_clock, lx_engine, lx_output, lx_show_file
+
+#The button-mashing bug was fixed by adding locks until it went away. This
+#makes it reproducible instead: a frame loop runs lx_engine.Playback_Engine
+#into a simulated output at the real frame rate, while operator threads fire
+#a seeded, pre-generated script of GO, BACK, GoTo, Set Ch, Release and Record
+#actions at it as fast as a panicking operator would. The fades, follows and
+#actions are the same engine calls python_lx's buttons make, serialized by a
+#stand-in for its button lock. What it doesn't cover is the rest of the GUI
+#path: Tk, the dialogs, the gui lock and the display updates of the timed
+#thread, and the pipe/ring hop to the output process. It reports:
+#  - latency: how long each action call took (mostly waiting on the engine
+#    lock), and from the action to the first frame sent with it applied. The
+#    frame loop holds the lock a little longer than the real one, since the
+#    checks run inside the same hold as the step.
+#  - frames that missed their deadline
+#  - invariant violations, checked on every frame:
+#      levels outside 0-255 or the wrong number of channels
+#      cue index outside the cue list
+#      a fading channel outside the range between where it started and its target
+#      a channel that isn't fading left somewhere other than the new cue's level
+#      a fade still running well past its fade time (stuck mid-fade)
+#      in standby, an uncaptured channel not at its cue's level (stuck, or a lost update)
+#The same seed always produces the same actions. With --virtual everything
+#runs in one thread on a virtual clock, so the interleaving is exact too and a
+#violation found that way reproduces every time.
+
+c_ACTIONS = ["go", "back", "goto", "set", "release", "record"]
+c_default_weights = [35, 15, 10, 20, 5, 15]
+c_stuck_margin = 0.25 #seconds past a fade's end before it counts as stuck
+
+#a show with short fades, some delays and a few auto-follows
+def make_stress_show(num_ch, num_cues, seed=0):
+    l_rand = random.Random(seed)
+    l_cue_list = []
+    l_levels = [0]*num_ch
+    for i in range(0, num_cues):
+        for j in range(0, l_rand.randint(1, max(1, num_ch//4))):
+            l_levels[l_rand.randrange(0, num_ch)] = l_rand.randint(0, 255)
+        l_delay = l_rand.choice([0.0, 0.0, 0.0, 0.1, 0.3])
+        l_follow = l_rand.choice([None, None, None, None, 0.4])
+        l_cue_list.append(lx_show_file.Show_Cue(i+1, l_levels, l_rand.uniform(0.1, 1.0), l_rand.uniform(0.1, 1.0), "stress", l_delay, l_follow))
+    return l_cue_list
+
+#per operator, a list of (seconds from start, action, arg)
+def make_action_scripts(num_actions, num_operators, mean_interval, num_ch, num_cues, seed=0, weights=c_default_weights):
+    l_scripts = []
+    for l_op in range(0, num_operators):
+        l_rand = random.Random(seed*1000 + l_op)
+        l_time = 0.0
+        l_script = []
+        for i in range(0, num_actions//num_operators):
+            l_time += l_rand.expovariate(1.0/mean_interval)
+            l_action = _weighted_choice(l_rand, c_ACTIONS, weights)
+            l_arg = None
+            if(l_action == "goto"):
+                l_arg = l_rand.randint(1, num_cues)
+            elif(l_action == "set"):
+                l_first = l_rand.randint(1, num_ch)
+                l_arg = (list(range(l_first, min(num_ch, l_first + l_rand.randint(0, 8)) + 1)), l_rand.randint(0, 255))
+            elif(l_action == "record"):
+                l_arg = round(l_rand.uniform(1, num_cues + 1), 1) #often between existing cues
+            l_script.append((l_time, l_action, l_arg))
+        l_scripts.append(l_script)
+    return l_scripts
+
+def _weighted_choice(rand, items, weights):
+    l_pick = rand.uniform(0, sum(weights))
+    for (l_item, l_weight) in zip(items, weights):
+        l_pick -= l_weight
+        if(l_pick <= 0):
+            return l_item
+    return items[-1]
+
+########################################################################
+### STRESS RUN
+########################################################################
+class Stress_Run:
+    def __init__(self, cue_list, num_ch, sec_per_frame, clock):
+        self.clock = clock
+        self.num_ch = num_ch
+        self.sec_per_frame = sec_per_frame
+        self.engine = lx_engine.Playback_Engine(cue_list, num_ch, clock = clock)
+        self.button_lock = threading.Lock() #python_lx's g_button_action_lock, one operator action at a time
+        self.output = lx_output.Null_Output()
+        self.applied = collections.deque() #(issue time, action) done but not yet seen in a frame
+        self.call_latency = {} #action -> [s]
+        self.frame_latency = {} #action -> [s]
+        self.violations = []
+        self.frame_count = 0
+        self.missed_frames = 0
+        self.max_lateness = 0.0
+        self.lateness = []
+
+    #one operator action, exactly what the gui (or output process) would do
+    def run_action(self, action, arg):
+        l_engine = self.engine
+        l_start = self.clock()
+        self.button_lock.acquire()
+        if(action == "go"):
+            l_engine.go(l_start)
+        elif(action == "back"):
+            l_engine.back(l_start)
+        elif(action == "goto"):
+            l_engine.goto(l_engine.cue_list[min(arg, len(l_engine.cue_list))-1].CUE_NUM, l_start)
+        elif(action == "set"):
+            l_engine.set_channels(arg[0], arg[1])
+        elif(action == "release"):
+            l_engine.release_captured()
+        elif(action == "record"):
+            l_engine.record_cue(lx_show_file.Show_Cue(arg, l_engine.cur_out, 0.5, 0.5, "recorded")) #what python_lx's insert_cue does
+        self.button_lock.release()
+        l_end = self.clock()
+        self.call_latency.setdefault(action, []).append(l_end - l_start)
+        self.applied.append((l_start, action))
+
+    #one frame: step, check what the step made, send it. The check shares the
+    #step's hold on the engine lock so no action can land in between.
+    def run_frame(self, now):
+        l_pending = len(self.applied) #anything applied before the step is in this frame
+        self.engine.lock.acquire()
+        try:
+            l_frame = list(self.engine.step(now))
+            self.check_invariants(l_frame, now)
+        finally:
+            self.engine.lock.release()
+        self.output.write_frame(l_frame)
+        l_sent = self.clock()
+        for i in range(0, l_pending):
+            (l_issue, l_action) = self.applied.popleft()
+            self.frame_latency.setdefault(l_action, []).append(l_sent - l_issue)
+        self.frame_count += 1
+
+    def check_invariants(self, frame, now):
+        l_engine = self.engine
+        l_engine.lock.acquire()
+        try:
+            if(len(frame) != self.num_ch or min(frame) < 0 or max(frame) > 255):
+                self._violation(now, "frame has {} channels, levels {}-{}".format(len(frame), min(frame), max(frame)))
+            if(l_engine.cur_cue_index < 0 or l_engine.cur_cue_index >= len(l_engine.cue_list)):
+                self._violation(now, "cue index {} outside a {} cue list".format(l_engine.cur_cue_index, len(l_engine.cue_list)))
+                return
+            l_cue = l_engine.cue_list[l_engine.cur_cue_index]
+            l_target = [int(round(v)) for v in l_cue.DMX_VALS]
+            l_out = frame
+            if(l_engine.state == lx_engine.c_STATE_STANDBY):
+                l_stuck = [i+1 for i in range(0, self.num_ch)
+                           if l_engine.ch_states[i] != lx_engine.c_CH_STATE_CAPTURED and l_out[i] != l_target[i]]
+                if(len(l_stuck) > 0):
+                    self._violation(now, "standby on cue {} but ch{} at {} not {}".format(
+                        l_cue.CUE_NUM, l_stuck[0], l_out[l_stuck[0]-1], l_target[l_stuck[0]-1]) + _more(l_stuck))
+            else:
+                if(now - l_engine.transition_start_time > lx_engine.fade_duration(l_cue) + c_stuck_margin):
+                    self._violation(now, "fade into cue {} still running {:.2f}s after it should have finished".format(
+                        l_cue.CUE_NUM, now - l_engine.transition_start_time - lx_engine.fade_duration(l_cue)))
+                l_held = [i+1 for i in range(0, self.num_ch)
+                          if l_engine.ch_states[i] == lx_engine.c_CH_STATE_NO_CHANGE and l_out[i] != l_target[i]]
+                if(len(l_held) > 0):
+                    i = l_held[0]-1
+                    self._violation(now, "ch{} held at {} during the fade into cue {}, which has it at {}".format(
+                        i+1, l_out[i], l_cue.CUE_NUM, l_target[i]) + _more(l_held))
+                l_outside = [i+1 for i in range(0, self.num_ch)
+                             if l_engine.ch_states[i] in (lx_engine.c_CH_STATE_INC, lx_engine.c_CH_STATE_DEC)
+                             and not (min(l_engine.prev_out[i], l_target[i]) <= l_out[i] <= max(l_engine.prev_out[i], l_target[i]))]
+                if(len(l_outside) > 0):
+                    i = l_outside[0]-1
+                    self._violation(now, "ch{} at {} outside its fade {} -> {}".format(i+1, l_out[i], l_engine.prev_out[i], l_target[i]) + _more(l_outside))
+        finally:
+            l_engine.lock.release()
+
+    def _violation(self, now, msg):
+        self.violations.append((now, msg))
+
+    #after the operators stop: let everything finish, then standby must be exact
+    def settle(self, now, max_wait):
+        l_end = now + max_wait
+        self.wait_until(now)
+        self.run_frame(now) #picks up the last actions
+        while(now < l_end and not self.engine.is_idle()):
+            now += self.sec_per_frame
+            self.wait_until(now)
+            self.run_frame(now)
+        if(not self.engine.is_idle()):
+            self._violation(now, "engine still busy {:.1f}s after the last action".format(max_wait))
+        return now
+
+    def wait_until(self, when):
+        if(isinstance(self.clock, lx_clock.Virtual_Clock)):
+            self.clock.advance_to(when)
+        else:
+            l_sleep = when - self.clock()
+            if(l_sleep > 0):
+                time.sleep(l_sleep)
+
+    def note_lateness(self, scheduled, now):
+        l_late = now - scheduled
+        self.lateness.append(max(0.0, l_late))
+        self.max_lateness = max(self.max_lateness, l_late)
+        if(l_late > self.sec_per_frame):
+            self.missed_frames += int(l_late/self.sec_per_frame)
+
+def _more(items):
+    if(len(items) > 1):
+        return " (+{} more channels)".format(len(items)-1)
+    return ""
+
+#real threads, real clock: the frame loop in one thread, each operator in its own
+def run_threaded(run, scripts):
+    l_start = run.clock()
+    l_done = [False]
+    def operator(script):
+        for (l_offset, l_action, l_arg) in script:
+            run.wait_until(l_start + l_offset)
+            run.run_action(l_action, l_arg)
+    l_operators = [threading.Thread(target = operator, args = (s,), name = "STRESS_OPERATOR_{}".format(i)) for (i, s) in enumerate(scripts)]
+    def frame_loop():
+        l_next = l_start
+        while(not l_done[0]):
+            run.wait_until(l_next)
+            l_now = run.clock()
+            run.note_lateness(l_next, l_now)
+            run.run_frame(l_now)
+            l_next += run.sec_per_frame
+            if(run.clock() > l_next):
+                l_next = run.clock() #same as the realtime loop: no burst of catch-up frames
+    l_frames = threading.Thread(target = frame_loop, name = "STRESS_FRAME_LOOP")
+    l_frames.start()
+    for l_thread in l_operators:
+        l_thread.start()
+    for l_thread in l_operators:
+        l_thread.join()
+    l_done[0] = True
+    l_frames.join()
+    return run.clock()
+
+#one thread, virtual clock: actions and frames merged in time order, exactly reproducible
+def run_virtual(run, scripts):
+    l_actions = sorted((t, op, a, arg) for (op, s) in enumerate(scripts) for (t, a, arg) in s)
+    l_frame_time = 0.0
+    for (l_time, l_op, l_action, l_arg) in l_actions:
+        while(l_frame_time <= l_time):
+            run.clock.advance_to(l_frame_time)
+            run.note_lateness(l_frame_time, l_frame_time)
+            run.run_frame(l_frame_time)
+            l_frame_time += run.sec_per_frame
+        run.clock.advance_to(l_time)
+        run.run_action(l_action, l_arg)
+    run.clock.advance_to(l_frame_time)
+    return l_frame_time
+
+def _percentiles(vals):
+    l_sorted = sorted(vals)
+    if(len(l_sorted) == 0):
+        return (0.0, 0.0, 0.0, 0.0)
+    def pct(p):
+        return l_sorted[min(len(l_sorted)-1, int(len(l_sorted)*p/100.0))]
+    return (pct(50), pct(90), pct(99), l_sorted[-1])
+
+def print_report(run, duration):
+    print("{:<8} {:>6}   {:>29}   {:>29}".format("", "", "call (ms) p50/p90/p99/max", "to frame (ms) p50/p90/p99/max"))
+    for l_action in c_ACTIONS:
+        l_calls = run.call_latency.get(l_action, [])
+        if(len(l_calls) == 0):
+            continue
+        l_c = _percentiles(l_calls)
+        l_f = _percentiles(run.frame_latency.get(l_action, []))
+        print("{:<8} {:>6}   {:>6.2f} {:>6.2f} {:>6.2f} {:>7.2f}   {:>6.2f} {:>6.2f} {:>6.2f} {:>7.2f}".format(
+            l_action, len(l_calls), l_c[0]*1000, l_c[1]*1000, l_c[2]*1000, l_c[3]*1000, l_f[0]*1000, l_f[1]*1000, l_f[2]*1000, l_f[3]*1000))
+    l_late = _percentiles(run.lateness)
+    print("{} frames in {:.1f} s, {} missed, lateness p99 {:.2f} ms max {:.2f} ms".format(
+        run.frame_count, duration, run.missed_frames, l_late[2]*1000, run.max_lateness*1000))
+    print("{} invariant violations".format(len(run.violations)))
+    for (l_time, l_msg) in run.violations[0:20]:
+        print("  t={:.3f}s {}".format(l_time, l_msg))
+    if(len(run.violations) > 20):
+        print("  ...")
+
+########################################################################
+### COMMAND LINE
+########################################################################
+def main(argv):
+    parser = argparse.ArgumentParser(description = "Stress the python_lx playback engine with concurrent operator input")
+    parser.add_argument("--show", default = None, help = ".plx show to use (default: a generated one)")
+    parser.add_argument("--actions", type = int, default = 3000)
+    parser.add_argument("--operators", type = int, default = 3, help = "threads firing actions at once")
+    parser.add_argument("--interval", type = float, default = 0.01, help = "mean seconds between one operator's actions")
+    parser.add_argument("--channels", type = int, default = 150)
+    parser.add_argument("--cues", type = int, default = 40)
+    parser.add_argument("--frame-time", type = float, default = 0.05)
+    parser.add_argument("--seed", type = int, default = 0)
+    parser.add_argument("--virtual", action = "store_true", help = "single thread on a virtual clock - exactly reproducible")
+    args = parser.parse_args(argv)
+
+    if(args.show != None):
+        l_cue_list = lx_show_file.load_show_file(args.show)
+    else:
+        l_cue_list = make_stress_show(args.channels, args.cues, args.seed)
+    l_num_ch = len(l_cue_list[0].DMX_VALS)
+    l_scripts = make_action_scripts(args.actions, args.operators, args.interval, l_num_ch, len(l_cue_list), args.seed)
+    l_clock = lx_clock.Virtual_Clock() if args.virtual else lx_clock.monotonic
+    l_run = Stress_Run(l_cue_list, l_num_ch, args.frame_time, l_clock)
+
+    l_start = l_clock()
+    if(args.virtual):
+        l_end = run_virtual(l_run, l_scripts)
+    else:
+        l_end = run_threaded(l_run, l_scripts)
+    l_longest = max(c.DELAY_TIME + lx_engine.fade_duration(c) for c in l_run.engine.cue_list)
+    l_end = l_run.settle(l_end, l_longest + 1.0)
+    print("{} actions from {} operators, {} mode, seed {}".format(sum(len(s) for s in l_scripts), args.operators,
+                                                                 "virtual" if args.virtual else "threaded", args.seed))
+    print_report(l_run, l_end - l_start)
+    return 1 if len(l_run.violations) > 0 else 0
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))
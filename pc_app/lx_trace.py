@@ -0,0 +1,233 @@
+########################################################################
+########################################################################
+###
+### Python_LX - A simple, Python and Arduino based DMX512 lighting console
+### by Chris Gerth - Summer/Fall 2014
+###
+### File - lx_trace.py - record lock waits/holds and frame phases to a
+###                      trace file
+### Dependencies - none
+###
+########################################################################
+########################################################################
+
+import sys, json, array, threading, argparse #system dependencies
+import lx_clock
+
+#Opt-in instrumentation for the locks and the realtime loop. Set c_trace_file
+#in python_lx.py and:
+#  - g_dmx_vals_lock, g_button_action_lock and g_gui_access_lock are wrapped in
+#    Traced_Lock, which records how long each acquire waited and how long the
+#    lock was then held, per thread
+#  - the timed thread marks the phases of every frame (engine step, gui
+#    update, output) and the gui thread marks button actions
+#On exit everything is written in the Chrome trace event format - open it in
+#chrome://tracing or https://ui.perfetto.dev - and a lock summary is printed.
+#With c_trace_file = None none of this exists and the locks are the plain ones.
+#
+#A failed acquire(blocking=0) isn't a wait on its own, but the timed thread
+#spins on those for the gui lock, so the wait recorded for the acquire that
+#finally succeeds starts at the first failed try.
+
+c_max_events = 2000000 #stop recording (and say so) past this, about 400MB of trace
+c_min_wait_event = 0.00005 #waits shorter than this only go into the statistics, not the timeline
+
+class Tracer:
+    def __init__(self, fname):
+        self.fname = fname
+        self.start_time = lx_clock.monotonic()
+        self.events = []
+        self.dropped = 0
+        self.local = threading.local()
+        self.lock_stats = {} #lock name -> {"wait": array of s, "hold": array of s, "failed": count}
+        self.stats_lock = threading.Lock()
+        self.thread_names = {}
+
+    def _us(self, t):
+        return int((t - self.start_time)*1000000.0)
+
+    def _add(self, event):
+        if(len(self.events) >= c_max_events):
+            self.dropped += 1
+            return
+        l_thread = threading.current_thread()
+        event["pid"] = 1
+        event["tid"] = l_thread.ident
+        if(l_thread.ident not in self.thread_names):
+            self.thread_names[l_thread.ident] = l_thread.name
+        self.events.append(event) #list.append is atomic, no lock needed
+
+    #a span from start to end (lx_clock times)
+    def complete(self, name, category, start, end, args=None):
+        l_event = {"name": name, "cat": category, "ph": "X", "ts": self._us(start), "dur": max(0, self._us(end) - self._us(start))}
+        if(args != None):
+            l_event["args"] = args
+        self._add(l_event)
+
+    #a moment, e.g. a missed frame deadline
+    def instant(self, name, category, args=None):
+        l_event = {"name": name, "cat": category, "ph": "i", "s": "t", "ts": self._us(lx_clock.monotonic())}
+        if(args != None):
+            l_event["args"] = args
+        self._add(l_event)
+
+    #nested spans on the calling thread: begin("GO") ... end()
+    def begin(self, name, category="phase"):
+        l_stack = getattr(self.local, "stack", None)
+        if(l_stack == None):
+            l_stack = self.local.stack = []
+        l_stack.append((name, category, lx_clock.monotonic()))
+
+    def end(self):
+        l_stack = getattr(self.local, "stack", None)
+        if(l_stack):
+            (l_name, l_category, l_start) = l_stack.pop()
+            self.complete(l_name, l_category, l_start, lx_clock.monotonic())
+
+    def _lock_stats(self, name):
+        l_stats = self.lock_stats.get(name)
+        if(l_stats == None):
+            self.stats_lock.acquire()
+            l_stats = self.lock_stats.setdefault(name, {"wait": array.array("d"), "hold": array.array("d"), "failed": 0})
+            self.stats_lock.release()
+        return l_stats
+
+    def lock_waited(self, name, start, end):
+        l_stats = self._lock_stats(name)
+        if(len(l_stats["wait"]) < c_max_events):
+            l_stats["wait"].append(end - start)
+        if(end - start >= c_min_wait_event):
+            self.complete("wait " + name, "lock wait", start, end)
+
+    def lock_held(self, name, start, end):
+        l_stats = self._lock_stats(name)
+        if(len(l_stats["hold"]) < c_max_events):
+            l_stats["hold"].append(end - start)
+        self.complete(name, "lock hold", start, end)
+
+    def lock_try_failed(self, name):
+        self._lock_stats(name)["failed"] += 1
+
+    #{lock name: {"acquires", "failed_tries", "wait_p50", "wait_p99", "wait_max", "hold_p50", ...}}, times in seconds
+    def summary(self):
+        l_out = {}
+        for (l_name, l_stats) in sorted(self.lock_stats.items()):
+            l_row = {"acquires": len(l_stats["wait"]), "failed_tries": l_stats["failed"]}
+            for l_kind in ["wait", "hold"]:
+                l_sorted = sorted(l_stats[l_kind])
+                l_row[l_kind + "_p50"] = _percentile(l_sorted, 50)
+                l_row[l_kind + "_p99"] = _percentile(l_sorted, 99)
+                l_row[l_kind + "_max"] = l_sorted[-1] if len(l_sorted) > 0 else 0.0
+            l_out[l_name] = l_row
+        return l_out
+
+    def save(self):
+        l_events = list(self.events)
+        for (l_ident, l_name) in self.thread_names.items():
+            l_events.append({"name": "thread_name", "ph": "M", "pid": 1, "tid": l_ident, "args": {"name": l_name}})
+        l_file = open(self.fname, "w")
+        try:
+            json.dump({"traceEvents": l_events, "displayTimeUnit": "ms",
+                       "otherData": {"lock_summary": self.summary(), "dropped_events": self.dropped}}, l_file)
+        finally:
+            l_file.close()
+        return len(l_events)
+
+def _percentile(sorted_vals, pct):
+    if(len(sorted_vals) == 0):
+        return 0.0
+    return sorted_vals[min(len(sorted_vals)-1, int(len(sorted_vals)*pct/100.0))]
+
+def print_summary(summary):
+    print("{:<22} {:>9} {:>7} {:>9} {:>9} {:>9} {:>9} {:>9} {:>9}".format(
+        "lock", "acquires", "failed", "wait p50", "wait p99", "wait max", "hold p50", "hold p99", "hold max"))
+    for (l_name, l_row) in sorted(summary.items()):
+        print("{:<22} {:>9} {:>7} {:>7.3f}ms {:>7.3f}ms {:>7.3f}ms {:>7.3f}ms {:>7.3f}ms {:>7.3f}ms".format(
+            l_name, l_row["acquires"], l_row["failed_tries"],
+            l_row["wait_p50"]*1000.0, l_row["wait_p99"]*1000.0, l_row["wait_max"]*1000.0,
+            l_row["hold_p50"]*1000.0, l_row["hold_p99"]*1000.0, l_row["hold_max"]*1000.0))
+
+########################################################################
+### TRACED LOCK
+########################################################################
+#Stands in for a threading.Lock or RLock, same acquire()/release() calls.
+#For an RLock only the outermost acquire and release of each thread count.
+class Traced_Lock:
+    def __init__(self, lock, name, tracer):
+        self.lock = lock
+        self.name = name
+        self.tracer = tracer
+        self.local = threading.local()
+
+    def acquire(self, blocking=1):
+        l_local = self.local
+        if(getattr(l_local, "depth", 0) > 0): #RLock re-entry
+            l_ok = self.lock.acquire(blocking)
+            if(l_ok):
+                l_local.depth += 1
+            return l_ok
+        l_start = lx_clock.monotonic()
+        l_ok = self.lock.acquire(blocking)
+        l_now = lx_clock.monotonic()
+        if(not l_ok):
+            if(getattr(l_local, "spin_start", None) == None):
+                l_local.spin_start = l_start
+            self.tracer.lock_try_failed(self.name)
+            return False
+        l_wait_start = getattr(l_local, "spin_start", None)
+        if(l_wait_start == None):
+            l_wait_start = l_start
+        l_local.spin_start = None
+        l_local.depth = 1
+        l_local.acquired_time = l_now
+        self.tracer.lock_waited(self.name, l_wait_start, l_now)
+        return True
+
+    def release(self):
+        l_local = self.local
+        l_local.depth = getattr(l_local, "depth", 1) - 1
+        if(l_local.depth == 0):
+            self.tracer.lock_held(self.name, l_local.acquired_time, lx_clock.monotonic())
+        self.lock.release()
+
+    def __enter__(self):
+        self.acquire()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.release()
+        return False
+
+########################################################################
+### COMMAND LINE
+########################################################################
+#summarize a trace written by python_lx: lock table plus phase timings
+def main(argv):
+    parser = argparse.ArgumentParser(description = "Summarize a python_lx lock/frame trace")
+    parser.add_argument("trace_file")
+    args = parser.parse_args(argv)
+
+    l_file = open(args.trace_file, "r")
+    try:
+        l_trace = json.load(l_file)
+    finally:
+        l_file.close()
+    l_other = l_trace.get("otherData", {})
+    print_summary(l_other.get("lock_summary", {}))
+    if(l_other.get("dropped_events", 0) > 0):
+        print("{} events were dropped (trace full)".format(l_other["dropped_events"]))
+    l_phases = {}
+    for l_event in l_trace["traceEvents"]:
+        if(l_event.get("ph") == "X" and l_event.get("cat") == "phase"):
+            l_phases.setdefault(l_event["name"], []).append(l_event["dur"]/1000.0)
+    print("")
+    print("{:<22} {:>9} {:>9} {:>9} {:>9}".format("phase", "count", "p50", "p99", "max"))
+    for (l_name, l_durs) in sorted(l_phases.items()):
+        l_durs.sort()
+        print("{:<22} {:>9} {:>7.3f}ms {:>7.3f}ms {:>7.3f}ms".format(l_name, len(l_durs), _percentile(l_durs, 50), _percentile(l_durs, 99), l_durs[-1]))
+    l_missed = len([e for e in l_trace["traceEvents"] if e.get("ph") == "i" and e.get("name") == "missed deadline"])
+    print("{} missed frame deadlines".format(l_missed))
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))
@@ -0,0 +1,228 @@
+########################################################################
+########################################################################
+###
+### Python_LX - A simple, Python and Arduino based DMX512 lighting console
+### by Chris Gerth - Summer/Fall 2014
+###
+### File - lx_tracking.py - store cue levels as changes from the cue before
+### Dependencies - none
+###
+########################################################################
+########################################################################
+
+import sys, time, array, pickle, threading, argparse #system dependencies
+
+#Consecutive cues usually differ in a handful of channels, so storing every
+#level of every cue is mostly storing the same numbers again. Tracked_Levels
+#is a drop-in for a cue's DMX_VALS list that holds only the channels that
+#differ from the previous cue's levels, plus a reference to those levels.
+#Every c_checkpoint_interval cues (or whenever a delta wouldn't be smaller)
+#the levels are stored in full instead, so rebuilding any cue walks back at
+#most that many deltas, however long the show is.
+#
+#Rebuilt cues go in a small cache. Playback goes through the list in order,
+#so the cue before is almost always cached and GO costs one delta.
+#
+#Tracked_Levels never change once built - same as Cues - so an edit doesn't
+#disturb anything else that refers to them (the cue after it, undo history).
+#Pickling keeps the references, so show files shrink the same way.
+
+c_checkpoint_interval = 16 #most deltas between full copies
+c_cache_size = 16 #rebuilt cues kept
+
+_g_cache = {} #id(levels) -> (levels, full list)
+_g_cache_order = []
+_g_cache_lock = threading.Lock()
+
+class Tracked_Levels:
+    def __init__(self, levels, base=None, checkpoint_interval=c_checkpoint_interval):
+        l_levels = bytearray([max(0, min(int(round(v)), 255)) for v in levels])
+        self.num_ch = len(l_levels)
+        self.base = None
+        self.depth = 0 #deltas back to the nearest full copy
+        self.indices = None
+        self.values = l_levels
+        if(base != None and len(base) == self.num_ch and base.depth + 1 < checkpoint_interval):
+            l_base_levels = base.full()
+            l_changed = [i for i in range(0, self.num_ch) if l_levels[i] != l_base_levels[i]]
+            if(len(l_changed)*3 < self.num_ch): #2 byte index + 1 byte level each, vs 1 byte per channel
+                self.base = base
+                self.depth = base.depth + 1
+                self.indices = array.array("H", l_changed)
+                self.values = bytearray([l_levels[i] for i in l_changed])
+
+    def is_checkpoint(self):
+        return self.base == None
+
+    #the levels as a new list
+    def full(self):
+        return list(self._cached())
+
+    def __len__(self):
+        return self.num_ch
+
+    def __getitem__(self, index):
+        return self._cached()[index]
+
+    def __iter__(self):
+        return iter(self._cached())
+
+    def __repr__(self):
+        return "Tracked_Levels({})".format(self._cached())
+
+    #shared with other callers, never modify it
+    def _cached(self):
+        l_hit = _g_cache.get(id(self))
+        if(l_hit != None and l_hit[0] is self):
+            return l_hit[1]
+        #walk back to a cached cue or a full copy, then replay the deltas forward
+        l_chain = []
+        l_node = self
+        l_levels = None
+        while(True):
+            l_hit = _g_cache.get(id(l_node))
+            if(l_hit != None and l_hit[0] is l_node):
+                l_levels = list(l_hit[1])
+                break
+            if(l_node.base == None):
+                l_levels = list(l_node.values)
+                break
+            l_chain.append(l_node)
+            l_node = l_node.base
+        for l_node in reversed(l_chain):
+            for (i, v) in zip(l_node.indices, l_node.values):
+                l_levels[i] = v
+        _cache_put(self, l_levels)
+        return l_levels
+
+    #plain lists in the pickle, so python 2 and 3 can both read it
+    def __getstate__(self):
+        l_indices = None
+        if(self.indices != None):
+            l_indices = list(self.indices)
+        return (self.num_ch, self.base, self.depth, l_indices, list(self.values))
+
+    def __setstate__(self, state):
+        (self.num_ch, self.base, self.depth, l_indices, l_values) = state
+        self.indices = None
+        if(l_indices != None):
+            self.indices = array.array("H", l_indices)
+        self.values = bytearray(l_values)
+
+    #python 3 can't write old-style instances for python 2 to read, so it
+    #pickles a call to _restore_levels instead (python 2 ignores this)
+    def __reduce__(self):
+        return (_restore_levels, (self.__getstate__(),))
+
+def _restore_levels(state):
+    l_levels = Tracked_Levels([])
+    l_levels.__setstate__(state)
+    return l_levels
+
+def _cache_put(levels, full_list):
+    _g_cache_lock.acquire()
+    if(id(levels) not in _g_cache):
+        _g_cache_order.append(id(levels))
+    _g_cache[id(levels)] = (levels, full_list)
+    while(len(_g_cache_order) > c_cache_size):
+        _g_cache.pop(_g_cache_order.pop(0), None)
+    _g_cache_lock.release()
+
+#Store every cue in cue_list as changes from the one before. Cues whose levels
+#are already tracked are left alone unless rebuild is set, which re-encodes
+#the whole list against its current order (dropping references to cues that
+#have since been overwritten - do it before saving).
+def track_cue_list(cue_list, checkpoint_interval=c_checkpoint_interval, rebuild=False):
+    l_prev = None
+    for l_cue in cue_list:
+        if(rebuild or not isinstance(l_cue.DMX_VALS, Tracked_Levels)):
+            l_cue.DMX_VALS = Tracked_Levels(l_cue.DMX_VALS, l_prev, checkpoint_interval)
+        l_prev = l_cue.DMX_VALS
+
+#back to plain lists, e.g. for a show that has to load in an older python_lx
+def untrack_cue_list(cue_list):
+    for l_cue in cue_list:
+        if(isinstance(l_cue.DMX_VALS, Tracked_Levels)):
+            l_cue.DMX_VALS = l_cue.DMX_VALS.full()
+
+def clear_cache():
+    _g_cache_lock.acquire()
+    _g_cache.clear()
+    del _g_cache_order[:]
+    _g_cache_lock.release()
+
+#stored bytes of level data, cue list tracked vs plain
+def tracking_stats(cue_list):
+    l_checkpoints = 0
+    l_changes = 0
+    l_stored = 0
+    l_plain = 0
+    for l_cue in cue_list:
+        l_levels = l_cue.DMX_VALS
+        l_plain += len(l_levels)
+        if(not isinstance(l_levels, Tracked_Levels)):
+            l_stored += len(l_levels)
+        elif(l_levels.is_checkpoint()):
+            l_checkpoints += 1
+            l_stored += len(l_levels.values)
+        else:
+            l_changes += len(l_levels.values)
+            l_stored += 3*len(l_levels.values)
+    return {"cues": len(cue_list), "checkpoints": l_checkpoints, "changes": l_changes,
+            "stored_bytes": l_stored, "plain_bytes": l_plain}
+
+########################################################################
+### COMMAND LINE
+########################################################################
+#how much a show shrinks, and what it costs to play back
+def main(argv):
+    import lx_show_file
+    parser = argparse.ArgumentParser(description = "Measure tracked cue storage on a python_lx show")
+    parser.add_argument("show_file", nargs = "?", default = None, help = ".plx show (a generated 1000 cue, 512 channel show if none)")
+    parser.add_argument("--interval", type = int, default = c_checkpoint_interval, help = "deltas between full copies")
+    args = parser.parse_args(argv)
+
+    if(args.show_file != None):
+        l_cue_list = lx_show_file.load_show_file(args.show_file)
+    else:
+        import random
+        l_rand = random.Random(0)
+        l_levels = [0]*512
+        l_cue_list = []
+        for i in range(0, 1000):
+            for j in range(0, l_rand.randint(1, 12)):
+                l_levels[l_rand.randrange(0, 512)] = l_rand.randint(0, 255)
+            l_cue_list.append(lx_show_file.Show_Cue(i + 1, l_levels, 3.0, 3.0, ""))
+    l_plain_pickle = len(pickle.dumps(l_cue_list, 2))
+    l_plain_levels = [list(c.DMX_VALS) for c in l_cue_list]
+
+    l_start = time.time()
+    track_cue_list(l_cue_list, args.interval)
+    l_track_time = time.time() - l_start
+    l_stats = tracking_stats(l_cue_list)
+    print("{} cues: {} full copies, {} channel changes".format(l_stats["cues"], l_stats["checkpoints"], l_stats["changes"]))
+    print("level data: {} bytes tracked, {} bytes plain ({:.1f}x smaller), tracked in {:.1f} ms".format(
+        l_stats["stored_bytes"], l_stats["plain_bytes"], float(l_stats["plain_bytes"])/max(1, l_stats["stored_bytes"]), l_track_time*1000.0))
+    print("pickled show: {} bytes tracked, {} bytes plain".format(len(pickle.dumps(l_cue_list, 2)), l_plain_pickle))
+
+    #playing through in order, and jumping around cold
+    for i in range(0, len(l_cue_list)):
+        if(l_cue_list[i].DMX_VALS.full() != l_plain_levels[i]):
+            print("cue {} does not match".format(l_cue_list[i].CUE_NUM))
+            return 1
+    clear_cache()
+    l_start = time.time()
+    for l_cue in l_cue_list:
+        l_cue.DMX_VALS[0]
+    l_in_order = (time.time() - l_start)/len(l_cue_list)
+    l_worst = 0.0
+    for l_cue in l_cue_list:
+        clear_cache()
+        l_start = time.time()
+        l_cue.DMX_VALS[0]
+        l_worst = max(l_worst, time.time() - l_start)
+    print("rebuild: {:.3f} ms per cue in order, {:.3f} ms worst case cold".format(l_in_order*1000.0, l_worst*1000.0))
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))
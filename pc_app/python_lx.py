@@ -16,6 +16,9 @@ import tkFileDialog #file io dialogue boxes
 import cPickle #python object mashing for file io
 import serial #arduino communication
 import os, sys, math, threading, time, datetime, copy, array, re #system dependencies
+from sys import platform as _platform
+import lx_clock, lx_output, lx_dmx_log, lx_output_process, lx_serial_protocol, lx_firmware_fade, lx_effects, lx_masters, lx_patch, lx_history, lx_tracking, lx_palettes, lx_trace, lx_monitor #python_lx support modules
+from lx_engine import * #fade math, state "enums", cue scheduler
 
 
 ########################################################################
@@ -25,25 +28,23 @@ import os, sys, math, threading, time, datetime, copy, array, re #system depende
 c_dmx_disp_row_width = 32
 c_max_dmx_ch = 150; #highest DMX channel. Must be in range [1,512]
 c_sec_per_frame = 0.05; #refresh rate for dmx channel data
-
-#"enum" def for states of the system
-c_STATE_NOT_READY = -1
-c_STATE_STANDBY = 0
-c_STATE_TRANSITION_FWD = 1
-c_STATE_TRANSITION_BKW = 2
-
-c_CH_STATE_NO_CHANGE = 0
-c_CH_STATE_INC = 1
-c_CH_STATE_DEC = 2
-c_CH_STATE_CAPTURED = 3
+c_record_dmx_output = False #set True to log every transmitted frame to a .plxlog file (replay with lx_dmx_log.py)
+c_serial_protocol = "framed" #"framed" (checksummed, fast baud) or "legacy" (0x10 start byte) - must match the arduino sketch
+c_use_output_process = False #set True to generate and send frames from a separate process (see lx_output_process.py)
+c_num_submasters = 4 #submaster faders next to the grand master
+c_patch_file = None #patch file mapping channels to DMX addresses with dimmer curves (see lx_patch.py). None = channel n is address n
+c_output_universe = 1 #which patch universe goes out the serial port
+c_undo_depth = 1000 #cue list edits that can be undone
+c_tracked_cues = False #set True to store each cue as changes from the cue before, with a full copy every few cues (see lx_tracking.py)
+c_firmware_fades = False #set True to have the arduino run fades itself (needs the "framed" protocol, see lx_firmware_fade.py)
+c_trace_file = None #set to a file name (e.g. "python_lx_trace.json") to record lock waits and frame phases, see lx_trace.py
+c_monitor_port = None #set to a TCP port (e.g. 5742) to stream the live output to monitors on this machine, see lx_monitor.py
+
+#"enum" defs for states of the system (c_STATE_*, c_CH_STATE_*) live in lx_engine.py
 
 #Initialize global data
 def init_global_data():
     #Variables which will be global:
-    global g_cur_dmx_output
-    global g_prev_dmx_output
-    global g_cur_cue_index
-    global g_ch_states_array
     global g_entered_cue_num
     global g_entered_up_time
     global g_entered_down_time
@@ -54,10 +55,11 @@ def init_global_data():
 
 
     #set default values for these variables
-    g_cur_dmx_output = [0]*c_max_dmx_ch # current dmx frame output values
-    g_prev_dmx_output = [0]*c_max_dmx_ch #dmx frame right before the go or back button was pushed
-    g_cur_cue_index = 0 
-    g_ch_states_array = [c_CH_STATE_NO_CHANGE]*c_max_dmx_ch
+    g_dmx_vals_lock.acquire()
+    g_cur_dmx_output[:] = [0]*c_max_dmx_ch
+    g_prev_dmx_output[:] = [0]*c_max_dmx_ch
+    g_ch_states_array[:] = [c_CH_STATE_NO_CHANGE]*c_max_dmx_ch
+    g_dmx_vals_lock.release()
 
 
     #User-entered numbers for cue information
@@ -71,12 +73,28 @@ def init_global_data():
 
 
     g_cue_list = [];
+    g_engine.set_cue_list(g_cue_list, 0)
+    g_engine.scheduler.cancel_all() #follows from the old show shouldn't fire in the new one
 
 
 #global variables which should not be tuned or altered when a new show is loaded
 g_kill_timed_thread = 0; #set to 1 on exit
-g_sec_into_transition = 0.0;
-g_state = c_STATE_NOT_READY; #current state of the system
+g_engine = Playback_Engine([], c_max_dmx_ch) #cue index, state, fades and auto-follows (see lx_engine.py) - the same engine the output process runs
+g_engine.state = c_STATE_NOT_READY #until the first cue list is loaded
+g_cur_dmx_output = g_engine.cur_out # current dmx frame output values - these three are the engine's own lists, changed in place, never replaced
+g_prev_dmx_output = g_engine.prev_out #dmx frame right before the go or back button was pushed
+g_ch_states_array = g_engine.ch_states
+g_transitions_started = 0 #counted by engine_transition_started, so the timed thread can redraw after an auto-follow
+g_output_process = None #lx_output_process.Output_Process when c_use_output_process is set
+g_fade_sender = None #lx_firmware_fade.Firmware_Fade_Sender when c_firmware_fades is set
+g_effects = lx_effects.Effects_Engine() #running chases/waveforms, merged into each frame on its way out
+g_effect_count = 0 #for naming effects
+g_masters = lx_masters.Master_Stage(c_max_dmx_ch, c_num_submasters) #grand master, blackout, submasters - applied just before transmission
+g_patch = None #lx_patch.Patch when c_patch_file is set - the very last step before transmission
+g_cue_history = lx_history.Cue_History(c_undo_depth) #undo/redo of cue list edits
+g_palettes = lx_palettes.Palette_Library() #named looks cues can refer to
+g_tracer = None #lx_trace.Tracer when c_trace_file is set
+g_monitor = None #lx_monitor.Monitor_Publisher when c_monitor_port is set and there's no output process
 
 #so this is technically multithreaded. And has shared resources. Which
 #implies the need for some sort of locking strategy. I suppose in the 
@@ -108,7 +126,9 @@ g_gui_access_lock = threading.RLock()
 #of going for low-hanging fruit first, most of the crashes seem to be fixed when 
 #we simply lock the g_cur_dmx_output variable. Every write (and most of the reads)
 #to g_cur_dmx_output will be surrounded by a lock and guaranteed atomic.
-g_dmx_vals_lock = threading.Lock()
+#g_cur_dmx_output belongs to g_engine, so this is the engine's own lock, which
+#also covers the cue index, channel states and fade state.
+g_dmx_vals_lock = g_engine.lock
 
 #turns out it's also good to lock when resources shared by button action functions
 #and timed loop. This seems to be the source of the illusive button-mashing bug.
@@ -124,13 +144,23 @@ g_button_action_lock = threading.Lock()
 ########################################################################
 #Cues are members in a python list
 #Each cue is a struct of the dmx values, the cue number, and the transition timing information
+#DELAY_TIME is how long after GO the fade actually starts. FOLLOW_TIME, if not None,
+#is how long after this cue is triggered the next cue gets triggered automatically.
 class Cue:
-    def __init__(self, i_cue_num, i_dmx_vals,i_up_time, i_down_time, i_desc_str):
+    DELAY_TIME = 0.0 #class-level defaults so shows saved before these existed still load
+    FOLLOW_TIME = None
+    PALETTES = () #lx_palettes.Palette objects this cue takes levels from, see lx_palettes.py
+    PALETTE_VERSIONS = ()
+    BASE_VALS = None #levels as recorded, before palettes - only set on cues that use palettes
+    def __init__(self, i_cue_num, i_dmx_vals,i_up_time, i_down_time, i_desc_str, i_delay_time=0.0, i_follow_time=None):
         self.CUE_NUM = copy.deepcopy(i_cue_num) #do nothing if we're in standby (steady state)
         self.DMX_VALS = copy.deepcopy(map(int,map(round,i_dmx_vals)))
         self.UP_TIME = copy.deepcopy(max(i_up_time, c_sec_per_frame)) #can't actually have zero transition time
         self.DOWN_TIME = copy.deepcopy(max(i_down_time, c_sec_per_frame)) #can't actually have zero transition time
         self.DESCRIPTION = copy.deepcopy(i_desc_str)
+        self.DELAY_TIME = copy.deepcopy(max(i_delay_time, 0.0))
+        if(i_follow_time != None):
+            self.FOLLOW_TIME = copy.deepcopy(max(i_follow_time, c_sec_per_frame))
         
 ########################################################################
 ### END CUE DEFINITION
@@ -141,41 +171,20 @@ class Cue:
 ########################################################################
 #the Cue List is a python list. These functions are used to insert or remove cues from the list
 
-def insert_cue(cue_num, dmx_vals,up_time, down_time, desc_str):
-    global g_cur_cue_index
-    #case, insert only cue
-    if(len(g_cue_list) == 0):
-        print("Inserting cue into empty list")
-        g_cue_list.append(Cue(cue_num, dmx_vals,up_time,down_time,desc_str))
-        g_cur_cue_index = 0
-    #case, insert first cue
-    elif(cue_num < g_cue_list[0].CUE_NUM):
-        print("inserting cue into the first slot in the list")
-        g_cue_list.insert(0, Cue(cue_num, dmx_vals,up_time,down_time,desc_str))
-        g_cur_cue_index = 0
-    #case, insert last cue
-    elif(cue_num > g_cue_list[len(g_cue_list)-1].CUE_NUM):
+def insert_cue(cue_num, dmx_vals,up_time, down_time, desc_str, delay_time=0.0, follow_time=None, palette_names=()):
+    l_cue = Cue(cue_num, dmx_vals,up_time,down_time,desc_str,delay_time,follow_time)
+    if(len(palette_names) > 0):
+        l_cue = g_palettes.attach(l_cue, palette_names) #resolved before it goes in the list, cues there never change
+    (l_index, l_replace) = find_cue_slot(g_cue_list, cue_num)
+    if(l_replace):
+        print("Overwriting Cue #" + str(cue_num))
+    elif(l_index == len(g_cue_list)):
         print("Inserting cue into last slot in list")
-        g_cue_list.append(Cue(cue_num, dmx_vals,up_time,down_time,desc_str))
-        g_cur_cue_index = len(g_cue_list)-1
-    #case, replace last cue
-    elif(cue_num == g_cue_list[len(g_cue_list)-1].CUE_NUM):
-        print("Overwriting last cue in list")
-        g_cue_list[len(g_cue_list)-1] = Cue(cue_num, dmx_vals,up_time,down_time,desc_str)
-        g_cur_cue_index = len(g_cue_list)-1
-    #case, insert cue in middle of list
     else:
-        for i in range(0,len(g_cue_list)-1):
-    	    if(cue_num == g_cue_list[i].CUE_NUM):#case, overwrite existing cue
-                print("Overwriting Cue #" + str(g_cue_list[i].CUE_NUM))
-    	        g_cue_list[i] = Cue(cue_num, dmx_vals,up_time,down_time,desc_str)
-                g_cur_cue_index = i
-                break
-    	    elif(cue_num > g_cue_list[i].CUE_NUM and cue_num < g_cue_list[i+1].CUE_NUM):
-                print("Inserting cue after #" + str(g_cue_list[i].CUE_NUM) + " and before #" + str(g_cue_list[i+1].CUE_NUM))
-    	        g_cue_list.insert(i+1, Cue(cue_num, dmx_vals,up_time,down_time,desc_str))
-                g_cur_cue_index = i+1
-                break
+        print("Inserting cue before #" + str(g_cue_list[l_index].CUE_NUM))
+    g_engine.record_cue(l_cue) #becomes the current cue, captured channels are released into it
+    if(c_tracked_cues):
+        lx_tracking.track_cue_list(g_cue_list) #only the new cue gets encoded, the rest already are
     print(len(g_cue_list))
          		   
  
@@ -203,23 +212,9 @@ def print_cue(cue_num):
         for i in range(0, c_max_dmx_ch):
             print("Ch" + str(i) + "@" + str(l_Cue.DMX_VALS[i]) + ", ")
 
-def update_ch_states_array(prev_cue_index, next_cue_index):
-    for i in range(0,c_max_dmx_ch):
-        if(g_ch_states_array[i] != c_CH_STATE_CAPTURED): #captured channels should remain captured
-            if(g_cue_list[prev_cue_index].DMX_VALS[i] == g_cue_list[next_cue_index].DMX_VALS[i]):
-                g_ch_states_array[i] = c_CH_STATE_NO_CHANGE
-            elif(g_cue_list[prev_cue_index].DMX_VALS[i] > g_cue_list[next_cue_index].DMX_VALS[i]):
-                g_ch_states_array[i] = c_CH_STATE_DEC
-            elif(g_cue_list[prev_cue_index].DMX_VALS[i] < g_cue_list[next_cue_index].DMX_VALS[i]):
-                g_ch_states_array[i] = c_CH_STATE_INC
-
 def snap_to_cue(cue_index):
-    global g_cur_dmx_output
-    if(cue_index >= 0 and cue_index < len(g_cue_list)-1):
-        g_dmx_vals_lock.acquire()
-        for i in range(0, c_max_dmx_ch):
-            g_cur_dmx_output[i] = g_cue_list[cue_index].DMX_VALS[i]
-        g_dmx_vals_lock.release()
+    if(cue_index >= 0 and cue_index < len(g_cue_list)):
+        g_engine.snap_to_cue(cue_index)
         app.update_displayed_vals()
 
 #get a suggestion for the next cue number to use
@@ -252,60 +247,46 @@ class Application(Frame):
 
             
     def go_but_act(self):
-        global g_prev_dmx_output
-        global g_cur_cue_index
-        global g_state
-        global g_sec_into_transition
+        if(g_output_process != None): #output process runs the show, we just watch
+            g_output_process.go()
+            return
+        trace_begin("GO")
         g_button_action_lock.acquire()
-        if(g_cur_cue_index < len(g_cue_list)-1): 
+        if(g_engine.go()):
             print "Go!"
-            update_ch_states_array(g_cur_cue_index, g_cur_cue_index+1)
-            self.set_ch_colors() 
-            g_dmx_vals_lock.acquire()
-            g_prev_dmx_output = copy.deepcopy(g_cur_dmx_output)
-            g_dmx_vals_lock.release()
-            g_cur_cue_index = g_cur_cue_index+1
-            self.update_displayed_cue_list()
-            g_sec_into_transition = 0.0
-            g_state = c_STATE_TRANSITION_FWD
+            self.show_cue_transition()
         g_button_action_lock.release()
+        trace_end()
 
     def back_but_act(self):
-        global g_prev_dmx_output
-        global g_cur_cue_index
-        global g_state
-        global g_sec_into_transition
+        if(g_output_process != None):
+            g_output_process.back()
+            return
+        trace_begin("BACK")
         g_button_action_lock.acquire()
-        if(g_cur_cue_index > 0):   
+        if(g_engine.back()):
             print "Back..."
-            update_ch_states_array(g_cur_cue_index, g_cur_cue_index-1)
-            self.set_ch_colors() 
-            g_dmx_vals_lock.acquire()
-            g_prev_dmx_output = copy.deepcopy(g_cur_dmx_output)
-            g_dmx_vals_lock.release()
-            g_cur_cue_index = g_cur_cue_index-1
-            self.update_displayed_cue_list()
-            g_state = c_STATE_TRANSITION_BKW
-            g_sec_into_transition = 0.0
+            self.show_cue_transition()
         g_button_action_lock.release()
+        trace_end()
+
+    #redraw after g_engine started a fade from a button. Fades started by
+    #auto-follows are redrawn by the timed thread.
+    #Caller must hold g_button_action_lock.
+    def show_cue_transition(self):
+        self.set_ch_colors()
+        self.update_displayed_cue_list()
     
     def record_cue_but_act(self):
         RecCueDialog(root, title = "Record Cue")
 
     def release_all_captured_ch(self):
-        global g_ch_states_array
-        global g_state
-        global g_cur_cue_index
-        global g_cue_list
-        global g_cur_dmx_output
+        if(g_output_process != None):
+            g_output_process.release_captured()
+            return
         g_button_action_lock.acquire()
-        if(g_state == c_STATE_STANDBY):
-            g_dmx_vals_lock.acquire()
-            for i in range(0, c_max_dmx_ch):
-                if(g_ch_states_array[i] == c_CH_STATE_CAPTURED):
-                    g_cur_dmx_output[i] = g_cue_list[g_cur_cue_index].DMX_VALS[i] #restore old value
-                    g_ch_states_array[i] = c_CH_STATE_NO_CHANGE #reset ch state
-            g_dmx_vals_lock.release()
+        if(g_engine.state == c_STATE_STANDBY):
+            g_engine.release_captured() #captured channels go back to the cue's levels
             self.set_ch_colors()
             self.update_displayed_vals()
             self.update_displayed_cue_list()
@@ -357,10 +338,10 @@ class Application(Frame):
         
     def update_displayed_cue_list(self):
         l_new_string = ""
-        min_draw_cue_index = max(0,g_cur_cue_index-3)
+        min_draw_cue_index = max(0,g_engine.cur_cue_index-3)
         max_draw_cue_index = min(min_draw_cue_index+10,len(g_cue_list)-1)
         for cue_index_iter in range(min_draw_cue_index,max_draw_cue_index+1): 
-            if(cue_index_iter == g_cur_cue_index): #place marker if we're on this cue
+            if(cue_index_iter == g_engine.cur_cue_index): #place marker if we're on this cue
                 l_new_string +=">"
             else:
                 l_new_string += " "
@@ -368,6 +349,12 @@ class Application(Frame):
             #write the cue number and up/dn time
             l_new_string += "{: ^5.1f} | {: ^4.1f}/{: ^4.1f} | ".format(g_cue_list[cue_index_iter].CUE_NUM, g_cue_list[cue_index_iter].UP_TIME, g_cue_list[cue_index_iter].DOWN_TIME)
             
+            #mark delays and auto-follows ahead of the description
+            if(g_cue_list[cue_index_iter].DELAY_TIME > 0):
+                l_new_string += "D{:.1f} ".format(g_cue_list[cue_index_iter].DELAY_TIME)
+            if(g_cue_list[cue_index_iter].FOLLOW_TIME != None):
+                l_new_string += "F{:.1f} ".format(g_cue_list[cue_index_iter].FOLLOW_TIME)
+            
             #write the description
             l_new_string += g_cue_list[cue_index_iter].DESCRIPTION
             #newline
@@ -384,13 +371,83 @@ class Application(Frame):
         for i in range(0,c_max_dmx_ch):
             self.DMX_VALS_STRS[i].set(str(int(g_cur_dmx_output[i])))
         g_dmx_vals_lock.release()
-        self.CUE_NUM_DISP_STR.set(str(g_cue_list[g_cur_cue_index].CUE_NUM))
-        self.CUE_TIME_UP_DISP_STR.set((g_cue_list[g_cur_cue_index].UP_TIME))
-        self.CUE_TIME_DOWN_DISP_STR.set((g_cue_list[g_cur_cue_index].DOWN_TIME))
+        self.CUE_NUM_DISP_STR.set(str(g_cue_list[g_engine.cur_cue_index].CUE_NUM))
+        self.CUE_TIME_UP_DISP_STR.set((g_cue_list[g_engine.cur_cue_index].UP_TIME))
+        self.CUE_TIME_DOWN_DISP_STR.set((g_cue_list[g_engine.cur_cue_index].DOWN_TIME))
         
     def set_dmx_vals_but_act(self):
         ChSetDialog(root, title = "Set DMX Vals")
 
+    def start_effect_but_act(self):
+        EffectDialog(root, title = "Start Effect")
+
+    def record_palette_but_act(self):
+        PaletteDialog(root, title = "Record Palette")
+
+    #master faders are 0-100%, lx_masters works in 0-255
+    def grand_master_moved(self, value):
+        l_level = int(round(float(value)*2.55))
+        g_masters.set_grand_master(l_level)
+        if(g_output_process != None):
+            g_output_process.set_grand_master(l_level)
+
+    def submaster_moved(self, sub_index, value):
+        l_level = int(round(float(value)*2.55))
+        g_masters.set_submaster_fader(sub_index, l_level)
+        if(g_output_process != None):
+            g_output_process.set_submaster_fader(sub_index, l_level)
+
+    #load whatever the cues (plus captured channels) have on stage into a submaster
+    def record_submaster(self, sub_index):
+        g_dmx_vals_lock.acquire()
+        l_levels = list(g_cur_dmx_output)
+        g_dmx_vals_lock.release()
+        g_masters.set_submaster_levels(sub_index, l_levels)
+        if(g_output_process != None):
+            g_output_process.set_submaster_levels(sub_index, l_levels)
+        print("Recorded submaster " + str(sub_index+1))
+
+    def blackout_but_act(self):
+        l_on = g_masters.toggle_blackout()
+        if(g_output_process != None):
+            g_output_process.set_blackout(l_on)
+        if(l_on):
+            self.BLACKOUT["fg"] = "red"
+        else:
+            self.BLACKOUT["fg"] = "black"
+
+    def stop_all_effects_but_act(self):
+        g_effects.stop_all()
+        if(g_output_process != None):
+            g_output_process.stop_all_effects()
+        print("All effects stopped")
+
+    def undo_but_act(self):
+        self.step_cue_history(g_cue_history.undo, "Undid ")
+
+    def redo_but_act(self):
+        self.step_cue_history(g_cue_history.redo, "Redid ")
+
+    #put back a cue list from the undo history. Only in standby, same as recording.
+    def step_cue_history(self, step, verb):
+        g_button_action_lock.acquire()
+        if(g_engine.state == c_STATE_STANDBY):
+            l_restored = step()
+            if(l_restored == None):
+                print("No cue list edits to " + step.__name__)
+            else:
+                (l_cue_list, l_cur_cue_index, l_label) = l_restored
+                g_cue_list[:] = l_cue_list
+                g_engine.set_cue_list(g_cue_list, l_cur_cue_index)
+                if(g_palettes.index_cue_list(g_cue_list) > 0 and c_tracked_cues): #the palettes these cues were recorded with are back
+                    lx_tracking.track_cue_list(g_cue_list)
+                if(g_output_process != None):
+                    g_output_process.load_cue_list(g_cue_list, g_engine.cur_cue_index)
+                self.update_displayed_cue_list()
+                self.update_displayed_vals()
+                print(verb + l_label)
+        g_button_action_lock.release()
+
     def keypress_handler(self, event):
         input = event.char
         if(input == " "):
@@ -403,6 +460,8 @@ class Application(Frame):
             ChSetDialog(root, title = "Set DMX Vals")
         elif(input == "g"):
             GotoCueDialog(root, title = "GoTo Cue")
+        elif(input == "x"):
+            self.blackout_but_act()
             
     
  
@@ -421,6 +480,8 @@ class Application(Frame):
         root.bind("<Control-s>", save_show_file)
         root.bind("<Control-o>", open_show_file)
         root.bind("<Control-n>", new_show)
+        root.bind("<Control-z>", lambda event: self.undo_but_act())
+        root.bind("<Control-y>", lambda event: self.redo_but_act())
         
         #grab focus
         self.focus_set()
@@ -555,6 +616,39 @@ class Application(Frame):
         self.SET_CH_VALS["command"] = self.set_dmx_vals_but_act
         self.SET_CH_VALS.grid(row = 2, column = 0)
         
+        #set up a frame for the grand master, submasters and blackout
+        self.MASTERS_FRAME = Frame(root)
+        self.MASTERS_FRAME.grid(row = 1, column = 1)
+
+        self.GM_SCALE = Scale(self.MASTERS_FRAME)
+        self.GM_SCALE["label"] = "GM"
+        self.GM_SCALE["from_"] = 100
+        self.GM_SCALE["to"] = 0
+        self.GM_SCALE.set(100)
+        self.GM_SCALE["command"] = self.grand_master_moved
+        self.GM_SCALE.grid(row = 0, column = 0)
+
+        self.BLACKOUT = Button(self.MASTERS_FRAME)
+        self.BLACKOUT["text"] = "Blackout"
+        self.BLACKOUT["fg"]   = "black"
+        self.BLACKOUT["command"] =  self.blackout_but_act
+        self.BLACKOUT.grid(row = 1, column = 0)
+
+        self.SUB_SCALES = []
+        self.SUB_REC_BTNS = []
+        for i in range(0, c_num_submasters):
+            self.SUB_SCALES.append(Scale(self.MASTERS_FRAME))
+            self.SUB_SCALES[i]["label"] = "S" + str(i+1)
+            self.SUB_SCALES[i]["from_"] = 100
+            self.SUB_SCALES[i]["to"] = 0
+            self.SUB_SCALES[i].set(0)
+            self.SUB_SCALES[i]["command"] = lambda value, sub_index=i: self.submaster_moved(sub_index, value)
+            self.SUB_SCALES[i].grid(row = 0, column = i+1)
+            self.SUB_REC_BTNS.append(Button(self.MASTERS_FRAME))
+            self.SUB_REC_BTNS[i]["text"] = "Rec"
+            self.SUB_REC_BTNS[i]["command"] = lambda sub_index=i: self.record_submaster(sub_index)
+            self.SUB_REC_BTNS[i].grid(row = 1, column = i+1)
+
         #set up a frame for the show control buttons
         self.SHOW_CTRL_BTNS = Frame(root)
         self.SHOW_CTRL_BTNS.grid(row = 0, column = 1)
@@ -589,6 +683,17 @@ class Application(Frame):
         self.FILE_MENU.add_separator()
         self.FILE_MENU.add_command(label = "Exit", command = app_exit_graceful)
         self.MENU_BAR.add_cascade(label = "File", menu = self.FILE_MENU)
+        self.EDIT_MENU = Menu(self.MENU_BAR, tearoff = 0)
+        self.EDIT_MENU.add_command(label = "Undo", command = self.undo_but_act)
+        self.EDIT_MENU.add_command(label = "Redo", command = self.redo_but_act)
+        self.MENU_BAR.add_cascade(label = "Edit", menu = self.EDIT_MENU)
+        self.EFFECTS_MENU = Menu(self.MENU_BAR, tearoff = 0)
+        self.EFFECTS_MENU.add_command(label = "Start Effect...", command = self.start_effect_but_act)
+        self.EFFECTS_MENU.add_command(label = "Stop All Effects", command = self.stop_all_effects_but_act)
+        self.MENU_BAR.add_cascade(label = "Effects", menu = self.EFFECTS_MENU)
+        self.PALETTES_MENU = Menu(self.MENU_BAR, tearoff = 0)
+        self.PALETTES_MENU.add_command(label = "Record Palette...", command = self.record_palette_but_act)
+        self.MENU_BAR.add_cascade(label = "Palettes", menu = self.PALETTES_MENU)
                        
     #what to do when initalized...
     def __init__(self, master=None):
@@ -629,11 +734,7 @@ class ChSetDialog(tkSimpleDialog.Dialog):
             #parse the channels to change
             if(channels_str == "/"):
                 print("set all ch...")
-                g_dmx_vals_lock.acquire()
-                for ch_iter in range(0, c_max_dmx_ch):
-                     g_cur_dmx_output[i] = dmx_val_to_set
-                     g_ch_states_array[i] = c_CH_STATE_CAPTURED
-                g_dmx_vals_lock.release()
+                ch_to_set_list = range(1, c_max_dmx_ch+1)
             else:
                 ch_range_strs = re.findall("[0-9]{1,3}[-][[0-9]{1,3}",channels_str)
                 ch_and_strs = re.findall("[0-9]{1,3}",channels_str)
@@ -665,15 +766,13 @@ class ChSetDialog(tkSimpleDialog.Dialog):
                 #sanitize list
                 for ch_iter in range(0, len(ch_to_set_list)):
                     ch_to_set_list[ch_iter] = max(1,min(abs(int(round(float(ch_to_set_list[ch_iter])))), c_max_dmx_ch))
-                #set channels    
-                g_dmx_vals_lock.acquire()
-                g_button_action_lock.acquire()
-                for ch_iter in ch_to_set_list:
-                     g_cur_dmx_output[ch_iter-1] = dmx_val_to_set
-                     g_ch_states_array[ch_iter-1] = c_CH_STATE_CAPTURED
-                g_button_action_lock.release()
-                g_dmx_vals_lock.release()
+            #set channels - captured until released
+            g_button_action_lock.acquire()
+            g_engine.set_channels(ch_to_set_list, dmx_val_to_set)
+            g_button_action_lock.release()
             
+            if(g_output_process != None):
+                g_output_process.set_channels(ch_to_set_list, dmx_val_to_set)
             app.update_displayed_vals()
             app.set_ch_colors()
         
@@ -684,7 +783,7 @@ class RecCueDialog(tkSimpleDialog.Dialog):
         self.CUE_ENTRY = Entry(master)
         self.CUE_ENTRY["width"] = 5
         self.CUE_ENTRY.grid(row = 1, column = 1)
-        self.CUE_ENTRY.insert(0,str(get_next_available_cue_num(g_cur_cue_index)))
+        self.CUE_ENTRY.insert(0,str(get_next_available_cue_num(g_engine.cur_cue_index)))
         
         
         Label(master, text="UpTime", width = 6).grid(row=0,column=0)
@@ -704,29 +803,135 @@ class RecCueDialog(tkSimpleDialog.Dialog):
         self.CUE_DESC_ENTRY["width"] = 15
         self.CUE_DESC_ENTRY.grid(row = 4, column = 1)
         
+        Label(master, text="Delay", width = 6).grid(row=3,column=0)
+        self.DELAY_TIME_ENTRY = Entry(master)
+        self.DELAY_TIME_ENTRY["width"] = 5
+        self.DELAY_TIME_ENTRY.grid(row = 4, column = 0)
+        self.DELAY_TIME_ENTRY.insert(0,'0.0')
+        
+        Label(master, text="Follow", width = 6).grid(row=3,column=2)
+        self.FOLLOW_TIME_ENTRY = Entry(master) #blank means wait for GO
+        self.FOLLOW_TIME_ENTRY["width"] = 5
+        self.FOLLOW_TIME_ENTRY.grid(row = 4, column = 2)
+        
+        Label(master, text="Palettes", width = 15).grid(row=5,column=1)
+        self.PALETTES_ENTRY = Entry(master) #comma separated names, blank for none
+        self.PALETTES_ENTRY["width"] = 15
+        self.PALETTES_ENTRY.grid(row = 6, column = 1)
+        self.PALETTES_ENTRY.insert(0, ", ".join(p.name for p in g_cue_list[g_engine.cur_cue_index].PALETTES))
+        
         return self.CUE_ENTRY #initial focus
         
     def apply(self):
-        global g_ch_states_array
         g_button_action_lock.acquire()
-        if(g_state == c_STATE_STANDBY):
+        if(g_engine.state == c_STATE_STANDBY):
             try:
                 l_entered_cue_num = min(round(abs(float(self.CUE_ENTRY.get())),1),999.9)
                 l_entered_up_time = min(round(abs(float(self.UP_TIME_ENTRY.get())),1), 99.9)
                 l_entered_down_time = min(round(abs(float(self.DOWN_TIME_ENTRY.get())),1), 99.9)
                 l_entered_cue_desc = str(self.CUE_DESC_ENTRY.get())
+                l_entered_delay_time = min(round(abs(float(self.DELAY_TIME_ENTRY.get())),1), 99.9)
+                l_entered_follow_time = None
+                if(self.FOLLOW_TIME_ENTRY.get().strip() != ""):
+                    l_entered_follow_time = min(round(abs(float(self.FOLLOW_TIME_ENTRY.get())),1), 999.9)
             except ValueError:
                 print("Error, could not save cue because inputs were not numbers.")
                 g_button_action_lock.release()
                 return
-            #reset all ch states to NO-Change
-            for i in range(0, c_max_dmx_ch):
-                g_ch_states_array[i] = c_CH_STATE_NO_CHANGE
-            app.set_ch_colors()
-            insert_cue(l_entered_cue_num, g_cur_dmx_output, l_entered_up_time, l_entered_down_time, l_entered_cue_desc)
+            l_palette_names = [n.strip() for n in self.PALETTES_ENTRY.get().split(",") if n.strip() != ""]
+            for l_name in l_palette_names:
+                if(g_palettes.get(l_name) == None):
+                    print("Error, could not save cue because there is no palette named " + l_name)
+                    g_button_action_lock.release()
+                    return
+            insert_cue(l_entered_cue_num, g_cur_dmx_output, l_entered_up_time, l_entered_down_time, l_entered_cue_desc, l_entered_delay_time, l_entered_follow_time, l_palette_names)
+            app.set_ch_colors() #all ch states are back to NO-Change
+            g_cue_history.record(g_cue_list, g_engine.cur_cue_index, "Record Cue " + str(l_entered_cue_num))
+            if(g_output_process != None):
+                g_output_process.load_cue_list(g_cue_list, g_engine.cur_cue_index, uncapture=True)
             app.update_displayed_cue_list()
         g_button_action_lock.release()
 
+#effect dialog box. Channels use the Set Ch syntax without the "* level".
+class EffectDialog(tkSimpleDialog.Dialog):
+    def body(self, master):
+        self.ENTRIES = {}
+        l_fields = [("Channels", "1-12"), ("Waveform", "sine"), ("Rate", "1.0"), ("Low", "0"), ("High", "255"),
+                    ("Spread", ""), ("Merge", "htp")]
+        for i in range(0, len(l_fields)):
+            (l_label, l_default) = l_fields[i]
+            Label(master, text=l_label, width = 8).grid(row=0,column=i)
+            l_entry = Entry(master)
+            l_entry["width"] = 8
+            l_entry.grid(row = 1, column = i)
+            l_entry.insert(0, l_default)
+            self.ENTRIES[l_label] = l_entry
+        Label(master, text="Waveform: " + "/".join(lx_effects.c_WAVEFORMS) + "   Merge: " + "/".join(lx_effects.c_MERGE_MODES) +
+                           "   Spread: cycles across the channels, blank for default").grid(row=2,column=0,columnspan=len(l_fields))
+        return self.ENTRIES["Channels"] #initial focus
+
+    def apply(self):
+        global g_effect_count
+        try:
+            l_channels = lx_effects.parse_channel_selection(self.ENTRIES["Channels"].get(), c_max_dmx_ch)
+            l_spread = None
+            if(self.ENTRIES["Spread"].get().strip() != ""):
+                l_spread = float(self.ENTRIES["Spread"].get())
+            g_effect_count += 1
+            l_effect = lx_effects.Effect("fx{}".format(g_effect_count), l_channels, self.ENTRIES["Waveform"].get().strip().lower(),
+                                         rate = abs(float(self.ENTRIES["Rate"].get())), low = int(self.ENTRIES["Low"].get()),
+                                         high = int(self.ENTRIES["High"].get()), spread = l_spread,
+                                         merge = self.ENTRIES["Merge"].get().strip().lower())
+        except ValueError as e:
+            print("Error, could not start effect: " + str(e))
+            return
+        g_effects.start(l_effect, lx_clock.monotonic())
+        if(g_output_process != None):
+            g_output_process.start_effect(l_effect)
+        print("Started effect " + l_effect.name + " on " + str(len(l_channels)) + " channels")
+
+#palette dialog box. Grabs the stage levels of the channels given (Set Ch syntax without the "* level").
+#Recording over an existing palette updates every cue that uses it.
+class PaletteDialog(tkSimpleDialog.Dialog):
+    def body(self, master):
+        Label(master, text="Palette Name", width = 15).grid(row=0,column=0)
+        self.NAME_ENTRY = Entry(master)
+        self.NAME_ENTRY["width"] = 15
+        self.NAME_ENTRY.grid(row = 1, column = 0)
+        
+        Label(master, text="Channels", width = 15).grid(row=0,column=1)
+        self.CHANNELS_ENTRY = Entry(master)
+        self.CHANNELS_ENTRY["width"] = 15
+        self.CHANNELS_ENTRY.grid(row = 1, column = 1)
+        
+        Label(master, text="Existing: " + ", ".join(g_palettes.names())).grid(row=2,column=0,columnspan=2)
+        return self.NAME_ENTRY #initial focus
+
+    def apply(self):
+        l_name = self.NAME_ENTRY.get().strip()
+        try:
+            l_channels = lx_effects.parse_channel_selection(self.CHANNELS_ENTRY.get(), c_max_dmx_ch)
+        except ValueError:
+            print("Error, could not record palette because the channels were not numbers.")
+            return
+        if(l_name == "" or len(l_channels) == 0):
+            print("Error, a palette needs a name and some channels.")
+            return
+        g_button_action_lock.acquire()
+        if(g_engine.state == c_STATE_STANDBY):
+            g_dmx_vals_lock.acquire()
+            l_levels = dict((ch, g_cur_dmx_output[ch-1]) for ch in l_channels)
+            g_dmx_vals_lock.release()
+            l_count = g_palettes.set_palette(l_name, l_levels, g_cue_list) #cues using it are swapped for re-resolved copies
+            if(l_count > 0):
+                if(c_tracked_cues):
+                    lx_tracking.track_cue_list(g_cue_list)
+                g_cue_history.record(g_cue_list, g_engine.cur_cue_index, "Record Palette " + l_name) #undo puts back the old palette with the old cues
+                if(g_output_process != None):
+                    g_output_process.load_cue_list(g_cue_list, g_engine.cur_cue_index)
+            print("Recorded palette " + l_name + ", " + str(l_count) + " cues updated")
+        g_button_action_lock.release()
+
 class GotoCueDialog(tkSimpleDialog.Dialog):
     def body(self, master):
         Label(master, text="Goto Cue Number", width = 15).grid(row=0,column=0)
@@ -737,11 +942,6 @@ class GotoCueDialog(tkSimpleDialog.Dialog):
         return self.CUE_ENTRY #initial focus
         
     def apply(self):
-        global g_prev_dmx_output
-        global g_cur_cue_index
-        global g_state
-        global g_sec_into_transition 
-        
         g_button_action_lock.acquire()
         try:
             l_entered_cue_num = min(round(abs(float(self.CUE_ENTRY.get())),1),999.9)
@@ -752,16 +952,10 @@ class GotoCueDialog(tkSimpleDialog.Dialog):
         l_temp = lookup_cue_index(l_entered_cue_num) #determine if the cue even exists, and what index it is
         if(l_temp != -1):
             print "Goto..."
-            update_ch_states_array(g_cur_cue_index, l_temp)
-            g_cur_cue_index = l_temp
-            app.set_ch_colors() 
-            g_dmx_vals_lock.acquire()
-            g_prev_dmx_output = copy.deepcopy(g_cur_dmx_output)
-            g_dmx_vals_lock.release()
-            g_cur_cue_index = l_temp
-            app.update_displayed_cue_list()
-            g_sec_into_transition = 0.0        
-            g_state = c_STATE_TRANSITION_FWD
+            if(g_output_process != None):
+                g_output_process.goto(l_entered_cue_num)
+            elif(g_engine.goto(l_entered_cue_num)):
+                app.show_cue_transition()
         g_button_action_lock.release()
         
 ########################################################################
@@ -782,11 +976,59 @@ def app_exit_graceful():
     #having the lock means the timed thread is not touching the gui, we can kill it at any time now
     Timed_Thread_obj.join() #wait for the timed thread to exit
     root.destroy() #kill the gui application.
-    g_ser_port.close() #close serial port
+    if(g_output_process != None):
+        g_output_process.stop() #output process owns the serial port and recorder
+    else:
+        g_dmx_out.close() #close serial port
+    if(g_dmx_recorder != None):
+        g_dmx_recorder.close()
+    if(g_monitor != None):
+        g_monitor.close()
+    if(g_tracer != None):
+        print("Wrote " + str(g_tracer.save()) + " trace events to " + c_trace_file)
+        lx_trace.print_summary(g_tracer.summary())
     
     #return to os at some point...
 
    
+#In output process mode the timed thread doesn't calculate anything, it copies
+#whatever the output process last published into the globals the gui reads.
+#Returns (levels changed, cue changed) so the caller only redraws when it has to.
+def mirror_output_process():
+    if(g_engine.state == c_STATE_NOT_READY): #show is being loaded, leave everything alone
+        return (False, False)
+    (l_levels, l_ch_states, l_status) = g_output_process.read_frame()
+    g_dmx_vals_lock.acquire() #our g_engine never runs a fade in this mode, it just holds what the output process is doing
+    l_vals_changed = (l_levels != g_cur_dmx_output or l_ch_states != g_ch_states_array)
+    g_cur_dmx_output[:] = l_levels
+    g_ch_states_array[:] = l_ch_states
+    l_cue_index = min(int(l_status[lx_output_process.c_STATUS_CUE_INDEX]), len(g_cue_list)-1)
+    l_cue_changed = (l_cue_index != g_engine.cur_cue_index)
+    g_engine.cur_cue_index = l_cue_index
+    g_engine.state = int(l_status[lx_output_process.c_STATUS_STATE])
+    g_dmx_vals_lock.release()
+    return (l_vals_changed, l_cue_changed)
+
+#g_engine calls this, holding g_dmx_vals_lock, whenever a fade starts - from a button, GoTo or an auto-follow
+def engine_transition_started(engine, go_time):
+    global g_transitions_started
+    g_transitions_started += 1
+    if(g_fade_sender != None and not output_stage_is_active()): #tell the arduino about the whole fade now, it does the rest
+        g_fade_sender.fade(engine.cur_out, engine.ch_states, engine.cue_list[engine.cur_cue_index], engine.transition_start_time)
+
+#True if the masters or the patch change levels between g_cur_dmx_output and the serial port
+def output_stage_is_active():
+    return g_masters.is_active() or g_patch != None
+
+#spans for lx_trace - nothing at all unless c_trace_file is set
+def trace_begin(name):
+    if(g_tracer != None):
+        g_tracer.begin(name)
+
+def trace_end():
+    if(g_tracer != None):
+        g_tracer.end()
+
 ########################################################################
 ### END THREAD INTERACTION FUNCTIONS
 ########################################################################
@@ -802,81 +1044,97 @@ class Timed_Thread(threading.Thread):
         self.threadID = threadID
         self.name = "PYTHON_LX_TIMED_THREAD"
     def run(self):
-    	global g_state
-    	global g_prev_dmx_output
-        global g_cur_cue_index
-        global g_sec_into_transition
         global g_kill_timed_thread
         #global g_gui_access_lock
         
-        timedif = 0
-        
         time.sleep(1)#ensure GUI starts
         print "Starting " + self.name
+        l_shown_transitions = g_transitions_started
+        l_next_frame_time = lx_clock.monotonic()
         while(g_kill_timed_thread != 1):
-            time.sleep(c_sec_per_frame - timedif) #start by waiting
-            starttime = datetime.datetime.now().microsecond #mark time we start the loop at
-            #calculate current DMX frame
-           
-            #if we're transitioning, the current dmx frame is dependant on how long we've been transitioning 
-            if(g_state == c_STATE_TRANSITION_FWD or g_state == c_STATE_TRANSITION_BKW):
-                g_dmx_vals_lock.acquire()
-                for i in range(0, c_max_dmx_ch): #calculate each dmx value based on how far we are through the fade
-                    if(g_ch_states_array[i] == c_CH_STATE_INC): #captured channels should not change
-                        g_cur_dmx_output[i] = int(round(float(g_prev_dmx_output[i])*(1.0-min(1,(g_sec_into_transition/g_cue_list[g_cur_cue_index].UP_TIME)))+float(g_cue_list[g_cur_cue_index].DMX_VALS[i])*min(1,(g_sec_into_transition/g_cue_list[g_cur_cue_index].UP_TIME))))
-                    elif(g_ch_states_array[i] == c_CH_STATE_DEC): #captured channels should not change
-                        g_cur_dmx_output[i] = int(round(float(g_prev_dmx_output[i])*(1.0-min(1,(g_sec_into_transition/g_cue_list[g_cur_cue_index].DOWN_TIME)))+float(g_cue_list[g_cur_cue_index].DMX_VALS[i])*min(1,(g_sec_into_transition/g_cue_list[g_cur_cue_index].DOWN_TIME))))
-                    elif(g_ch_states_array[i] == c_CH_STATE_NO_CHANGE):
-                        g_cur_dmx_output[i] = int(round(g_cue_list[g_cur_cue_index].DMX_VALS[i])) #required in case the user is mashing go/back buttons so channels don't hang
-                g_dmx_vals_lock.release()
-                
-                #get the gui lock and update the displayed values               
-                while(g_gui_access_lock.acquire(blocking = 0) == False): #attempt to acquire the lock, spin on checking the kill_thread flag while waiting
-                    if(g_kill_timed_thread == 1): #if the lock is acquired, it means the main app is trying to exit. This thread should exit too then.
-                        return
-                g_button_action_lock.acquire()
-                app.update_displayed_vals() #update the displayed vals on the screen
-                g_button_action_lock.release()
-                g_gui_access_lock.release() #we're done here, release the lock
-                           
-                
-                #calculate the next state and appropriate transition actions
-                if(g_sec_into_transition >= max(g_cue_list[g_cur_cue_index].UP_TIME,g_cue_list[g_cur_cue_index].DOWN_TIME)-c_sec_per_frame/2): #catch if the fade is done, and end it
-                    g_button_action_lock.acquire()#atomic so seconds into transition & state dont get changed underneath us.
-                    g_state = c_STATE_STANDBY
-                    g_sec_into_transition = 0
+            l_sleep_time = l_next_frame_time - lx_clock.monotonic()
+            if(l_sleep_time > 0):
+                time.sleep(l_sleep_time) #start by waiting
+            l_now = lx_clock.monotonic() #mark time we start the loop at
+            trace_begin("frame")
+
+            #in output process mode the frame was already calculated and sent over there, just show it
+            if(g_output_process != None):
+                trace_begin("mirror output process")
+                (l_vals_changed, l_cue_changed) = mirror_output_process()
+                if(l_vals_changed or l_cue_changed):
+                    while(g_gui_access_lock.acquire(blocking = 0) == False): #same deal as the display update below
+                        if(g_kill_timed_thread == 1):
+                            return
+                    g_button_action_lock.acquire()
+                    app.update_displayed_vals()
+                    app.set_ch_colors()
+                    if(l_cue_changed):
+                        app.update_displayed_cue_list()
                     g_button_action_lock.release()
-                    g_dmx_vals_lock.acquire()  
-                    for i in range(0,c_max_dmx_ch): #account for discrete timestep issues by ensuring the last loop in transition sets the outputs right
-                        if(g_ch_states_array[i] != c_CH_STATE_CAPTURED):
-                            g_cur_dmx_output[i] = int(round(g_cue_list[g_cur_cue_index].DMX_VALS[i]))
-                    g_dmx_vals_lock.release()  #atomic so seconds into transition doesn't get changed underneath us.
-                else:
-                    g_button_action_lock.acquire()#atomic so seconds into transition doesn't get changed underneath us.
-                    g_sec_into_transition = g_sec_into_transition + c_sec_per_frame #update how far we are through the fade
+                    g_gui_access_lock.release()
+                trace_end()
+
+            #calculate current DMX frame - the engine runs any auto-follows that have come due, then the fade
+            if(g_output_process == None):
+                trace_begin("engine step")
+                l_was_fading = (g_engine.state == c_STATE_TRANSITION_FWD or g_engine.state == c_STATE_TRANSITION_BKW)
+                g_engine.step(l_now) #real elapsed time, not a count of frames
+                l_new_transitions = g_transitions_started
+                trace_end()
+
+                #get the gui lock and update the displayed values
+                if(l_was_fading or l_new_transitions != l_shown_transitions):
+                    trace_begin("gui update")
+                    while(g_gui_access_lock.acquire(blocking = 0) == False): #attempt to acquire the lock, spin on checking the kill_thread flag while waiting
+                        if(g_kill_timed_thread == 1): #if the lock is acquired, it means the main app is trying to exit. This thread should exit too then.
+                            return
+                    g_button_action_lock.acquire()
+                    app.update_displayed_vals() #update the displayed vals on the screen
+                    if(l_new_transitions != l_shown_transitions): #an auto-follow may have moved on a cue
+                        app.set_ch_colors()
+                        app.update_displayed_cue_list()
+                        l_shown_transitions = l_new_transitions
                     g_button_action_lock.release()
+                    g_gui_access_lock.release() #we're done here, release the lock
+                    trace_end()
 
             #tx current dmx frame
-            for i in range(0, c_max_dmx_ch):
-                if(g_cur_dmx_output[i] == 0x10):
-                    g_dmx_vals_lock.acquire()
-                    g_cur_dmx_output[i] = 0x11 #make sure we don't tx the start-of-frame char
-                    g_dmx_vals_lock.release()
-            chars_to_tx = ''.join(chr(b) for b in g_cur_dmx_output)
-            try:
-               g_ser_port.write('\x10') #write start byte
-               g_ser_port.write(chars_to_tx)
-            except:
-               print("Error while trying to write to serial port!!!")
-            
-
-            #calculate how well we did keeping time and correct for it
-            endtime = datetime.datetime.now().microsecond #mark how long the timed loop took
-            if(endtime > starttime):
-                timedif = float(endtime-starttime)/1000000.0 #calculate a sleep correction factor
-            if(timedif > c_sec_per_frame ):
-                timedif = c_sec_per_frame  #but warn the user if we missed the deadline
+            if(g_output_process == None):
+                trace_begin("output")
+                g_dmx_vals_lock.acquire()
+                l_frame_to_tx = list(g_cur_dmx_output)
+                g_dmx_vals_lock.release()
+                if(g_effects.is_running()):
+                    g_effects.apply(l_frame_to_tx, l_now) #on the copy only, so effects never get recorded into cues
+                if(g_masters.is_active()):
+                    l_frame_to_tx = g_masters.apply(l_frame_to_tx) #same for the masters - cue data is never scaled
+                if(g_patch != None):
+                    l_frame_to_tx = g_patch.apply_universe(l_frame_to_tx, c_output_universe) #channels -> DMX addresses
+                try:
+                   if(g_fade_sender != None):
+                       l_live_ch = g_effects.channel_indices
+                       if(output_stage_is_active()):
+                           l_live_ch = g_fade_sender.all_channels #the arduino doesn't know about masters or the patch, so stream it all
+                       g_fade_sender.frame(l_frame_to_tx, g_ch_states_array, g_engine.state != c_STATE_STANDBY, l_live_ch) #only what the arduino can't work out itself
+                   else:
+                       g_dmx_out.write_frame(l_frame_to_tx)
+                except:
+                   print("Error while trying to queue frame for serial port!!!")
+                if(g_dmx_recorder != None):
+                    g_dmx_recorder.record(l_frame_to_tx)
+                if(g_monitor != None):
+                    g_monitor.publish(l_frame_to_tx, l_now) #just hands it over, never waits on a monitor
+                trace_end()
+            trace_end() #frame
+
+            #frames are scheduled against absolute times so loop jitter doesn't accumulate
+            l_next_frame_time = l_next_frame_time + c_sec_per_frame
+            if(lx_clock.monotonic() > l_next_frame_time):
                 print("WARNING MISSED TIMED LOOP DEADLINE")
+                if(g_tracer != None):
+                    g_tracer.instant("missed deadline", "frame")
+                l_next_frame_time = lx_clock.monotonic() #don't try to catch up with a burst of frames
 
         print("RTThread: got kill signal, exiting")
         return
@@ -890,42 +1148,48 @@ class Timed_Thread(threading.Thread):
 ### FILE IO FUNCTIONS
 ########################################################################
 def open_show_file():
-    global g_state
     global g_cue_list
-    global g_cur_cue_index
-    if(g_state == c_STATE_STANDBY):
-        g_state = c_STATE_NOT_READY
+    if(g_engine.state == c_STATE_STANDBY):
+        g_engine.state = c_STATE_NOT_READY
         print("Opening...") #open default dialogue box for file open
         init_global_data()
         fname = tkFileDialog.askopenfilename(defaultextension = ".plx", filetypes = [("Show Files", ".plx"), ("All Files", "*")], title = "Open Show File")
 	if(fname != ''):
             g_cue_list = cPickle.load(open(fname, "rb"))
-            g_cur_cue_index = 0
-            snap_to_cue(g_cur_cue_index)
+            g_engine.set_cue_list(g_cue_list, 0)
+            g_palettes.clear()
+            g_palettes.index_cue_list(g_cue_list) #the show brings its palettes with it
+            if(c_tracked_cues):
+                lx_tracking.track_cue_list(g_cue_list)
+            g_cue_history.reset(g_cue_list, 0) #no undoing back into the previous show
+            if(g_output_process != None):
+                g_output_process.load_cue_list(g_cue_list, 0, snap=True)
+            snap_to_cue(0) #back to standby
             app.update_displayed_vals()
             app.update_displayed_cue_list()
-	    g_state = c_STATE_STANDBY
 
 def save_show_file():
-    global g_state
     global g_cue_list
-    if(g_state == c_STATE_STANDBY):
+    if(g_engine.state == c_STATE_STANDBY):
         print("Saving...")
         fname = tkFileDialog.asksaveasfilename(defaultextension = ".plx", filetypes = [("Show Files", ".plx"),("All Files", "*")], title = "Save Show File")
         if(fname != ''): #make sure user did not hit cancel
+            if(c_tracked_cues):
+                lx_tracking.track_cue_list(g_cue_list, rebuild=True) #drop levels of overwritten cues that later cues still refer to
             cPickle.dump(g_cue_list, open(fname, "wb"))
 
 def new_show():
-    global g_state
-    global g_cur_cue_index
     global g_cue_list
     print("Creating New Show!")
     init_global_data()
     g_cue_list.append(Cue(0,[0]*c_max_dmx_ch,1,1,"Put a short note here"))
-    g_cur_cue_index = 0
+    g_cue_history.reset(g_cue_list, 0)
+    g_palettes.clear()
+    if(g_output_process != None):
+        g_output_process.load_cue_list(g_cue_list, 0, snap=True)
+    g_engine.snap_to_cue(0)
     app.update_displayed_vals() #update the displayed vals on the screen
     app.update_displayed_cue_list()
-    g_state = c_STATE_STANDBY
 
 ########################################################################
 ### END FILE IO FUNCTIONS
@@ -935,40 +1199,80 @@ def new_show():
 ########################################################################
 ### MAIN FUNCTION
 ########################################################################
-#initialize internal data
-init_global_data()
-
-#set up cue list. default to empty
-g_cue_list.append(Cue(0,[0]*c_max_dmx_ch,1,1,"Put a short note here"))
-g_cur_cue_index = 0
-
+#guarded so the output process can import this file on platforms that spawn instead of fork
+if __name__ == "__main__":
+    #initialize internal data
+    init_global_data()
 
-#set up GUI
-root = Tk()
-app = Application(master=root)
-root.config(menu=app.MENU_BAR) #set the top menu bar
-root.protocol("WM_DELETE_WINDOW", app_exit_graceful) #set custom close handle
+    #set up cue list. default to empty
+    g_cue_list.append(Cue(0,[0]*c_max_dmx_ch,1,1,"Put a short note here"))
+    g_cue_history.reset(g_cue_list, 0)
 
-#initialize DMX Hardware
-try:
     if(_platform == "linux" or _platform == "linux2"):
-        g_ser_port = serial.Serial('/dev/ttyACM0', 115200)# Serial port COM7 on windows. We need a dynamic way of selecting...
+        g_ser_port_name = '/dev/ttyACM0'
     else:
-         g_ser_port = serial.Serial(6, 115200)# Serial port COM7 on windows. We need a dynamic way of selecting...
-        
-except:
-    print("Error opening serial port to DMX TX Module, is it plugged in and unused?")
-    sys.exit(-1)
-
-#run timed Thread
-g_state = c_STATE_STANDBY
-g_kill_timed_thread = 0;
-Timed_Thread_obj= Timed_Thread(1) #thread id 1
-Timed_Thread_obj.start()
-
-#run GUI
-app.mainloop() #sit here while events happen
-#User has exited, tear things down
+        g_ser_port_name = 6 # Serial port COM7 on windows. We need a dynamic way of selecting...
+
+    #optionally keep a record of everything that goes out the serial port
+    g_dmx_record_fname = None
+    if(c_record_dmx_output):
+        g_dmx_record_fname = datetime.datetime.now().strftime("dmx_%Y%m%d_%H%M%S.plxlog")
+
+    #swap in traced locks before anything can be holding the plain ones
+    if(c_trace_file != None):
+        g_tracer = lx_trace.Tracer(c_trace_file)
+        g_dmx_vals_lock = lx_trace.Traced_Lock(g_dmx_vals_lock, "g_dmx_vals_lock", g_tracer)
+        g_engine.lock = g_dmx_vals_lock #it's the engine's lock, so the engine has to go through the traced one too
+        g_button_action_lock = lx_trace.Traced_Lock(g_button_action_lock, "g_button_action_lock", g_tracer)
+        g_gui_access_lock = lx_trace.Traced_Lock(g_gui_access_lock, "g_gui_access_lock", g_tracer)
+        threading.current_thread().name = "PYTHON_LX_GUI_THREAD"
+
+    if(c_patch_file != None):
+        g_patch = lx_patch.load_patch_file(c_patch_file, c_max_dmx_ch, c_max_dmx_ch) #the arduino only sends c_max_dmx_ch addresses
+        print("Loaded patch " + c_patch_file)
+
+    l_firmware_fades = c_firmware_fades and c_serial_protocol == "framed"
+    if(c_firmware_fades and not l_firmware_fades):
+        print("Firmware fades need the framed serial protocol, fading on the PC instead")
+
+    #start the output process before Tk exists, so it doesn't inherit any of it
+    if(c_use_output_process):
+        g_output_process = lx_output_process.Output_Process(g_cue_list, c_max_dmx_ch, c_sec_per_frame, g_ser_port_name, c_serial_protocol, g_dmx_record_fname, l_firmware_fades, c_num_submasters,
+                                                            g_patch, c_output_universe, c_monitor_port)
+        g_output_process.start()
+
+    #set up GUI
+    root = Tk()
+    app = Application(master=root)
+    root.config(menu=app.MENU_BAR) #set the top menu bar
+    root.protocol("WM_DELETE_WINDOW", app_exit_graceful) #set custom close handle
+
+    #initialize DMX Hardware
+    g_dmx_recorder = None
+    if(g_output_process == None):
+        g_dmx_out = lx_serial_protocol.make_serial_writer(g_ser_port_name, c_serial_protocol) #owns the port, reconnects if it goes away
+        if(not g_dmx_out.connect()):
+            print("Error opening serial port to DMX TX Module, is it plugged in and unused? Will keep trying...")
+        g_dmx_out.start()
+        if(l_firmware_fades):
+            g_fade_sender = lx_firmware_fade.Firmware_Fade_Sender(g_dmx_out, c_max_dmx_ch)
+        if(g_dmx_record_fname != None):
+            g_dmx_recorder = lx_dmx_log.DMX_Recorder(g_dmx_record_fname, c_max_dmx_ch)
+        if(c_monitor_port != None):
+            g_monitor = lx_monitor.start_publisher(c_monitor_port)
+            if(g_monitor != None):
+                print("Streaming output to monitors on port " + str(g_monitor.port))
+
+    #run timed Thread
+    g_engine.transition_listener = engine_transition_started
+    g_engine.snap_to_cue(0) #standby on the first cue
+    g_kill_timed_thread = 0;
+    Timed_Thread_obj= Timed_Thread(1) #thread id 1
+    Timed_Thread_obj.start()
+
+    #run GUI
+    app.mainloop() #sit here while events happen
+    #User has exited, tear things down
 
 ########################################################################
 ### END MAIN FUNCTION
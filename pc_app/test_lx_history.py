@@ -0,0 +1,102 @@
+########################################################################
+########################################################################
+###
+### Python_LX - A simple, Python and Arduino based DMX512 lighting console
+### by Chris Gerth - Summer/Fall 2014
+###
+### File - test_lx_history.py - regression tests for lx_history.py
+### Dependencies - none
+###
+########################################################################
+########################################################################
+
+import unittest #system dependencies
+import lx_history
+
+#   python -m unittest discover -p "test_*.py"     (from pc_app, python 2 or 3)
+
+def _chunk_ids(snapshot):
+    return [id(c) for c in snapshot.chunks]
+
+class Snapshot_Tests(unittest.TestCase):
+    def setUp(self):
+        self.cues = [object() for i in range(0, 10*lx_history.c_chunk_size)]
+        self.base = lx_history.make_snapshot(self.cues)
+
+    def test_unchanged_list_shares_every_chunk(self):
+        l_snapshot = lx_history.make_snapshot(self.cues, self.base)
+        self.assertEqual(_chunk_ids(l_snapshot), _chunk_ids(self.base))
+
+    def test_replace_in_the_middle_copies_one_chunk(self):
+        l_index = 5*lx_history.c_chunk_size + 3
+        self.cues[l_index] = object()
+        l_snapshot = lx_history.make_snapshot(self.cues, self.base)
+        l_new = [c for c in _chunk_ids(l_snapshot) if c not in _chunk_ids(self.base)]
+        self.assertEqual(len(l_new), 1)
+        self.assertEqual(l_snapshot.to_list(), self.cues)
+        self.assertTrue(l_snapshot[l_index] is self.cues[l_index])
+
+    def test_insert_at_front_shares_the_back(self):
+        self.cues.insert(0, object())
+        l_snapshot = lx_history.make_snapshot(self.cues, self.base)
+        self.assertEqual(l_snapshot.to_list(), self.cues)
+        self.assertTrue(l_snapshot.chunks[-1] is self.base.chunks[-1])
+        self.assertEqual(len(l_snapshot), len(self.cues))
+
+    def test_remove_at_end(self):
+        del self.cues[-1]
+        l_snapshot = lx_history.make_snapshot(self.cues, self.base)
+        self.assertEqual(l_snapshot.to_list(), self.cues)
+        self.assertTrue(l_snapshot.chunks[0] is self.base.chunks[0])
+
+    def test_index(self):
+        self.assertTrue(self.base[-1] is self.cues[-1])
+        self.assertRaises(IndexError, lambda: self.base[len(self.cues)])
+
+class Cue_History_Tests(unittest.TestCase):
+    def test_undo_redo(self):
+        l_cues = [object() for i in range(0, 100)]
+        l_history = lx_history.Cue_History()
+        l_history.reset(l_cues, 0)
+        l_states = [list(l_cues)]
+        for i in range(0, 5):
+            l_cues[i*10] = object()
+            l_history.record(l_cues, i, "edit {}".format(i))
+            l_states.append(list(l_cues))
+        for i in reversed(range(0, 5)):
+            (l_list, l_index, l_label) = l_history.undo()
+            self.assertEqual(l_list, l_states[i])
+            self.assertEqual(l_label, "edit {}".format(i))
+        self.assertEqual(l_history.undo(), None)
+        (l_list, l_index, l_label) = l_history.redo()
+        self.assertEqual((l_list, l_index, l_label), (l_states[1], 0, "edit 0"))
+
+    def test_record_clears_redo(self):
+        l_cues = [object()]
+        l_history = lx_history.Cue_History()
+        l_history.reset(l_cues, 0)
+        l_cues.append(object())
+        l_history.record(l_cues, 1, "add")
+        l_history.undo()
+        l_history.record([object()], 0, "other")
+        self.assertFalse(l_history.can_redo())
+
+    def test_depth_limit(self):
+        l_history = lx_history.Cue_History(max_depth = 3)
+        l_history.reset([], 0)
+        for i in range(0, 10):
+            l_history.record([object()], 0, str(i))
+        self.assertEqual(len(l_history.undo_stack), 3)
+
+    def test_edits_share_memory(self):
+        l_cues = [object() for i in range(0, 500)]
+        l_history = lx_history.Cue_History()
+        l_history.reset(l_cues, 0)
+        for i in range(0, 50):
+            l_cues[i*7] = object()
+            l_history.record(l_cues, i, "edit")
+        l_stats = l_history.stats()
+        self.assertTrue(l_stats["refs"]*5 < l_stats["unshared_refs"])
+
+if __name__ == "__main__":
+    unittest.main()
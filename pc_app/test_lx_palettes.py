@@ -0,0 +1,167 @@
+########################################################################
+########################################################################
+###
+### Python_LX - A simple, Python and Arduino based DMX512 lighting console
+### by Chris Gerth - Summer/Fall 2014
+###
+### File - test_lx_palettes.py - regression tests for lx_palettes.py, and
+###                              shows written by python 3 read by python 2
+### Dependencies - none
+###
+########################################################################
+########################################################################
+
+import os, sys, ast, pickle, shutil, tempfile, subprocess, unittest #system dependencies
+import lx_palettes, lx_history, lx_show_file
+
+c_num_ch = 16
+
+def _cue(num, level=0):
+    return lx_show_file.Show_Cue(num, [level]*c_num_ch, 1.0, 1.0, "")
+
+class Palette_Tests(unittest.TestCase):
+    def setUp(self):
+        self.library = lx_palettes.Palette_Library()
+        self.library.set_palette("warm", {1: 100, 2: 50})
+        self.library.set_palette("blue", {3: 200})
+        self.cues = [self.library.attach(_cue(1), ["warm"]), _cue(2, 9), self.library.attach(_cue(3), ["warm", "blue"])]
+
+    def test_attach(self):
+        l_cue = _cue(4)
+        l_attached = self.library.attach(l_cue, ["blue", "warm"])
+        self.assertEqual(list(l_attached.DMX_VALS[0:4]), [100, 50, 200, 0])
+        self.assertEqual(l_cue.PALETTES, ()) #the cue it was given isn't touched
+        self.assertEqual(list(l_cue.DMX_VALS), [0]*c_num_ch)
+        self.assertRaises(ValueError, self.library.attach, l_cue, ["nope"])
+
+    def test_edit_replaces_dependents(self):
+        l_before = list(self.cues)
+        l_old_levels = [list(c.DMX_VALS) for c in l_before]
+        l_count = self.library.set_palette("warm", {1: 10, 2: 20}, self.cues)
+        self.assertEqual(l_count, 2)
+        self.assertFalse(self.cues[0] is l_before[0])
+        self.assertTrue(self.cues[1] is l_before[1]) #doesn't use it, left alone
+        self.assertEqual(list(self.cues[2].DMX_VALS[0:3]), [10, 20, 200])
+        self.assertEqual([list(c.DMX_VALS) for c in l_before], l_old_levels) #nothing in the old list changed
+        self.assertTrue(self.cues[2].PALETTES[0] is self.library.get("warm"))
+        self.assertFalse(lx_palettes.is_stale(self.cues[2]))
+
+    def test_fewer_channels_hand_back_the_recorded_levels(self):
+        self.cues[2] = self.library.attach(lx_show_file.Show_Cue(3, [5]*c_num_ch, 1.0, 1.0, ""), ["warm", "blue"])
+        self.library.set_palette("warm", {1: 10}, self.cues)
+        self.assertEqual(list(self.cues[2].DMX_VALS[0:4]), [10, 5, 200, 5])
+        self.assertEqual(list(self.cues[0].DMX_VALS[0:2]), [10, 0])
+        self.assertEqual(list(self.cues[2].BASE_VALS), [5]*c_num_ch)
+
+    def test_overwritten_dependent_is_left_alone(self):
+        l_replacement = _cue(1, 3)
+        self.cues[0] = l_replacement #Record Cue over cue 1, no palettes this time
+        self.assertEqual(self.library.set_palette("warm", {1: 10}, self.cues), 1)
+        self.assertTrue(self.cues[0] is l_replacement)
+        self.assertEqual(sorted(self.library.dependents["warm"].keys()), [3])
+
+    def test_undo_redo_across_palette_edits(self):
+        l_history = lx_history.Cue_History()
+        l_history.reset(self.cues, 0)
+        self.library.set_palette("warm", {1: 10, 2: 20}, self.cues)
+        l_history.record(self.cues, 0, "Record Palette warm")
+        self.cues.append(self.library.attach(_cue(4), ["warm"]))
+        l_history.record(self.cues, 3, "Record Cue 4")
+
+        (l_list, l_index, l_label) = l_history.undo()
+        self.assertEqual(self.library.index_cue_list(l_list), 0)
+        self.assertEqual(len(l_list), 3)
+        (l_list, l_index, l_label) = l_history.undo()
+        self.assertEqual(l_label, "Record Palette warm")
+        self.assertEqual(self.library.index_cue_list(l_list), 0)
+        self.assertEqual(self.library.get("warm").levels(), {1: 100, 2: 50}) #the palette came back with its cues
+        self.assertEqual(list(l_list[2].DMX_VALS[0:3]), [100, 50, 200])
+        (l_list, l_index, l_label) = l_history.redo()
+        self.library.index_cue_list(l_list)
+        self.assertEqual(self.library.get("warm").levels(), {1: 10, 2: 20})
+        self.assertEqual(list(l_list[0].DMX_VALS[0:2]), [10, 20])
+
+    def test_index_re_resolves_cues_from_elsewhere(self):
+        l_other = lx_palettes.Palette_Library()
+        l_other.set_palette("warm", {1: 1})
+        l_stray = l_other.attach(_cue(5), ["warm"])
+        l_list = self.cues + [l_stray]
+        self.assertEqual(self.library.index_cue_list(l_list), 1) #first "warm" in the list wins
+        self.assertEqual(list(l_list[3].DMX_VALS[0:2]), [100, 50])
+        self.assertEqual(list(l_stray.DMX_VALS[0:2]), [1, 0])
+
+    def test_pickle(self):
+        l_loaded = pickle.loads(pickle.dumps(self.cues, 2))
+        self.assertTrue(l_loaded[0].PALETTES[0] is l_loaded[2].PALETTES[0])
+        self.assertEqual(l_loaded[2].PALETTES[1].levels(), {3: 200})
+
+#the interpreter for python major, or None. PYTHON2 / PYTHON3 override the search.
+def _find_python(major):
+    if(sys.version_info[0] == major):
+        return sys.executable
+    l_exe = os.environ.get("PYTHON{}".format(major))
+    if(l_exe == None):
+        try:
+            from shutil import which
+        except ImportError:
+            from distutils.spawn import find_executable as which
+        l_exe = which("python{}".format(major))
+    if(l_exe == None or subprocess.call([l_exe, "-c", "import sys; sys.exit(sys.version_info[0] != {})".format(major)],
+                                        stdout = subprocess.PIPE, stderr = subprocess.PIPE) != 0):
+        return None
+    return l_exe
+
+#what python_lx does to open a show, under python 2
+c_python_lx_reader = """
+import sys, cPickle
+class Cue:
+    DELAY_TIME = 0.0
+    FOLLOW_TIME = None
+    PALETTES = ()
+    PALETTE_VERSIONS = ()
+    BASE_VALS = None
+    def __init__(self, i_cue_num, i_dmx_vals,i_up_time, i_down_time, i_desc_str, i_delay_time=0.0, i_follow_time=None):
+        self.CUE_NUM = i_cue_num
+        self.DMX_VALS = map(int,map(round,i_dmx_vals))
+        (self.UP_TIME, self.DOWN_TIME, self.DESCRIPTION, self.DELAY_TIME) = (i_up_time, i_down_time, i_desc_str, i_delay_time)
+        if(i_follow_time != None):
+            self.FOLLOW_TIME = i_follow_time
+l_cue_list = cPickle.load(open(sys.argv[1], "rb"))
+print(repr([(c.__class__.__name__, c.CUE_NUM, [int(v) for v in c.DMX_VALS], [p.name for p in c.PALETTES]) for c in l_cue_list]))
+"""
+
+class Python_3_Show_Tests(unittest.TestCase):
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.dir)
+
+    def test_python_3_convert_loads_in_python_2(self):
+        l_python3 = _find_python(3)
+        l_python2 = _find_python(2)
+        if(l_python3 == None or l_python2 == None):
+            self.skipTest("needs both python 2 and python 3 (set PYTHON2 / PYTHON3)")
+        l_library = lx_palettes.Palette_Library()
+        l_library.set_palette("warm", {1: 100, 2: 50})
+        l_cues = []
+        for i in range(0, 40):
+            l_cue = _cue(i + 1, i)
+            if(i % 3 == 0):
+                l_cue = l_library.attach(l_cue, ["warm"])
+            l_cues.append(l_cue)
+        l_source = os.path.join(self.dir, "show.plx")
+        l_file = open(l_source, "wb")
+        pickle.dump(l_cues, l_file, 2)
+        l_file.close()
+        l_here = os.path.dirname(os.path.abspath(__file__))
+        l_out_dir = os.path.join(self.dir, "out")
+        subprocess.check_call([l_python3, os.path.join(l_here, "lx_show_tool.py"), "convert", "--tracked", "-j", "1",
+                               "--out-dir", l_out_dir, l_source], stdout = subprocess.PIPE)
+        l_output = subprocess.check_output([l_python2, "-c", c_python_lx_reader, os.path.join(l_out_dir, "show.plx")], cwd = l_here)
+        l_loaded = ast.literal_eval(l_output.decode("ascii").strip())
+        l_expected = [("Cue", c.CUE_NUM, list(c.DMX_VALS), [p.name for p in c.PALETTES]) for c in l_cues]
+        self.assertEqual(l_loaded, l_expected)
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,87 @@
+########################################################################
+########################################################################
+###
+### Python_LX - A simple, Python and Arduino based DMX512 lighting console
+### by Chris Gerth - Summer/Fall 2014
+###
+### File - test_lx_tracking.py - regression tests for lx_tracking.py
+### Dependencies - none
+###
+########################################################################
+########################################################################
+
+import random, pickle, unittest #system dependencies
+import lx_tracking, lx_show_file
+
+def _make_show(num_cues, num_ch, seed=0):
+    l_rand = random.Random(seed)
+    l_levels = [0]*num_ch
+    l_cue_list = []
+    for i in range(0, num_cues):
+        for j in range(0, 3):
+            l_levels[l_rand.randrange(0, num_ch)] = l_rand.randint(0, 255)
+        l_cue_list.append(lx_show_file.Show_Cue(i+1, l_levels, 1.0, 1.0, ""))
+    return l_cue_list
+
+class Tracked_Levels_Tests(unittest.TestCase):
+    def setUp(self):
+        lx_tracking.clear_cache()
+        self.cues = _make_show(40, 64)
+        self.plain = [list(c.DMX_VALS) for c in self.cues]
+        lx_tracking.track_cue_list(self.cues, checkpoint_interval = 8)
+
+    def test_levels_survive_tracking(self):
+        lx_tracking.clear_cache()
+        for (l_cue, l_plain) in zip(self.cues, self.plain):
+            self.assertEqual(l_cue.DMX_VALS.full(), l_plain)
+        for (l_cue, l_plain) in reversed(list(zip(self.cues, self.plain))): #rebuilt from the far end, cache cold
+            self.assertEqual(list(l_cue.DMX_VALS), l_plain)
+
+    def test_checkpoints(self):
+        l_depths = [c.DMX_VALS.depth for c in self.cues]
+        self.assertTrue(self.cues[0].DMX_VALS.is_checkpoint())
+        self.assertTrue(max(l_depths) < 8)
+        self.assertEqual(sum(1 for c in self.cues if c.DMX_VALS.is_checkpoint()), 5)
+        for l_cue in self.cues[1:]:
+            if(not l_cue.DMX_VALS.is_checkpoint()):
+                self.assertTrue(len(l_cue.DMX_VALS.values) <= 3)
+
+    def test_big_change_is_a_checkpoint(self):
+        l_levels = lx_tracking.Tracked_Levels([255]*64, self.cues[-1].DMX_VALS)
+        self.assertTrue(l_levels.is_checkpoint())
+
+    def test_cache_checks_identity(self):
+        #an id can be reused once its levels are gone - the cache must not hand back the old entry
+        l_levels = self.cues[20].DMX_VALS
+        lx_tracking.clear_cache()
+        lx_tracking._g_cache[id(l_levels)] = (object(), [0]*64)
+        self.assertEqual(l_levels.full(), self.plain[20])
+
+    def test_cache_size(self):
+        for l_cue in self.cues:
+            l_cue.DMX_VALS.full()
+        self.assertTrue(len(lx_tracking._g_cache) <= lx_tracking.c_cache_size)
+
+    def test_overwritten_cue(self):
+        l_old = self.cues[10].DMX_VALS
+        self.cues[10] = lx_show_file.Show_Cue(11, [7]*64, 1.0, 1.0, "")
+        lx_tracking.track_cue_list(self.cues, checkpoint_interval = 8)
+        self.assertEqual(self.cues[10].DMX_VALS.full(), [7]*64)
+        self.assertTrue(self.cues[11].DMX_VALS.base is l_old) #still the levels it was recorded against
+        self.assertEqual(self.cues[11].DMX_VALS.full(), self.plain[11])
+        lx_tracking.track_cue_list(self.cues, checkpoint_interval = 8, rebuild = True)
+        self.assertFalse(self.cues[11].DMX_VALS.base is l_old)
+        self.assertEqual([c.DMX_VALS.full() for c in self.cues[11:]], self.plain[11:])
+
+    def test_untrack(self):
+        lx_tracking.untrack_cue_list(self.cues)
+        self.assertEqual([c.DMX_VALS for c in self.cues], self.plain)
+
+    def test_pickle_keeps_references(self):
+        l_loaded = pickle.loads(pickle.dumps([c.DMX_VALS for c in self.cues], 2))
+        lx_tracking.clear_cache()
+        self.assertEqual([l.full() for l in l_loaded], self.plain)
+        self.assertTrue(l_loaded[1].base is l_loaded[0])
+
+if __name__ == "__main__":
+    unittest.main()